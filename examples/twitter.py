@@ -60,6 +60,9 @@ class User(RemoteObject):
 
     """
 
+    # Timelines embed the same users in many statuses, so share them.
+    identity_key = 'id'
+
     id = fields.Field()
     name = fields.Field()
     screen_name = fields.Field()
@@ -0,0 +1,353 @@
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+A registry of codecs that encode and decode HTTP message bodies, keyed by
+media type.
+
+`HttpObject` classes list the media types they accept, in order of
+preference, in their `content_types` attribute. Responses are decoded with
+the codec registered for the response's media type, and request bodies are
+encoded with the codec for the first registered type the class accepts.
+
+Codecs for JSON (``application/json``), newline-delimited JSON
+(``application/x-ndjson``) and MessagePack (``application/msgpack``) are
+registered by default. The MessagePack codec is implemented in pure Python,
+but uses the `msgpack` module instead when it's installed.
+
+"""
+
+import struct
+
+import simplejson as json
+
+from remoteobjects.json import ForgivingDecoder, loads_lines, dumps_lines
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec(object):
+
+    """An encoder and decoder of message bodies of one media type."""
+
+    def loads(self, content):
+        """Returns the data decoded from the message body `content`."""
+        raise NotImplementedError
+
+    def dumps(self, data, default=None):
+        """Returns `data` encoded as a message body.
+
+        Optional parameter `default` is a function that returns an
+        encodable version of any object the codec can't otherwise encode.
+
+        """
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+
+    """A codec for JSON message bodies."""
+
+    def loads(self, content):
+        try:
+            return json.loads(content)
+        except UnicodeDecodeError:
+            return json.loads(content, cls=ForgivingDecoder)
+
+    def dumps(self, data, default=None):
+        return json.dumps(data, default=default)
+
+
+class NDJSONCodec(Codec):
+
+    """A codec for newline-delimited JSON message bodies, which hold a list
+    of values, one per line."""
+
+    def loads(self, content):
+        return list(loads_lines(content.splitlines()))
+
+    def dumps(self, data, default=None):
+        return dumps_lines(data, default=default)
+
+
+def packb(data, default=None):
+    """Encodes `data` as MessagePack.
+
+    Unicode strings are encoded as MessagePack strings, as are byte strings
+    (which are assumed to be text). Optional parameter `default` is a
+    function that returns an encodable version of any other object.
+
+    """
+    out = []
+    _pack(data, out.append, default)
+    return ''.join(out)
+
+
+def _pack_header(write, size, fix, fixmax, codes):
+    if size < fixmax:
+        write(chr(fix | size))
+    elif codes[0] is not None and size <= 0xff:
+        write(struct.pack('>BB', codes[0], size))
+    elif size <= 0xffff:
+        write(struct.pack('>BH', codes[1], size))
+    elif size <= 0xffffffff:
+        write(struct.pack('>BI', codes[2], size))
+    else:
+        raise ValueError('Value of length %d is too long to encode' % size)
+
+
+def _pack(obj, write, default):
+    if obj is None:
+        write('\xc0')
+    elif obj is True:
+        write('\xc3')
+    elif obj is False:
+        write('\xc2')
+    elif isinstance(obj, (int, long)):
+        if 0 <= obj < 0x80:
+            write(chr(obj))
+        elif -0x20 <= obj < 0:
+            write(struct.pack('>b', obj))
+        elif obj > 0:
+            if obj <= 0xff:
+                write(struct.pack('>BB', 0xcc, obj))
+            elif obj <= 0xffff:
+                write(struct.pack('>BH', 0xcd, obj))
+            elif obj <= 0xffffffff:
+                write(struct.pack('>BI', 0xce, obj))
+            elif obj <= 0xffffffffffffffff:
+                write(struct.pack('>BQ', 0xcf, obj))
+            else:
+                raise OverflowError('Integer %d is too large to encode' % obj)
+        elif obj >= -0x80:
+            write(struct.pack('>Bb', 0xd0, obj))
+        elif obj >= -0x8000:
+            write(struct.pack('>Bh', 0xd1, obj))
+        elif obj >= -0x80000000:
+            write(struct.pack('>Bi', 0xd2, obj))
+        elif obj >= -0x8000000000000000:
+            write(struct.pack('>Bq', 0xd3, obj))
+        else:
+            raise OverflowError('Integer %d is too small to encode' % obj)
+    elif isinstance(obj, float):
+        write(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, basestring):
+        if isinstance(obj, unicode):
+            obj = obj.encode('utf-8')
+        _pack_header(write, len(obj), 0xa0, 32, (0xd9, 0xda, 0xdb))
+        write(obj)
+    elif isinstance(obj, bytearray):
+        _pack_header(write, len(obj), 0, 0, (0xc4, 0xc5, 0xc6))
+        write(str(obj))
+    elif isinstance(obj, (list, tuple)):
+        _pack_header(write, len(obj), 0x90, 16, (None, 0xdc, 0xdd))
+        for item in obj:
+            _pack(item, write, default)
+    elif isinstance(obj, dict):
+        _pack_header(write, len(obj), 0x80, 16, (None, 0xde, 0xdf))
+        for key, value in obj.iteritems():
+            _pack(key, write, default)
+            _pack(value, write, default)
+    elif default is not None:
+        _pack(default(obj), write, None)
+    else:
+        raise TypeError('%r is not MessagePack serializable' % (obj,))
+
+
+# The struct formats and sizes of the MessagePack scalar types.
+_SCALARS = {
+    0xca: ('>f', 4),
+    0xcb: ('>d', 8),
+    0xcc: ('>B', 1),
+    0xcd: ('>H', 2),
+    0xce: ('>I', 4),
+    0xcf: ('>Q', 8),
+    0xd0: ('>b', 1),
+    0xd1: ('>h', 2),
+    0xd2: ('>i', 4),
+    0xd3: ('>q', 8),
+}
+
+# The struct formats of the sizes of MessagePack strings, binary values,
+# arrays and maps.
+_STRINGS = {0xd9: '>B', 0xda: '>H', 0xdb: '>I'}
+_BINARIES = {0xc4: '>B', 0xc5: '>H', 0xc6: '>I'}
+_ARRAYS = {0xdc: '>H', 0xdd: '>I'}
+_MAPS = {0xde: '>H', 0xdf: '>I'}
+_CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+
+def unpackb(content):
+    """Decodes MessagePack `content`.
+
+    MessagePack strings are decoded into unicode strings, and binary values
+    into byte strings. Raises `ValueError` if `content` is not a single
+    valid MessagePack value.
+
+    """
+    try:
+        value, pos = _unpack(content, 0)
+    except (IndexError, struct.error):
+        raise ValueError('MessagePack data ends before its value does')
+    if pos != len(content):
+        raise ValueError('Extra data at %d' % pos)
+    return value
+
+
+def _size(s, pos, fmt):
+    end = pos + struct.calcsize(fmt)
+    return struct.unpack(fmt, s[pos:end])[0], end
+
+
+def _unpack(s, pos):
+    code = ord(s[pos])
+    pos += 1
+
+    if code <= 0x7f:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+
+    if code <= 0x8f:
+        size = code & 0x0f
+    elif code in _MAPS:
+        size, pos = _size(s, pos, _MAPS[code])
+    else:
+        size = None
+    if size is not None:
+        value = {}
+        for i in xrange(size):
+            key, pos = _unpack(s, pos)
+            value[key], pos = _unpack(s, pos)
+        return value, pos
+
+    if code <= 0x9f:
+        size = code & 0x0f
+    elif code in _ARRAYS:
+        size, pos = _size(s, pos, _ARRAYS[code])
+    if size is not None:
+        value = []
+        for i in xrange(size):
+            item, pos = _unpack(s, pos)
+            value.append(item)
+        return value, pos
+
+    if code <= 0xbf:
+        size = code & 0x1f
+    elif code in _STRINGS:
+        size, pos = _size(s, pos, _STRINGS[code])
+    if size is not None:
+        end = pos + size
+        if end > len(s):
+            raise IndexError(end)
+        return s[pos:end].decode('utf-8', 'replace'), end
+
+    if code in _BINARIES:
+        size, pos = _size(s, pos, _BINARIES[code])
+        end = pos + size
+        if end > len(s):
+            raise IndexError(end)
+        return s[pos:end], end
+
+    if code in _CONSTANTS:
+        return _CONSTANTS[code], pos
+
+    try:
+        fmt, size = _SCALARS[code]
+    except KeyError:
+        raise ValueError('Unsupported MessagePack type 0x%02x at %d'
+            % (code, pos - 1))
+    return struct.unpack(fmt, s[pos:pos + size])[0], pos + size
+
+
+class MessagePackCodec(Codec):
+
+    """A codec for MessagePack message bodies.
+
+    If the `msgpack` module is available, it's used to encode and decode
+    values. Otherwise the slower `packb()` and `unpackb()` functions of this
+    module are used.
+
+    """
+
+    def loads(self, content):
+        if msgpack is None:
+            return unpackb(content)
+        try:
+            return msgpack.unpackb(content, raw=False)
+        except TypeError:
+            # Older msgpack versions have no raw parameter.
+            return msgpack.unpackb(content, encoding='utf-8')
+
+    def dumps(self, data, default=None):
+        if msgpack is None:
+            return packb(data, default=default)
+        try:
+            # Pack byte strings as strings, as packb() does, rather than as
+            # binary data as msgpack 1.0 does by default.
+            return msgpack.packb(data, default=default, use_bin_type=False)
+        except TypeError:
+            # Older msgpack versions have no use_bin_type parameter, and
+            # always pack byte strings as strings.
+            return msgpack.packb(data, default=default)
+
+
+codecs = {}
+
+
+def register(codec, *media_types):
+    """Registers the `Codec` instance `codec` as the codec for the given
+    media types."""
+    for media_type in media_types:
+        codecs[media_type] = codec
+
+
+def lookup(media_type):
+    """Returns the codec registered for `media_type`.
+
+    Media type parameters (such as ``charset``) are ignored. Raises
+    `LookupError` if no codec is registered for the media type.
+
+    """
+    media_type = media_type.split(';', 1)[0].strip().lower()
+    try:
+        return codecs[media_type]
+    except KeyError:
+        raise LookupError('No codec is registered for media type %r'
+            % (media_type,))
+
+
+JSON = JSONCodec()
+register(JSON, 'application/json', 'text/javascript')
+register(NDJSONCodec(), 'application/x-ndjson')
+register(MessagePackCodec(), 'application/msgpack', 'application/x-msgpack')
@@ -0,0 +1,321 @@
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+Column-oriented storage of lists of `DataObject` instances.
+
+A `ColumnStore` keeps the decoded values of a list of objects' fields in one
+sequence per field instead of one object per item. Integer and float
+values are kept in `array.array` columns, and strings in lists of interned
+strings. Items are read through lightweight `RowView` instances, made only
+when they're used, and a `ColumnStore` can be filtered and projected
+without making any.
+
+When NumPy is installed, a `ColumnStore` can also be exported as a NumPy
+structured array with `ColumnStore.to_numpy()`. NumPy is optional; without
+it, `ColumnStore.to_records()` returns a plain list of tuples instead.
+
+"""
+
+from array import array
+import collections
+from copy import copy
+from itertools import compress
+
+import remoteobjects.fields
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def default_value(field):
+    """Returns a new default value of `field` for an item that has no data
+    for it.
+
+    Callable defaults are called, with `None` in place of the instance the
+    value is for, and mutable defaults (such as the empty lists of `List`
+    fields) are copied, so that items don't share one default value.
+
+    """
+    default = field.default
+    if callable(default):
+        return default(None)
+    if isinstance(default, (list, dict, set)):
+        return copy(default)
+    return default
+
+
+def make_column(field, values):
+    """Returns a column holding the decoded values in the list `values` of
+    the field `field`.
+
+    Values of plain `Field` fields are kept in an integer or float `array`
+    if they're all integers or all floats, or in a list of interned strings
+    if they're all strings. Other values are kept in a plain list.
+
+    """
+    plain = field.decode.im_func is remoteobjects.fields.Field.decode.im_func
+    if not plain or not values:
+        return values
+
+    types = set(type(v) for v in values)
+    if types <= set((int, long)):
+        try:
+            return array('l', values)
+        except OverflowError:
+            return values
+    if types == set((float,)):
+        return array('d', values)
+    if types <= set((str, unicode)):
+        intern = remoteobjects.fields.intern_string
+        return [intern(v) for v in values]
+    return values
+
+
+def column_array(field, column):
+    """Returns a NumPy array of the decoded values in `column` of the field
+    `field`.
+
+    Integer and float `array` columns keep their native dtypes, and are read
+    from the array's buffer without converting each value. `Datetime` values
+    become ``datetime64[s]`` values, with missing values as ``NaT``. Columns
+    of strings become fixed-width unicode arrays. Any other column, or a
+    column with missing values, becomes an ``object`` array.
+
+    """
+    if numpy is None:
+        raise ImportError('NumPy is required to export columns as arrays')
+
+    if isinstance(column, array):
+        return numpy.frombuffer(column, dtype=column.typecode).copy()
+    if isinstance(field, remoteobjects.fields.Datetime):
+        return numpy.array(column, dtype='datetime64[s]')
+    if column and all(isinstance(v, basestring) for v in column):
+        return numpy.array([unicode(v) for v in column], dtype=unicode)
+
+    values = numpy.empty(len(column), dtype=object)
+    values[:] = column
+    return values
+
+
+class RowView(object):
+
+    """One item of a `ColumnStore`, whose attributes are read from the
+    store's columns."""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            column = self._store.columns[name]
+        except KeyError:
+            raise AttributeError('%r row has no field %r'
+                % (self._store.entryclass.__name__, name))
+        return column[self._index]
+
+    def __eq__(self, other):
+        if not isinstance(other, RowView):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s row %d>' % (self._store.entryclass.__name__, self._index)
+
+    def to_dict(self):
+        """Returns a dictionary of the row's field names to its decoded
+        values."""
+        index = self._index
+        return dict((name, column[index])
+            for name, column in self._store.columns.iteritems())
+
+    def to_object(self):
+        """Returns a new instance of the store's `DataObject` class with the
+        row's values."""
+        return self._store.entryclass(**self.to_dict())
+
+
+class ColumnStore(collections.Sequence):
+
+    """A sequence of `RowView` items of a `DataObject` class, stored as one
+    column of decoded values per field."""
+
+    def __init__(self, entryclass, columns, length):
+        """Sets the store's content.
+
+        Parameter `entryclass` is the `DataObject` class of the items.
+        Parameter `columns` is a dictionary of field names to the columns of
+        their values, each of length `length`.
+
+        """
+        self.entryclass = entryclass
+        self.columns = columns
+        self._length = length
+
+    @classmethod
+    def from_dicts(cls, entryclass, data, names=None):
+        """Decodes the list of dictionaries `data` into a new `ColumnStore`
+        of the `DataObject` class `entryclass`.
+
+        If optional parameter `names` is given, only the fields with those
+        names are decoded.
+
+        """
+        if names is None:
+            names = entryclass.fields.keys()
+        columns = {}
+        for name in names:
+            field = entryclass.fields[name]
+            key, decode = field.api_name, field.decode
+            values = [decode(item[key]) if key in item
+                else default_value(field) for item in data]
+            columns[name] = make_column(field, values)
+        return cls(entryclass, columns, len(data))
+
+    def to_dicts(self):
+        """Encodes the store's items into a list of dictionaries, as for
+        `DataObject.to_dict()`."""
+        fields = self.entryclass.fields
+        encoders = [(fields[name].api_name, fields[name].encode, column)
+            for name, column in self.columns.iteritems()]
+        result = []
+        for index in xrange(self._length):
+            item = {}
+            for key, encode, column in encoders:
+                value = column[index]
+                if value is not None:
+                    item[key] = encode(value)
+            result.append(item)
+        return result
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(xrange(*key.indices(self._length)))
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('ColumnStore index out of range')
+        return RowView(self, key)
+
+    def __iter__(self):
+        for index in xrange(self._length):
+            yield RowView(self, index)
+
+    def __repr__(self):
+        return '<ColumnStore of %d %s rows>' % (self._length,
+            self.entryclass.__name__)
+
+    def column(self, name):
+        """Returns the column of values of the field `name`."""
+        return self.columns[name]
+
+    def take(self, indexes):
+        """Returns a new `ColumnStore` of the items at the given indexes."""
+        indexes = list(indexes)
+        columns = {}
+        for name, column in self.columns.iteritems():
+            values = [column[i] for i in indexes]
+            if isinstance(column, array):
+                values = array(column.typecode, values)
+            columns[name] = values
+        return type(self)(self.entryclass, columns, len(indexes))
+
+    def select(self, *names):
+        """Returns a new `ColumnStore` of only the named fields' columns.
+
+        The columns are shared with this store, not copied.
+
+        """
+        columns = dict((name, self.columns[name]) for name in names)
+        return type(self)(self.entryclass, columns, self._length)
+
+    def filter(self, **criteria):
+        """Returns a new `ColumnStore` of the items that match all the given
+        criteria.
+
+        Each keyword parameter names a field. Its value is either a value to
+        compare the field's values to, or a function that is given each of
+        the field's values and returns whether the item matches.
+
+        """
+        mask = [True] * self._length
+        for name, criterion in criteria.iteritems():
+            column = self.columns[name]
+            if callable(criterion):
+                matches = [criterion(v) for v in column]
+            else:
+                matches = [v == criterion for v in column]
+            mask = [a and b for a, b in zip(mask, matches)]
+        return self.take(compress(xrange(self._length), mask))
+
+    def to_numpy(self):
+        """Returns the store's items as a NumPy structured array, with one
+        named member per column.
+
+        The dtype of each member is chosen from the column's field and
+        values, as for `column_array()`. NumPy must be installed.
+
+        """
+        names = sorted(self.columns.keys())
+        fields = self.entryclass.fields
+        arrays = [column_array(fields[name], self.columns[name])
+            for name in names]
+        dtype = [(str(name), values.dtype)
+            for name, values in zip(names, arrays)]
+
+        result = numpy.empty(self._length, dtype=dtype)
+        for name, values in zip(names, arrays):
+            result[str(name)] = values
+        return result
+
+    def to_records(self):
+        """Returns the store's items as records.
+
+        If NumPy is installed, the records are a NumPy record array, as for
+        `to_numpy()`, whose members can also be read as attributes.
+        Otherwise, the records are a list of tuples of the items' values,
+        with the fields in the order of their names.
+
+        """
+        if numpy is not None:
+            return self.to_numpy().view(numpy.recarray)
+        columns = [self.columns[name] for name in sorted(self.columns.keys())]
+        return zip(*columns) if columns else [()] * self._length
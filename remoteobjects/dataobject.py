@@ -40,26 +40,420 @@ declared on `DataObject` subclasses. `Field` classes reside in the
 """
 
 
-from copy import deepcopy
+import collections
+from copy import copy, deepcopy
 import logging
+import threading
+import weakref
 
 import remoteobjects.fields
+import remoteobjects.json
 
 
-classes_by_name = {}
+# These registries hold their classes weakly, so classes made at run time
+# can be collected when nothing else uses them.
+classes_by_name = weakref.WeakValueDictionary()
 classes_by_constant_field = {}
 
+# Guards making the locks of instances of `thread_safe` classes.
+_lock_creation = threading.Lock()
+
+# Counts the DataObject classes declared, so what's known about the classes
+# reachable through a class's fields is recomputed when there are new ones.
+_classes_declared = 0
+
+
+class ProjectionError(AttributeError):
+    """An AttributeError raised when reading a field that was left out of a
+    `DataObject` instance's projection."""
+    pass
+
+
+class FrozenError(AttributeError):
+    """An AttributeError raised when changing a frozen `DataObject`
+    instance."""
+    pass
+
+
+def parse_projection(only):
+    """Converts a sequence of field paths into a projection.
+
+    Parameter `only` is a sequence of field attribute names. Names of fields
+    of nested objects can be given as paths through their parent fields,
+    such as ``author.name``. The resulting projection is a dictionary of
+    each named field to either `None`, to keep the whole field, or a further
+    projection of the field's nested objects.
+
+    If `only` is already a projection dictionary, it is returned as is.
+
+    """
+    if isinstance(only, dict):
+        return only
+    if isinstance(only, basestring):
+        raise TypeError('Projection %r should be a sequence of field names, '
+            'not a string' % (only,))
+
+    projection = {}
+    for path in only:
+        node = projection
+        names = path.split('.')
+        for name in names[:-1]:
+            sub = node.get(name, {})
+            if sub is None:
+                # The whole field is kept already.
+                break
+            node[name] = sub
+            node = sub
+        else:
+            node[names[-1]] = None
+    return projection
+
+
+def constant_key(value):
+    """Returns the key by which classes are indexed for the `Constant` field
+    value `value`.
+
+    Sequences are indexed as tuples, so lists (such as decoded from JSON)
+    find the classes of equal list or tuple constants.
+
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
 
 def find_by_name(name):
     """Finds and returns the DataObject subclass with the given name.
 
     Parameter `name` should be a bare class name with no module. If there is
-    no class by that name, raises `KeyError`.
+    no class by that name, raises `KeyError`. Classes are found only while
+    something else refers to them, such as the module that declares them.
 
     """
     return classes_by_name[name]
 
 
+_missing = object()
+
+
+class References(object):
+
+    """An index of the objects decoded from one response, through which
+    `Object` fields share instances of the same object.
+
+    A `DataObject` class that sets `included_key` builds one `References`
+    index from the list of objects at that key each time it's updated from
+    a dictionary. Other objects whose fields decode objects of classes with
+    an `identity_key` or `included_key` get an index the first time one of
+    those fields is decoded. The index is shared by the objects decoded
+    from that dictionary that have fields to look up in it; other objects
+    don't keep it. Indexes aren't pickled or copied with the objects.
+
+    `Object` fields resolve references by id against the included objects.
+    Each included object is decoded at most once, the first time it's
+    referenced, so every reference to the same id yields the same instance.
+    Embedded objects of classes with an `identity_key` are likewise decoded
+    once per identity.
+
+    A `References` index can also be used as a context manager, to share
+    identity-keyed objects among everything decoded in the ``with`` block,
+    as across the pages of a session:
+
+    >>> with References() as session:
+    ...     first = Timeline.get(url)
+    ...     first.deliver()
+    ...     second = first.next_page()
+    ...     second.deliver()
+
+    """
+
+    def __init__(self, included=None, id_key='id', reference_key='$ref',
+                 parent=None):
+        """Indexes the list of included object dictionaries `included` by
+        their `id_key` values.
+
+        Optional parameter `reference_key` is the key of the id in reference
+        dictionaries. If optional parameter `parent` is another `References`
+        index, identity-keyed objects are shared with it.
+
+        """
+        self.id_key = id_key
+        self.reference_key = reference_key
+        self.included = included is not None
+        self.data = {}
+        self.objects = {}
+        self.ids = {}
+        if parent is not None:
+            self.identities = parent.identities
+        else:
+            self.identities = {}
+        for item in included or ():
+            if isinstance(item, collections.Mapping) and id_key in item:
+                self.data[item[id_key]] = item
+
+    def reference_id(self, value):
+        """Returns the id referenced by the dictionary value `value`, or
+        `None` if `value` is not a reference."""
+        if isinstance(value, collections.Mapping):
+            return value.get(self.reference_key)
+        return None
+
+    def resolve(self, ident, fld):
+        """Returns the shared instance of the included object with id
+        `ident`, decoded as for the `Object` field `fld`.
+
+        References to ids that aren't included decode to `None`.
+
+        """
+        try:
+            return self.objects[ident]
+        except KeyError:
+            pass
+        try:
+            data = self.data[ident]
+        except (KeyError, TypeError):
+            logging.getLogger(__name__).warning(
+                'Reference to id %r which is not included in the response',
+                ident)
+            return None
+        obj = fld.cls_for(data).from_dict(data)
+        obj._reference = (self.reference_key, ident)
+        self.objects[ident] = obj
+        self.ids[id(obj)] = ident
+        return obj
+
+    def identify(self, cls, value):
+        """Returns the shared instance of the `DataObject` class `cls`
+        decoded from the dictionary value `value`, as identified by the
+        class's `identity_key`.
+
+        The first value with a given identity is decoded, and later values
+        with the same identity yield the same instance.
+
+        """
+        try:
+            key = (cls, value[cls.identity_key])
+            return self.identities[key]
+        except KeyError:
+            if cls.identity_key not in value:
+                return cls.from_dict(value)
+        except TypeError:
+            # Unhashable identity, so the value can't be shared.
+            return cls.from_dict(value)
+        obj = cls.from_dict(value)
+        self.identities[key] = obj
+        return obj
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # Object ids aren't kept across pickling, so index them again.
+        del state['ids']
+        state.pop('_outer', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ids = dict((id(obj), ident)
+            for ident, obj in self.objects.iteritems())
+
+    def __enter__(self):
+        self._outer = remoteobjects.fields.current_references()
+        remoteobjects.fields._decoding.references = self
+        return self
+
+    def __exit__(self, *exc_info):
+        remoteobjects.fields._decoding.references = self._outer
+
+    def id_of(self, obj):
+        """Returns the id of the included object `obj`, or `None` if `obj`
+        was not decoded from this index."""
+        return self.ids.get(id(obj))
+
+
+def _restore_compact(cls, data, state):
+    """Makes a `DataObject` instance of the class `cls` from its compact
+    pickled state, as made by `DataObject.__reduce_ex__()`."""
+    obj = cls()
+    # Use the basic update, even for classes that wrap their data.
+    DataObject.update_from_dict(obj, data)
+    obj.__setstate__(state)
+    return obj
+
+
+def _restore_frozen(cls, data, state):
+    """Makes a frozen `DataObject` instance of the class `cls` from the
+    compact pickled state of a frozen instance."""
+    return _restore_compact(cls, data, state).freeze()
+
+
+class FrozenDict(dict):
+
+    """A read-only dictionary, holding the decoded values of a `Dict` field
+    of a frozen `DataObject`."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('%s object is read-only' % (type(self).__name__,))
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __hash__(self):
+        return hash(frozenset(self.iteritems()))
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __deepcopy__(self, memo):
+        # Copies are made to be changed, so they're plain dictionaries.
+        return deepcopy(dict(self), memo)
+
+
+class FrozenList(list):
+
+    """A read-only list, holding a list from the API data of a frozen
+    `DataObject`."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('%s object is read-only' % (type(self).__name__,))
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _readonly
+    __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = reverse = sort = _readonly
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def __deepcopy__(self, memo):
+        return deepcopy(list(self), memo)
+
+
+def _freeze_value(value, memo):
+    """Returns a read-only version of the decoded field value `value`, as
+    for `DataObject.freeze()`."""
+    if isinstance(value, DataObject):
+        return value._freeze(memo)
+    if isinstance(value, (list, tuple, remoteobjects.fields.LazyList)):
+        return tuple([_freeze_value(v, memo) for v in value])
+    if isinstance(value, (dict, remoteobjects.fields.LazyDict)):
+        return FrozenDict((k, _freeze_value(v, memo))
+            for k, v in value.iteritems())
+    return value
+
+
+def _freeze_data(value):
+    """Returns a read-only copy of the API data value `value`, as for
+    `DataObject.freeze()`."""
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze_data(v)) for k, v in value.iteritems())
+    if isinstance(value, list):
+        return FrozenList(_freeze_data(v) for v in value)
+    return value
+
+
+class Snapshot(object):
+    """A snapshot of a `DataObject` instance's fields, as taken with
+    `DataObject.snapshot()`.
+
+    A snapshot is only a position in the journal of changes that the
+    instance keeps once it has been snapshotted, so it can be compared and
+    restored only against that instance.
+
+    """
+
+    __slots__ = ('journal', 'position')
+
+    def __init__(self, journal, position):
+        self.journal = journal
+        self.position = position
+
+
+def _decode_deep(value):
+    """Decodes the fields of all the `DataObject` instances in `value`."""
+    if isinstance(value, DataObject):
+        value.decode_fields(deep=True)
+    elif isinstance(value, collections.Mapping):
+        for item in value.itervalues():
+            _decode_deep(item)
+    elif (isinstance(value, collections.Sequence)
+          and not isinstance(value, basestring)):
+        for item in value:
+            _decode_deep(item)
+
+
+def _refers_to_included(value, seen):
+    """Returns whether `value` is or holds a `DataObject` instance that was
+    decoded from the included objects of a response."""
+    if isinstance(value, DataObject):
+        if value._reference is not None:
+            return True
+        if id(value) in seen:
+            return False
+        seen.add(id(value))
+        references = value._references
+        if references is not None and references.included:
+            return True
+        for field in value._object_fields:
+            try:
+                item = field._stored(value)
+            except KeyError:
+                continue
+            if _refers_to_included(item, seen):
+                return True
+    elif isinstance(value, (remoteobjects.fields.LazyList,
+                            remoteobjects.fields.LazyDict)):
+        # Look only at the values decoded so far, as the rest are decoded
+        # against the lazy value's index.
+        references = value._references
+        if references is not None and references.included:
+            return True
+        items = value._items
+        if isinstance(items, dict):
+            items = items.values()
+        return any(_refers_to_included(item, seen) for item in items)
+    elif isinstance(value, collections.Mapping):
+        return any(_refers_to_included(item, seen)
+            for item in value.itervalues())
+    elif (isinstance(value, collections.Sequence)
+          and not isinstance(value, basestring)):
+        return any(_refers_to_included(item, seen) for item in value)
+    return False
+
+
+class SlotAttribute(object):
+
+    """A descriptor for an internal attribute of a `DataObject` class with
+    the `compact_storage` option, which is stored in a slot.
+
+    If the attribute had a default value as a class attribute, the
+    descriptor returns it while the slot is empty.
+
+    """
+
+    slot = None
+
+    def __init__(self, default=_missing):
+        self.default = default
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return self.slot.__get__(obj)
+        except AttributeError:
+            if self.default is _missing:
+                raise
+            return self.default
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+    def __delete__(self, obj):
+        self.slot.__delete__(obj)
+
+
 class DataObjectMetaclass(type):
     """Metaclass for `DataObject` classes.
 
@@ -97,10 +491,36 @@ class DataObjectMetaclass(type):
 
         fields.update(new_fields)
         attrs['fields'] = fields
+
+        compact = attrs.get('compact_storage')
+        if compact is None:
+            compact = any(getattr(base, 'compact_storage', False)
+                for base in bases)
+        if compact and '__slots__' not in attrs:
+            attrs['__slots__'] = cls.compact_slots(bases, attrs, fields,
+                new_fields)
+        # Each class indexes its subclasses by their Constant field values,
+        # so polymorphic decoding needs only a dictionary lookup.
+        attrs['_constant_index'] = {}
         obj_cls = super(DataObjectMetaclass, cls).__new__(cls, name, bases, attrs)
 
         for field, value in new_properties.items():
             obj_cls.add_to_class(field, value)
+        if compact:
+            for attrname, field in fields.iteritems():
+                field.slot = getattr(obj_cls, '_slot_' + attrname)
+            for attrname, value in attrs.iteritems():
+                if isinstance(value, SlotAttribute):
+                    value.slot = getattr(obj_cls, '_slot_' + attrname)
+        obj_cls._interned_fields = tuple(field for field in fields.itervalues()
+            if field.intern)
+        obj_cls._releases_data = any(field.release_data
+            for field in fields.itervalues())
+        obj_cls._object_fields = tuple(field for field in fields.itervalues()
+            if field.decodes_objects)
+
+        global _classes_declared
+        _classes_declared += 1
 
         # Register the new class so Object fields can have forward-referenced it.
         classes_by_name[name] = obj_cls
@@ -112,6 +532,65 @@ class DataObjectMetaclass(type):
 
         return obj_cls
 
+    @staticmethod
+    def compact_slots(bases, attrs, fields, new_fields):
+        """Returns the ``__slots__`` of a new `DataObject` class with the
+        `compact_storage` option.
+
+        Each field is given a slot named for its attribute with a ``_slot_``
+        prefix, and is replaced in `fields` (and `attrs`, if inherited) with
+        a copy that stores values in the slot. Each name in the classes'
+        `_internal_slots` attributes gets a slot too, through a
+        `SlotAttribute` added to `attrs` that falls back to any default
+        value the name has as a class attribute.
+
+        Slots the base classes already have are not declared again.
+
+        """
+        def inherited(name):
+            for base in bases:
+                for klass in base.__mro__:
+                    if name in klass.__dict__:
+                        return klass.__dict__[name]
+            raise KeyError(name)
+
+        def has_slot(name):
+            return any(hasattr(base, name) for base in bases)
+
+        slots = []
+        for name, field in fields.items():
+            slotname = '_slot_' + name
+            if not isinstance(field, remoteobjects.fields.SlotStorage):
+                if name not in new_fields:
+                    # Don't change the parent class's field.
+                    field = copy(field)
+                    fields[name] = attrs[name] = field
+                field.__class__ = remoteobjects.fields.slot_storage_class(
+                    type(field))
+            if not has_slot(slotname):
+                slots.append(slotname)
+
+        names = set(attrs.get('_internal_slots', ()))
+        for base in bases:
+            for klass in base.__mro__:
+                names.update(klass.__dict__.get('_internal_slots', ()))
+        for name in sorted(names):
+            if name in attrs:
+                continue
+            try:
+                default = inherited(name)
+            except KeyError:
+                default = _missing
+            if isinstance(default, (SlotAttribute, property)):
+                # Already stored in a slot, or computed some other way.
+                continue
+            attrs[name] = SlotAttribute(default)
+            slotname = '_slot_' + name
+            if not has_slot(slotname):
+                slots.append(slotname)
+
+        return tuple(slots)
+
     def add_to_class(cls, name, value):
         try:
             value.install(name, cls)
@@ -137,6 +616,63 @@ class DataObject(object):
     A DataObject's fields then provide the coding between live DataObject
     instances and dictionaries.
 
+    Classes that set the `release_api_data` attribute remove each field's
+    data from `api_data` once the field is decoded, so the data isn't kept
+    both raw and decoded. Data that no field decodes is kept, and
+    `to_dict()` encodes the decoded values in place of the removed data.
+    The data is removed from the instance's own copy of the dictionary it
+    was decoded from, so that dictionary is left intact. Decoded values
+    stand in for their released data when the instance is merged with
+    `merge_from_dict()` (they're decoded again from the new data),
+    projected, pickled, hashed, or snapshotted and restored.
+
+    Classes that set the `compact_storage` attribute keep their decoded field
+    values and internal state in ``__slots__`` instead of an instance
+    dictionary, which saves several hundred bytes per instance. Their
+    subclasses are compact too.
+
+    Classes for normalized responses, whose related objects are listed once
+    in an included section and referenced by id elsewhere, set the
+    `included_key` attribute to the key of that section. `Object` fields of
+    the response, and of any objects decoded from it, then resolve
+    references into shared instances through a `References` index. The
+    `id_key` and `reference_key` attributes name the keys of the included
+    objects' ids and of references. Encoding the response encodes any
+    decoded included objects back into its included section, so changes to
+    them are kept.
+
+    Classes that set the `compact_pickle` attribute pickle (and copy) their
+    instances as only their API data, with any changed field values encoded
+    into it, plus the little other state they need, such as their URLs.
+    Decoded values aren't pickled alongside the data they were decoded
+    from, so pickles are smaller and faster to make and load, but field
+    values are decoded again after loading. Instances that refer to objects
+    included in another instance's response are pickled in full instead, as
+    their references couldn't be resolved from their data alone.
+
+    Classes that set the `content_hashing` option compare and hash their
+    instances by a digest of their content, as returned by
+    `content_digest()`. The digest is computed the first time it's needed,
+    without decoding the fields, and kept until a field is set or the
+    instance is updated.
+
+    Classes whose instances are embedded many times in one response, such as
+    the author of each of a feed's entries, can set the `identity_key`
+    attribute to the key of their id. Within one response, all embedded
+    objects of the class with the same id then decode into one shared
+    instance, as decoded from the first of them.
+
+    Instances of classes that set the `thread_safe` option can be read from
+    many threads at once. Each field's decoded value is stored under a lock
+    of the instance the first time it's used, so racing threads all get the
+    same value, and a `PromiseObject` instance is delivered with only one
+    request, while the other threads wait for it. The lock isn't held while
+    a value is decoded, so threads decoding instances that share nested
+    objects can't deadlock, though threads racing to decode the same field
+    may each decode it. Reading values already decoded takes no lock.
+    Changing instances, and decoding elements of lazy lists and
+    dictionaries, still need locking of your own.
+
     """
 
     __metaclass__ = DataObjectMetaclass
@@ -144,7 +680,7 @@ class DataObject(object):
     def __init__(self, **kwargs):
         """Initializes a new `DataObject` with the given field values."""
         self.api_data = {}
-        self.__dict__.update(kwargs)
+        self.__setstate__(kwargs)
 
     def __eq__(self, other):
         """Returns whether two `DataObject` instances are equivalent.
@@ -155,10 +691,29 @@ class DataObject(object):
         """
         if type(self) != type(other):
             return False
+        if self.content_hashing or (self._frozen and other._frozen):
+            return self.content_digest() == other.content_digest()
+        # Frozen values are read-only types, such as tuples for lists, so
+        # they're compared with others as encoded.
+        encoded = self._frozen or other._frozen
         for k, v in self.fields.iteritems():
             if isinstance(v, remoteobjects.fields.Field):
-                if getattr(self, k) != getattr(other, k):
-                    return False
+                # Fields projected out of both instances are equal.
+                try:
+                    mine = getattr(self, k)
+                except ProjectionError:
+                    mine = _missing
+                try:
+                    theirs = getattr(other, k)
+                except ProjectionError:
+                    theirs = _missing
+                if mine == theirs:
+                    continue
+                if (encoded and mine is not _missing and mine is not None
+                    and theirs is not _missing and theirs is not None
+                    and v.encode(mine) == v.encode(theirs)):
+                    continue
+                return False
         return True
 
     def __ne__(self, other):
@@ -170,21 +725,478 @@ class DataObject(object):
         """
         return not self == other
 
+    def __hash__(self):
+        """Returns a hash of the `DataObject` instance.
+
+        Frozen instances, and instances of classes with the `content_hashing`
+        option, hash by their content. Instances that aren't frozen shouldn't
+        be changed while they're in sets or used as dictionary keys. Other
+        instances hash by identity.
+
+        """
+        if self.content_hashing or self._frozen:
+            return hash(self.content_digest())
+        return object.__hash__(self)
+
+    _projection = None
+    _references = None
+    _reference = None
+
+    included_key = None
+    id_key = 'id'
+    reference_key = '$ref'
+
+    identity_key = None
+
+    intern_keys = False
+
+    release_api_data = False
+
+    compact_storage = False
+    _internal_slots = ('api_data', '_projection', '_references',
+        '_reference', '_digest', '_frozen', '_journal', '_lock')
+
+    compact_pickle = False
+
+    content_hashing = False
+    _digest = None
+
+    _frozen = False
+
+    _journal = None
+
+    thread_safe = False
+    _lock = None
+
     @classmethod
     def statefields(cls):
-        return cls.fields.keys() + ['api_data']
+        return cls.fields.keys() + ['api_data', '_projection', '_reference']
+
+    @classmethod
+    def _cached_statefields(cls):
+        """Returns the class's `statefields()` as a tuple, computed only once
+        per class."""
+        try:
+            return cls.__dict__['_statefields']
+        except KeyError:
+            names = tuple(cls.statefields())
+            setattr(cls, '_statefields', names)
+            return names
 
     def __getstate__(self):
-        return dict((k, self.__dict__[k]) for k in self.statefields()
-            if k in self.__dict__)
+        # Only the index of an instance whose own data includes objects is
+        # pickled, so resolve any references still in the data while it's
+        # at hand.
+        self._decode_references()
+        state = {}
+        for k in self._cached_statefields():
+            field = self.fields.get(k)
+            try:
+                if field is not None:
+                    state[k] = field._stored(self)
+                else:
+                    # Read the attribute directly, so undelivered promises
+                    # aren't delivered.
+                    state[k] = object.__getattribute__(self, k)
+            except (KeyError, AttributeError):
+                pass
+        if self.included_key is not None and self._references is not None:
+            # Keep the objects decoded from the included data, which the
+            # decoded fields refer to.
+            state['_references'] = self._references
+        if self._frozen:
+            state['_frozen'] = True
+        return state
+
+    def _decode_references(self):
+        """Decodes the fields that decode objects, if the instance has a
+        references index against which they may need resolving."""
+        if self._references is None:
+            return
+        data = self.api_data
+        for field in self._object_fields:
+            if field.api_name in data:
+                getattr(self, field.attrname)
+
+    def __reduce_ex__(self, protocol):
+        if not self.compact_pickle or self._keeps_references():
+            return super(DataObject, self).__reduce_ex__(protocol)
+        data, state = self._compact_state()
+        if self._frozen:
+            return (_restore_frozen, (type(self), data, state))
+        return (_restore_compact, (type(self), data, state))
+
+    def _keeps_references(self):
+        """Returns whether the instance refers to objects included in a
+        response other than its own, which its compact state can't keep, as
+        the references would be encoded without the included objects."""
+        if self.included_key is not None:
+            # The instance's own data includes them.
+            return False
+        return _refers_to_included(self, set())
+
+    def _compact_state(self):
+        """Returns the instance's API data, with any changed field values
+        encoded into it, and a dictionary of its other state, as pickled
+        for the `compact_pickle` option."""
+        fields = self.fields
+        data = None
+        state = {}
+        for k in self._cached_statefields():
+            if k in fields:
+                continue
+            try:
+                # Read the attribute directly, so undelivered promises
+                # aren't delivered.
+                value = object.__getattribute__(self, k)
+            except AttributeError:
+                continue
+            if k in ('api_data', '_api_data'):
+                data = value
+            elif value is not None:
+                state[k] = value
+
+        data = self._current_data(data or {})
+        return data, state
+
+    def _current_data(self, data):
+        """Returns a copy of the instance's API data `data`, with the values
+        of any fields whose decoded values aren't their data as is encoded
+        into it.
+
+        Default values stored for fields the data has no value for are left
+        out.
+
+        """
+        data = dict(data)
+        cls = type(self)
+        for field in self.fields.itervalues():
+            try:
+                value = field._stored(self)
+            except KeyError:
+                continue
+            key = field.api_name
+            if value is None:
+                data.pop(key, None)
+            elif key not in data:
+                # Reading a field the data lacks stores its default, which
+                # isn't content of the instance.
+                if not field._is_default(self, value):
+                    data[key] = field.encode(field.__get__(self, cls))
+            elif data[key] is not value:
+                # Encode the decoded value, which may not be the stored one,
+                # as for compact Datetime fields.
+                data[key] = field.encode(field.__get__(self, cls))
+        return self._encode_included(data)
+
+    def _encode_included(self, data):
+        """Encodes the objects decoded from the included data of the
+        instance's response back into the dictionary `data`, so changes to
+        them are kept along with the references to them, and returns
+        `data`.
+
+        Included objects that were never decoded are left as they are.
+
+        """
+        references = self._references
+        key = self.included_key
+        if key is None or references is None or not references.objects:
+            return data
+        included = data.get(key)
+        if not isinstance(included, (list, tuple)):
+            return data
+        objects = references.objects
+        id_key = references.id_key
+        encoded = []
+        for item in included:
+            try:
+                obj = objects[item[id_key]]
+            except (KeyError, TypeError):
+                encoded.append(item)
+            else:
+                encoded.append(obj.to_dict())
+        data[key] = encoded
+        return data
+
+    def content_digest(self):
+        """Returns a hex digest of the instance's content.
+
+        The digest is of the instance's API data, with the values of any
+        fields that were set encoded into it, so instances with the same
+        content have the same digest. Fields are not decoded to compute it.
+        For classes with the `content_hashing` option, the digest is kept
+        until a field is set or the instance is updated; changes made inside
+        field values, such as to a decoded list, are not noticed.
+
+        """
+        if not (self.content_hashing or self._frozen):
+            return remoteobjects.json.digest(self._current_data(self.api_data))
+        digest = self._digest
+        if digest is None:
+            digest = remoteobjects.json.digest(self._current_data(self.api_data))
+            self._digest = digest
+        return digest
+
+    def __setstate__(self, state):
+        for k, v in state.iteritems():
+            field = self.fields.get(k)
+            if field is not None:
+                field._store(self, v)
+            else:
+                object.__setattr__(self, k, v)
 
     def get(self, attr, *args):
         return getattr(self, attr, *args)
 
+    def _instance_lock(self):
+        """Returns the instance's lock for the `thread_safe` option, making
+        it the first time it's needed."""
+        lock = self._lock
+        if lock is None:
+            with _lock_creation:
+                lock = self._lock
+                if lock is None:
+                    lock = threading.RLock()
+                    self._lock = lock
+        return lock
+
     def __iter__(self):
         for key in self.fields.keys():
             yield key
 
+    def decode_fields(self, deep=False):
+        """Decodes all the instance's fields from its API data now, instead
+        of when each is first used.
+
+        If optional parameter `deep` is true, the fields of `DataObject`
+        instances in the decoded values (including in lists and
+        dictionaries) are decoded as well. Use `decode_fields()` with the
+        `release_api_data` option to drop all the raw data at once.
+
+        Returns the `DataObject` instance itself.
+
+        """
+        for name in self.fields:
+            value = getattr(self, name)
+            if deep:
+                _decode_deep(value)
+        return self
+
+    def freeze(self):
+        """Returns a frozen, read-only copy of this `DataObject` instance.
+
+        All the copy's fields are decoded when it's made, including those of
+        nested `DataObject` instances, which are frozen too. Lists become
+        tuples, and dictionaries become `FrozenDict` instances. The copy
+        keeps only the API data that no field decodes, as `FrozenDict` and
+        `FrozenList` instances, and a frozen `PromiseObject` is delivered
+        first, so reading a frozen instance never changes it. Frozen
+        instances can therefore be shared among threads without locking.
+
+        Setting or deleting a field of a frozen instance, or updating it,
+        raises `FrozenError`. Frozen instances hash and compare by their
+        content, as for the `content_hashing` option, and compare equal to
+        instances that aren't frozen by their fields' encoded values, so a
+        frozen copy equals its original. Use `thaw()` to get a copy that can
+        be changed.
+
+        Values of other kinds, such as `array.array` values, are shared with
+        the original instance rather than made read-only.
+
+        """
+        return self._freeze({})
+
+    def _freeze(self, memo):
+        if self._frozen:
+            return self
+        try:
+            return memo[id(self)]
+        except KeyError:
+            pass
+
+        # Deliver a promise before its state is copied, so the copy never
+        # needs delivering.
+        data = self._encode_included(dict(self.api_data))
+        frozen = type(self)()
+        memo[id(self)] = frozen
+
+        fields = self.fields
+        for k in self._cached_statefields():
+            if k in fields or k in ('api_data', '_api_data'):
+                continue
+            try:
+                setattr(frozen, k, getattr(self, k))
+            except AttributeError:
+                pass
+
+        api_names = set()
+        for name, field in fields.iteritems():
+            if not isinstance(field, remoteobjects.fields.Field):
+                continue
+            api_names.add(field.api_name)
+            try:
+                value = getattr(self, name)
+            except ProjectionError:
+                continue
+            field._store(frozen, _freeze_value(value, memo))
+        frozen.api_data = _freeze_data(dict((k, v)
+            for k, v in data.iteritems() if k not in api_names))
+
+        frozen._frozen = True
+        return frozen
+
+    def thaw(self):
+        """Returns a copy of this `DataObject` instance that can be changed,
+        such as of a frozen instance made with `freeze()`.
+
+        The copy is made from the instance's data, with all its field values
+        encoded, and decodes its fields again as they're used. Raises
+        `ValueError` if the instance refers to objects included in another
+        instance's response, as the copy couldn't resolve the references;
+        thaw that instance instead.
+
+        """
+        if self._keeps_references():
+            raise ValueError("Cannot thaw %s instance that refers to another "
+                "instance's included objects" % (type(self).__name__,))
+        data, state = self._compact_state()
+        # Copy any read-only API data of a frozen instance as plain data.
+        return _restore_compact(type(self), deepcopy(data), state)
+
+    def snapshot(self):
+        """Returns a `Snapshot` of this `DataObject` instance's fields, for
+        use with `diff()` and `restore()`.
+
+        Taking a snapshot copies nothing. Instead, once an instance has been
+        snapshotted, setting or deleting its fields, or updating it, records
+        the values being replaced in a journal, and its API data is replaced
+        rather than changed in place. Changes made inside field values, such
+        as appending to a decoded list or setting a field of a nested
+        object, are not recorded. For classes that release their API data
+        as it's decoded, the API data is copied when a snapshot is taken,
+        so decoding can't release the data the snapshot refers to.
+
+        The journal grows with every change until `release_snapshots()` is
+        called (restoring a snapshot drops only the changes since it), so
+        call `release_snapshots()` once the snapshots are no longer needed,
+        such as after saving the instance.
+
+        """
+        journal = self._journal
+        if journal is None:
+            # Deliver any promised data before the first snapshot.
+            self.api_data
+            journal = self._journal = []
+        snapshot = Snapshot(journal, len(journal))
+        if self.release_api_data or self._releases_data:
+            data = self.api_data
+            self._record_change((), data)
+            self.api_data = dict(data)
+        return snapshot
+
+    def release_snapshots(self):
+        """Drops the instance's journal of changes, so that its snapshots can
+        no longer be used."""
+        self._journal = None
+
+    def diff(self, snapshot):
+        """Returns a sorted list of the names of the fields whose values have
+        changed since the `Snapshot` `snapshot` of this instance was taken.
+
+        Only the fields changed since the snapshot are examined, so the time
+        taken depends on the number of changes rather than on the size of
+        the instance.
+
+        """
+        entries = self._snapshot_entries(snapshot)
+        before = {}
+        data = None
+        for values, old_data in entries:
+            for field, value in values.iteritems():
+                before.setdefault(field, value)
+            if data is None:
+                data = old_data
+        if data is None:
+            data = self.api_data
+
+        changed = []
+        for field, old in before.iteritems():
+            if old is _missing:
+                old = self._value_from(field, data)
+            else:
+                # Compare decoded values, not stored ones such as the
+                # seconds of compact Datetime fields.
+                old = field._from_stored(old)
+            try:
+                new = getattr(self, field.attrname)
+            except ProjectionError:
+                new = None
+            if old is not new and old != new:
+                changed.append(field.attrname)
+        changed.sort()
+        return changed
+
+    def restore(self, snapshot):
+        """Restores the instance's fields to their values when the `Snapshot`
+        `snapshot` of this instance was taken.
+
+        Snapshots taken after `snapshot` can no longer be used once it has
+        been restored.
+
+        """
+        if self._frozen:
+            raise FrozenError('Cannot restore frozen %s instance'
+                % (type(self).__name__,))
+        entries = self._snapshot_entries(snapshot)
+        for values, old_data in reversed(entries):
+            for field, value in values.iteritems():
+                if value is _missing:
+                    field._unstore(self)
+                else:
+                    field._store(self, value)
+            if old_data is not None:
+                self.api_data = old_data
+        del self._journal[snapshot.position:]
+        if self.content_hashing:
+            self._digest = None
+
+    def _snapshot_entries(self, snapshot):
+        journal = self._journal
+        if (journal is None or snapshot.journal is not journal
+            or snapshot.position > len(journal)):
+            raise ValueError('%r is not a current snapshot of %r'
+                % (snapshot, self))
+        return journal[snapshot.position:]
+
+    def _record_change(self, fields, data=None):
+        """Records the current values of the fields `fields` in the
+        instance's journal of changes, before they are changed.
+
+        If the instance's API data is about to be replaced, pass it as
+        `data` to record it too.
+
+        """
+        values = {}
+        for field in fields:
+            try:
+                value = field._stored(self)
+            except KeyError:
+                value = _missing
+            values[field] = value
+        self._journal.append((values, data))
+
+    def _value_from(self, field, data):
+        """Returns the value of the field `field` as decoded from the API data
+        `data`, without storing it."""
+        try:
+            raw = data[field.api_name]
+        except KeyError:
+            if callable(field.default):
+                return field.default(self)
+            return field.default
+        return remoteobjects.fields.decode_with_references(field, raw,
+            self._references)
+
     def to_dict(self):
         """Encodes the DataObject to a dictionary."""
         data = deepcopy(self.api_data)
@@ -192,7 +1204,7 @@ class DataObject(object):
             value = getattr(self, field.attrname, None)
             if value is not None:
                 data[field.api_name] = field.encode(value)
-        return data
+        return self._encode_included(data)
 
     @classmethod
     def from_dict(cls, data):
@@ -214,13 +1226,276 @@ class DataObject(object):
         turned into another object with `from_dict()`.
 
         """
-        if not isinstance(data, dict):
-            raise TypeError
+        if not isinstance(data, collections.Mapping):
+            raise TypeError("Cannot update %r from non-dictionary data source %r"
+                % (self, data))
+        if self._frozen:
+            raise FrozenError('Cannot update frozen %s instance; thaw() it first'
+                % (type(self).__name__,))
+        data = self._own_data(data)
+        if self._journal is not None:
+            self._record_change(self.fields.itervalues(), self.api_data)
         # Clear any local instance field data
-        for k in self.fields.iterkeys():
-            if k in self.__dict__:
-                del self.__dict__[k]
+        for field in self.fields.itervalues():
+            field._unstore(self)
+        # Set api_data through its attribute, which PromiseObject sets
+        # without triggering delivery.
         self.api_data = data
+        if self.content_hashing:
+            self._digest = None
+        self._adopt_references(data)
+
+    def _adopt_references(self, data):
+        """Sets the `References` index through which the instance's fields
+        are decoded from its new API data `data`."""
+        references = remoteobjects.fields.current_references()
+        if self.included_key is not None:
+            references = References(data.get(self.included_key, ()),
+                self.id_key, self.reference_key, references)
+        if references is not None and not (self._object_fields and
+                (references.included or self._shares_objects())):
+            # Nothing decoded through this object's fields is looked up in
+            # the index, so don't keep it.
+            references = None
+        # Objects decoded as part of a response share its index.
+        self._references = references
+
+    @classmethod
+    def _shares_objects(cls):
+        """Returns whether any `DataObject` class decoded through the
+        class's fields, or through theirs in turn, has an `identity_key` or
+        an `included_key`, so that decoding the class's instances needs a
+        `References` index."""
+        try:
+            declared, shares = cls.__dict__['_shares']
+        except KeyError:
+            pass
+        else:
+            if declared == _classes_declared:
+                return shares
+
+        shares = False
+        seen = set([cls])
+        todo = [cls]
+        while todo and not shares:
+            for field in todo.pop()._object_fields:
+                try:
+                    classes = field.object_classes()
+                except KeyError:
+                    # The class isn't declared yet.
+                    continue
+                for klass in classes:
+                    if (klass.identity_key is not None
+                        or klass.included_key is not None):
+                        shares = True
+                    if klass not in seen:
+                        seen.add(klass)
+                        todo.append(klass)
+        setattr(cls, '_shares', (_classes_declared, shares))
+        return shares
+
+    def merge_from_dict(self, data, partial=False):
+        """Updates this DataObject with the content of a dictionary, keeping
+        the decoded values of the fields whose data didn't change.
+
+        Use `merge_from_dict()` instead of `update_from_dict()` when
+        receiving new content for an object that's already in use, such as
+        when revalidating it. The incoming data is compared key by key with
+        the encoded values of the fields that were decoded or set. Values
+        whose data is the same are kept; values that were set to something
+        else are replaced by the incoming data's. Nested `DataObject`
+        instances whose data changed are merged the same way, so they are
+        kept as well, unless they may be shared with other objects.
+
+        If optional parameter `partial` is true, `data` is treated as a
+        partial response: fields with no data in it keep their current data
+        and values. Otherwise, as with `update_from_dict()`, fields with no
+        data in `data` lose their values.
+
+        Objects with included references (see `included_key`) are updated
+        entirely, as with `update_from_dict()`, and instances that have been
+        snapshotted (see `snapshot()`) don't merge into their nested objects.
+
+        """
+        if not isinstance(data, collections.Mapping):
+            raise TypeError("Cannot update %r from non-dictionary data source %r"
+                % (self, data))
+        if self._frozen:
+            raise FrozenError('Cannot update frozen %s instance; thaw() it first'
+                % (type(self).__name__,))
+        if self.included_key is not None:
+            return DataObject.update_from_dict(self, data)
+
+        data = self._own_data(data)
+        current = self.api_data
+        journaled = self._journal is not None
+        if journaled:
+            self._record_change(self.fields.itervalues(), current)
+        cls = type(self)
+        for field in self.fields.itervalues():
+            try:
+                value = field._stored(self)
+            except KeyError:
+                continue
+            key = field.api_name
+            if key not in data:
+                if not partial:
+                    field._unstore(self)
+                continue
+            # Compare with the value as it is now, which may have been set
+            # since it was decoded from the current data.
+            if value is None:
+                if data[key] is None:
+                    continue
+            elif field.encode(field.__get__(self, cls)) == data[key]:
+                continue
+            # Merging into the values would change them under the journal.
+            if (value is None or journaled
+                or not field.merge(value, data[key], partial)):
+                field._unstore(self)
+
+        if partial:
+            merged = dict(current)
+            merged.update(data)
+            data = merged
+        self.api_data = data
+        if self.content_hashing:
+            self._digest = None
+        # Objects decoded from the new data aren't shared with those the
+        # kept values were decoded with.
+        self._adopt_references(data)
+
+    def _own_data(self, data):
+        """Returns the dictionary `data` as the instance should keep it as
+        its API data: interned, and copied if the fields' data is released
+        from it."""
+        interned = self.intern_data(data)
+        if (interned is data and isinstance(data, dict)
+            and (self.release_api_data or self._releases_data)):
+            interned = dict(data)
+        return interned
+
+    @classmethod
+    def intern_data(cls, data):
+        """Returns a copy of the dictionary `data` with shared instances of
+        equal values, so that many `DataObject` instances don't each keep
+        their own copies.
+
+        The values of `Constant` fields, and of fields declared with
+        ``intern=True``, are replaced as by their fields' `intern_value()`
+        methods. If the class's `intern_keys` attribute is true, the keys of
+        all the class's fields are replaced with the fields' own `api_name`
+        strings as well.
+
+        `data` itself is left unchanged. If the class interns nothing, or
+        `data` isn't a plain dictionary, `data` is returned as is.
+
+        """
+        if not isinstance(data, dict):
+            return data
+        if not (cls._interned_fields or cls.intern_keys):
+            return data
+        data = dict(data)
+        for field in cls._interned_fields:
+            key = field.api_name
+            if key in data:
+                data[key] = field.intern_value(data[key])
+        if cls.intern_keys:
+            for field in cls.fields.itervalues():
+                key = field.api_name
+                if key in data:
+                    # Reinsert the value so the dictionary keeps our key.
+                    data[key] = data.pop(key)
+        return data
+
+    def project(self, only):
+        """Keeps only the data for the given fields in this `DataObject`.
+
+        Parameter `only` is a sequence of the attribute names of the fields
+        to keep, as for `parse_projection()`. Data for all other fields, and
+        any data not described by fields, is removed from the instance's API
+        data. Names of nested objects' fields, such as ``author.name``,
+        project the objects in those fields the same way.
+
+        Reading a field that was projected out then raises `ProjectionError`
+        instead of silently returning the field's default. Subsequent updates
+        from the remote resource are projected the same way.
+
+        Returns the `DataObject` instance itself.
+
+        """
+        self._projection = parse_projection(only)
+        self._apply_projection()
+        return self
+
+    def _apply_projection(self):
+        projection = self._projection
+        self.api_data = self.project_data(self.api_data, projection)
+        for name, field in self.fields.iteritems():
+            try:
+                value = field._stored(self)
+            except KeyError:
+                continue
+            if name not in projection:
+                field._unstore(self)
+            elif projection[name]:
+                field.project(value, projection[name])
+
+    @classmethod
+    def project_data(cls, data, projection):
+        """Returns a copy of a dictionary that would be decoded into an
+        instance of this class, with only the data selected by a projection.
+
+        Parameter `projection` is a projection as returned by
+        `parse_projection()`. The dictionary `data` itself, and any
+        dictionaries nested in it, are left unchanged.
+
+        """
+        if not isinstance(data, collections.Mapping):
+            return data
+        fields = cls.fields
+        keep = {}
+        for name, sub in projection.iteritems():
+            try:
+                field = fields[name]
+            except KeyError:
+                raise ValueError('%s has no field %r to project'
+                    % (cls.__name__, name))
+            keep[field.api_name] = (field, sub)
+
+        projected = {}
+        for key, (field, sub) in keep.iteritems():
+            if key in data:
+                value = data[key]
+                if sub:
+                    value = field.project_data(value, sub)
+                projected[key] = value
+        return projected
+
+    @classmethod
+    def field_tree(cls, projection=None, seen=()):
+        """Returns the API names of this class's fields as a tree.
+
+        The tree is a dictionary of the API name of each field to `None`, or
+        for fields of nested `DataObject` instances, to the tree of the
+        nested class's fields. Classes already in the sequence `seen` (such
+        as self-referencing classes) are not expanded again.
+
+        If optional parameter `projection` is given, as returned by
+        `parse_projection()`, only the fields it selects are included.
+
+        """
+        seen = seen + (cls,)
+        tree = {}
+        for name, field in cls.fields.iteritems():
+            if projection is None:
+                sub = None
+            elif name in projection:
+                sub = projection[name]
+            else:
+                continue
+            tree[field.api_name] = field.nested_fields(sub, seen)
+        return tree
 
     @classmethod
     def subclass_with_constant_field(cls, fieldname, value):
@@ -237,21 +1512,21 @@ class DataObject(object):
         more appropriate class to instantiate.
 
         Parameters `fieldname` and `value` are the name and value of the
-        `Constant` field for which to search respectively.
+        `Constant` field for which to search respectively. `fieldname` may
+        be either the attribute name or the API name of the field. Sequence
+        values match constants of equal sequences, as for `constant_key()`.
 
         If a subclass of `cls` has been declared with a `Constant` field of
         the given name and value, it will be returned. If multiple subclasses
-        of `cls` declare a matching `Constant` field, one of the matching
-        subclasses will be returned, but which subclass is not defined.
+        of `cls` declare a matching `Constant` field, the most recently
+        declared of the matching subclasses is returned.
 
         """
         try:
-            clsname = classes_by_constant_field[fieldname][tuple(value)]
-        except KeyError:
-            # No matching classes, then.
+            return cls._constant_index[fieldname][constant_key(value)]
+        except (KeyError, TypeError):
+            # No matching classes (or an unhashable value), then.
             pass
-        else:
-            return find_by_name(clsname)
 
         raise ValueError('No such subclass of %s with field %r equivalent to %r'
             % (cls.__name__, fieldname, value))
@@ -38,12 +38,75 @@ that offers links between `RemoteObject` instances, `Link`.
 
 """
 
-from datetime import datetime
+from array import array
+import base64
+import binascii
+import calendar
+import collections
+from copy import deepcopy
+from datetime import datetime, timedelta
 import logging
+import mmap
+import re
+import tempfile
+import threading
 import time
 import urlparse
+import weakref
 
 import remoteobjects.dataobject
+import remoteobjects.columns
+
+
+# The most unicode strings to keep interned at once.
+INTERN_LIMIT = 65536
+
+_interned = {}
+
+
+def intern_string(value):
+    """Returns the shared instance of the string `value`.
+
+    Byte strings are interned with the `intern()` builtin. Unicode strings,
+    which `intern()` does not support (nor weak references), are kept in a
+    dictionary of their own. Once that holds `INTERN_LIMIT` strings, it's
+    emptied and starts over, so that a field with many distinct values
+    doesn't keep them all for the life of the process.
+
+    """
+    if type(value) is str:
+        return intern(value)
+    try:
+        return _interned[value]
+    except KeyError:
+        if len(_interned) >= INTERN_LIMIT:
+            _interned.clear()
+        _interned[value] = value
+        return value
+
+
+# The references of the response being decoded in each thread.
+_decoding = threading.local()
+
+
+def current_references():
+    """Returns the `remoteobjects.dataobject.References` index that values
+    being decoded in this thread refer to, or `None` if there is none."""
+    return getattr(_decoding, 'references', None)
+
+
+def decode_with_references(fld, value, references):
+    """Decodes the dictionary value `value` through the field `fld`,
+    resolving any object references in it against the
+    `remoteobjects.dataobject.References` index `references`."""
+    if references is None:
+        return fld.decode(value)
+    outer = current_references()
+    _decoding.references = references
+    try:
+        return fld.decode(value)
+    finally:
+        _decoding.references = outer
 
 
 class Property(object):
@@ -90,7 +153,14 @@ class Field(Property):
 
     """
 
-    def __init__(self, api_name=None, default=None):
+    # Whether decoded values can contain `DataObject` instances.
+    decodes_objects = False
+
+    # Whether to remove the field's data from `api_data` once it's decoded,
+    # as for classes with the `release_api_data` option.
+    release_data = False
+
+    def __init__(self, api_name=None, default=None, intern=False):
         """Sets the field's matching deserialization field and default value.
 
         Optional parameter `api_name` is the key of this field's matching
@@ -113,9 +183,18 @@ class Field(Property):
         values will stick on `DataObject` instances that are saved and
         retrieved (such as `RemoteObject` instances).
 
+        If optional parameter `intern` is true, the field's string values are
+        interned when a dictionary is decoded, so that all instances with
+        equal values share one string, as by `intern_string()`. Byte strings
+        are freed once nothing uses them, and up to `INTERN_LIMIT` unicode
+        strings are kept before the table of them is emptied, so interning
+        pays off only for fields with few distinct values (such as statuses
+        or country codes).
+
         """
         self.api_name = api_name
         self.default  = default
+        self.intern   = intern
 
     def install(self, attrname, cls):
         self.attrname = attrname
@@ -136,37 +215,144 @@ class Field(Property):
             # Yield the real field instance when gotten through the class.
             return self
 
-        if self.attrname not in obj.__dict__:
-            try:
-                value = obj.api_data[self.api_name]
-            except KeyError:
-                if callable(self.default):
-                    value = self.default(obj)
-                else:
-                    value = self.default
+        try:
+            return self._stored(obj)
+        except KeyError:
+            pass
+
+        if obj.thread_safe:
+            # Decode without holding the instance's lock, as decoding may
+            # use other instances' locks in turn, and instances sharing
+            # objects would take them in different orders. Racing threads
+            # may each decode the value, but all get the one stored first.
+            value, raw = self._decode_value(obj)
+            with obj._instance_lock():
+                try:
+                    return self._stored(obj)
+                except KeyError:
+                    return self._keep(obj, value, raw)
+        value, raw = self._decode_value(obj)
+        return self._keep(obj, value, raw)
+
+    def _decode_value(self, obj):
+        """Returns the value of this field on the instance `obj` as decoded
+        from its API data, or its default value, and the raw value it was
+        decoded from."""
+        try:
+            raw = obj.api_data[self.api_name]
+        except KeyError:
+            raw = None
+            projection = obj._projection
+            if projection is not None and self.attrname not in projection:
+                raise remoteobjects.dataobject.ProjectionError(
+                    '%s field %r was projected out; get the object '
+                    'again without a projection to read it'
+                    % (type(obj).__name__, self.attrname))
+            if callable(self.default):
+                value = self.default(obj)
             else:
-                value = self.decode(value)
-            # Store the value so we need decode it only once.
-            obj.__dict__[self.attrname] = value
+                value = self.default
+        else:
+            references = obj._references
+            if (references is None and self.decodes_objects
+                and obj._shares_objects()):
+                references = self._make_references(obj)
+            value = decode_with_references(self, raw, references)
+            projection = obj._projection
+            if projection is not None and projection.get(self.attrname):
+                self.project(value, projection[self.attrname])
+        return value, raw
+
+    def _is_default(self, obj, value):
+        """Returns whether the decoded value `value` is this field's default
+        value on the instance `obj`, as stored when its API data has no value
+        for the field."""
+        default = self.default
+        if callable(default):
+            return value == default(obj)
+        return value is default
+
+    def _make_references(self, obj):
+        """Gives the instance `obj` a new `References` index, through which
+        the objects decoded through its fields are shared, and returns
+        it."""
+        if not obj.thread_safe:
+            references = remoteobjects.dataobject.References()
+            obj._references = references
+            return references
+        with obj._instance_lock():
+            # Another thread may have made one first.
+            references = obj._references
+            if references is None:
+                references = remoteobjects.dataobject.References()
+                obj._references = references
+            return references
+
+    def _keep(self, obj, value, raw):
+        """Stores the value `value` of this field on the instance `obj`, as
+        decoded from the raw value `raw`, and returns it."""
+        # Store the value so we need decode it only once.
+        self._store(obj, value)
+
+        if raw is not None and (self.release_data or obj.release_api_data):
+            # The decoded value replaces the raw one, even in to_dict().
+            del obj.api_data[self.api_name]
 
-        return obj.__dict__[self.attrname]
+        return value
 
     def __set__(self, obj, value):
-        obj.__dict__[self.attrname] = value
+        if obj._frozen:
+            self._frozen_error(obj)
+        if obj._journal is not None:
+            obj._record_change((self,))
+        self._store(obj, value)
+        if obj.content_hashing:
+            obj._digest = None
 
     def __delete__(self, obj):
+        if obj._frozen:
+            self._frozen_error(obj)
+        if obj._journal is not None:
+            # Leave the snapshotted API data as it was.
+            data = obj.api_data
+            obj._record_change((self,), data)
+            obj.api_data = dict(data)
         # Delete both the instance and API data, so we'll get a real
         # attribute miss next time and return the field's default.
-        try:
-            del obj.__dict__[self.attrname]
-        except KeyError:
-            pass
+        self._unstore(obj)
+        if obj.content_hashing:
+            obj._digest = None
 
         try:
             del obj.api_data[self.api_name]
         except KeyError:
             pass
 
+    def _frozen_error(self, obj):
+        raise remoteobjects.dataobject.FrozenError(
+            'Cannot change field %r of frozen %s instance; thaw() it first'
+            % (self.attrname, type(obj).__name__))
+
+    def _stored(self, obj):
+        """Returns the decoded value of this field stored on the instance
+        `obj`, raising `KeyError` if there is none."""
+        return obj.__dict__[self.attrname]
+
+    def _from_stored(self, value):
+        """Returns the decoded value that the value `value`, as stored on an
+        instance by `_store()`, stands for."""
+        return value
+
+    def _store(self, obj, value):
+        """Stores the decoded value `value` of this field on the instance
+        `obj`."""
+        obj.__dict__[self.attrname] = value
+
+    def _unstore(self, obj):
+        """Removes any decoded value of this field stored on the instance
+        `obj`."""
+        obj.__dict__.pop(self.attrname, None)
+
     def decode(self, value):
         """Decodes a dictionary value into a `DataObject` attribute value.
 
@@ -189,6 +375,74 @@ class Field(Property):
         """
         return value
 
+    def intern_value(self, value):
+        """Returns a shared instance of the dictionary value `value`, for
+        fields declared with ``intern=True``.
+
+        This implementation interns string values with `intern_string()`,
+        returning other values unchanged.
+
+        """
+        if isinstance(value, basestring):
+            return intern_string(value)
+        return value
+
+    def project_data(self, value, projection):
+        """Returns a copy of a dictionary value of this field with only the
+        data selected by `projection`, leaving `value` itself unchanged.
+
+        This implementation returns `value` as is, as plain values have no
+        fields to project. Fields of nested `DataObject` instances override
+        this method to project the instances' data.
+
+        """
+        return value
+
+    def project(self, value, projection):
+        """Applies `projection` to a decoded `DataObject` attribute value of
+        this field.
+
+        This implementation does nothing. Fields of nested `DataObject`
+        instances override this method to project the instances.
+
+        """
+        pass
+
+    def merge(self, value, data, partial=False):
+        """Updates the decoded `DataObject` attribute value `value` of this
+        field in place with the changed dictionary value `data`, as for
+        `DataObject.merge_from_dict()`.
+
+        Returns whether `value` was updated. If not, the field's value is
+        decoded again from `data` when next used. This implementation
+        returns `False`, as plain values can't be updated in place. Fields
+        of nested `DataObject` instances override this method to merge the
+        data into the instances.
+
+        """
+        return False
+
+    def nested_fields(self, projection=None, seen=()):
+        """Returns the tree of API names of the fields nested in this field,
+        as for `DataObject.field_tree()`, or `None` if the field has no
+        nested fields.
+
+        This implementation returns `None`. Fields of nested `DataObject`
+        instances override this method to return their classes' fields.
+
+        """
+        return None
+
+    def object_classes(self):
+        """Returns the `DataObject` classes that this field may decode
+        values into.
+
+        This implementation returns an empty list. Fields that decode
+        `DataObject` instances override this method to return their classes.
+
+        """
+        return []
+
 
 class Constant(Field):
 
@@ -205,7 +459,13 @@ class Constant(Field):
     """
 
     def __init__(self, value, **kwargs):
-        """Sets the field's constant value to parameter `value`."""
+        """Sets the field's constant value to parameter `value`.
+
+        Constant fields are interned by default, so decoded dictionaries
+        share the field's own value.
+
+        """
+        kwargs.setdefault('intern', True)
         super(Constant, self).__init__(**kwargs)
         self.value = value
 
@@ -214,17 +474,31 @@ class Constant(Field):
 
         This implementation also registers the owning class by this constant
         field's value, so that `DataObject.subclass_with_constant_field()`
-        will find this field's class.
+        and polymorphic `Object` fields will find this field's class.
 
         """
         super(Constant, self).install(attrname, cls)
 
-        # Register class by this field.
+        # Register class by this field, under both its API and attribute
+        # names, so bases that don't declare the field can find it by either.
+        names = set((self.api_name, self.attrname))
+        value = remoteobjects.dataobject.constant_key(self.value)
         cf = remoteobjects.dataobject.classes_by_constant_field
-        attrname, value = self.attrname, self.value
-        if attrname not in cf:
-            cf[attrname] = dict()
-        cf[attrname][value] = cls.__name__
+        for name in names:
+            if name not in cf:
+                cf[name] = weakref.WeakValueDictionary()
+            cf[name][value] = cls
+
+        # Index the class in itself and in every DataObject class it
+        # inherits from, so each base can find it in one lookup. The indexes
+        # hold subclasses weakly, so bases don't keep them alive.
+        for base in cls.__mro__:
+            index = base.__dict__.get('_constant_index')
+            if index is not None:
+                for name in names:
+                    if name not in index:
+                        index[name] = weakref.WeakValueDictionary()
+                    index[name][value] = cls
 
     def __get__(self, obj, cls):
         if obj is None:
@@ -245,11 +519,209 @@ class Constant(Field):
                 % (value, self.value))
         return self.value
 
+    def intern_value(self, value):
+        if value == self.value:
+            return self.value
+        return value
+
     def encode(self, value):
         # Don't even bother caring what we were given; it's our constant.
         return self.value
 
 
+# Marks elements of lazy containers that have not been decoded yet.
+_undecoded = object()
+
+
+class LazyList(collections.MutableSequence):
+
+    """A list of values that are decoded through a field only when used.
+
+    `List` fields declared with ``lazy=True`` decode into `LazyList`
+    instances. Each element is decoded from its dictionary value the first
+    time it is used, and the decoded value is kept for later. Taking the
+    length of a `LazyList` or slicing it does not decode any elements.
+
+    Slices share their decoded elements with the list they were sliced
+    from, so each element is decoded only once, whether through the list or
+    any of its slices. As with plain lists, adding, removing or replacing
+    elements of a slice doesn't change the list it was sliced from.
+
+    """
+
+    def __init__(self, fld, raw):
+        """Sets the field to decode with and the list of dictionary values to
+        decode."""
+        self._fld = fld
+        # The original dictionary values, which are never changed, and the
+        # values decoded from them by position, shared with all slices.
+        self._source = raw
+        self._decoded = {}
+        # The source position of each element, or None for elements that
+        # were added to the list.
+        self._positions = range(len(raw))
+        self._items = [_undecoded] * len(raw)
+        self._references = current_references()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            sliced = type(self).__new__(type(self))
+            sliced._fld = self._fld
+            sliced._source = self._source
+            sliced._decoded = self._decoded
+            sliced._positions = self._positions[index]
+            sliced._items = self._items[index]
+            sliced._references = self._references
+            return sliced
+        value = self._items[index]
+        if value is _undecoded:
+            position = self._positions[index]
+            try:
+                value = self._decoded[position]
+            except KeyError:
+                value = decode_with_references(self._fld,
+                    self._source[position], self._references)
+                value = self._decoded.setdefault(position, value)
+            self._items[index] = value
+        return value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._items[index] = value
+            self._positions[index] = [None] * len(value)
+        else:
+            self._items[index] = value
+            self._positions[index] = None
+
+    def __delitem__(self, index):
+        del self._items[index]
+        del self._positions[index]
+
+    def insert(self, index, value):
+        self._items.insert(index, value)
+        self._positions.insert(index, None)
+
+    def __iter__(self):
+        for index in xrange(len(self._items)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, LazyList)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        # Pickle and copy as a plain decoded list.
+        return (list, (list(self),))
+
+    def encode(self):
+        """Encodes the list back into a list of dictionary values.
+
+        Elements that were never decoded are copied from their original
+        dictionary values instead of being decoded and encoded again.
+
+        """
+        encode = self._fld.encode
+        source, decoded = self._source, self._decoded
+        data = []
+        for position, value in zip(self._positions, self._items):
+            if value is _undecoded:
+                # A slice may have decoded (and changed) the element.
+                value = decoded.get(position, _undecoded)
+            if value is _undecoded:
+                data.append(deepcopy(source[position]))
+            else:
+                data.append(encode(value))
+        return data
+
+
+class LazyDict(collections.MutableMapping):
+
+    """A dictionary of values that are decoded through a field only when
+    used.
+
+    `Dict` fields declared with ``lazy=True`` decode into `LazyDict`
+    instances. As with `LazyList`, each value is decoded the first time it
+    is used, and its decoded value is kept for later.
+
+    """
+
+    def __init__(self, fld, raw):
+        """Sets the field to decode with and the dictionary of dictionary
+        values to decode."""
+        self._fld = fld
+        self._raw = raw
+        self._items = {}
+        self._owned = False
+        self._references = current_references()
+
+    def _own(self):
+        if not self._owned:
+            self._raw = dict(self._raw)
+            self._owned = True
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __getitem__(self, key):
+        try:
+            return self._items[key]
+        except KeyError:
+            value = decode_with_references(self._fld, self._raw[key],
+                self._references)
+            self._items[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        if key not in self._raw:
+            self._own()
+            self._raw[key] = None
+        self._items[key] = value
+
+    def __delitem__(self, key):
+        self._own()
+        del self._raw[key]
+        self._items.pop(key, None)
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def __reduce__(self):
+        return (dict, (dict(self.iteritems()),))
+
+    def encode(self):
+        """Encodes the dictionary back into a dictionary of dictionary
+        values, copying the values that were never decoded."""
+        encode = self._fld.encode
+        items = self._items
+        return dict((key, encode(items[key]) if key in items else deepcopy(raw))
+            for key, raw in self._raw.iteritems())
+
+
 class List(Field):
 
     """A field representing a homogeneous list of data.
@@ -259,16 +731,22 @@ class List(Field):
 
     """
 
-    def __init__(self, fld, **kwargs):
+    def __init__(self, fld, lazy=False, **kwargs):
         """Sets the type of field representing the content of the list.
 
         Parameter `fld` is another field instance representing the list's
         content. For instance, if the field were to represent a list of
         timestamps, `fld` would be a `Datetime` instance.
 
+        Optional parameter `lazy` specifies whether to decode the list's
+        elements only as they are used. If `lazy` is true, the field decodes
+        into a `LazyList` instead of a plain list.
+
         """
-        super(List, self).__init__(default=[], **kwargs)
+        kwargs.setdefault('default', [])
+        super(List, self).__init__(**kwargs)
         self.fld = fld
+        self.lazy = lazy
 
     def install(self, attrname, cls):
         super(List, self).install(attrname, cls)
@@ -283,12 +761,111 @@ class List(Field):
             if callable(self.default):
                 return self.default()
             return self.default
-        return [self.fld.decode(v) for v in value]
+        if self.lazy:
+            return LazyList(self.fld, value)
+        decode = self.fld.decode
+        return [decode(v) for v in value]
 
     def encode(self, value):
         """Encodes a `DataObject` attribute (a list of `DataObject` attribute
         values) into a dictionary value (a list of dictionary values)."""
-        return [self.fld.encode(v) for v in value]
+        if isinstance(value, LazyList) and value._fld is self.fld:
+            return value.encode()
+        encode = self.fld.encode
+        return [encode(v) for v in value]
+
+    def project_data(self, value, projection):
+        if value is None:
+            return value
+        project_data = self.fld.project_data
+        return [project_data(v, projection) for v in value]
+
+    def project(self, value, projection):
+        for v in value:
+            self.fld.project(v, projection)
+
+    def merge(self, value, data, partial=False):
+        # Only lists of the same length are merged item by item.
+        if type(value) is not list or not isinstance(data, list):
+            return False
+        if len(value) != len(data):
+            return False
+        merge = self.fld.merge
+        for v, d in zip(value, data):
+            if not merge(v, d, partial):
+                return False
+        return True
+
+    def nested_fields(self, projection=None, seen=()):
+        return self.fld.nested_fields(projection, seen)
+
+    @property
+    def decodes_objects(self):
+        return self.fld.decodes_objects
+
+    def object_classes(self):
+        return self.fld.object_classes()
+
+
+class ArrayList(List):
+
+    """A field representing a list of numbers, decoded into an
+    `array.array` of the field's `typecode`.
+
+    An `array` keeps its numbers unboxed, so it takes several times less
+    memory than a list of the same numbers, and it can be handed to code
+    that reads the buffer protocol without copying it.
+
+    """
+
+    typecode = None
+
+    def __init__(self, typecode=None, **kwargs):
+        """Sets the type of the list's numbers.
+
+        Optional parameter `typecode` is the `array` type code of the
+        numbers, overriding the class's `typecode`. For instance, a
+        `FloatList` with a `typecode` of ``'f'`` keeps its numbers in single
+        precision.
+
+        """
+        super(ArrayList, self).__init__(Field(), **kwargs)
+        if typecode is not None:
+            self.typecode = typecode
+
+    def decode(self, value):
+        """Decodes the dictionary value (a list of numbers) into a
+        `DataObject` attribute (an `array.array` of those numbers)."""
+        if value is None:
+            return super(ArrayList, self).decode(value)
+        try:
+            return array(self.typecode, value)
+        except (TypeError, OverflowError), exc:
+            raise TypeError('Value to decode %r is not a list of numbers of '
+                'array type %r: %s' % (value, self.typecode, exc))
+
+    def encode(self, value):
+        """Encodes a `DataObject` attribute (an `array.array` or other
+        sequence of numbers) into a dictionary value (a list of numbers)."""
+        if isinstance(value, array):
+            return value.tolist()
+        return list(value)
+
+
+class IntList(ArrayList):
+
+    """A field representing a list of integers, decoded into an
+    `array.array` of C ``long`` values."""
+
+    typecode = 'l'
+
+
+class FloatList(ArrayList):
+
+    """A field representing a list of numbers, decoded into an
+    `array.array` of C ``double`` values."""
+
+    typecode = 'd'
 
 
 class Dict(List):
@@ -300,9 +877,15 @@ class Dict(List):
 
     """
 
-    def __init__(self, **kwargs):
-        """Sets the default to an empty dictionary."""
-        super(Dict, self).__init__(default={}, **kwargs)
+    def __init__(self, fld, **kwargs):
+        """Sets the default to an empty dictionary.
+
+        If optional parameter `lazy` is true, the field decodes into a
+        `LazyDict` instead of a plain dictionary.
+
+        """
+        kwargs.setdefault('default', {})
+        super(Dict, self).__init__(fld, **kwargs)
 
     def decode(self, value):
         """Decodes the dictionary value (a dictionary with dictionary values
@@ -312,20 +895,102 @@ class Dict(List):
             if callable(self.default):
                 return self.default()
             return self.default
-        return dict((k, self.fld.decode(v)) for k, v in value.iteritems())
+        if self.lazy:
+            return LazyDict(self.fld, value)
+        decode = self.fld.decode
+        return dict((k, decode(v)) for k, v in value.iteritems())
 
     def encode(self, value):
         """Encodes a `DataObject` attribute (a dictionary with decoded
         `DataObject` attribute values for values) into a dictionary value (a
         dictionary with encoded dictionary values for values)."""
-        return dict((k, self.fld.encode(v)) for k, v in value.iteritems())
+        if isinstance(value, LazyDict) and value._fld is self.fld:
+            return value.encode()
+        encode = self.fld.encode
+        return dict((k, encode(v)) for k, v in value.iteritems())
 
+    def project_data(self, value, projection):
+        if value is None:
+            return value
+        project_data = self.fld.project_data
+        return dict((k, project_data(v, projection))
+            for k, v in value.iteritems())
+
+    def project(self, value, projection):
+        for v in value.itervalues():
+            self.fld.project(v, projection)
 
-class Object(Field):
 
-    """A field representing a nested `DataObject`."""
+class Columns(List):
+
+    """A field representing a list of `DataObject` instances, decoded column
+    by column into a `remoteobjects.columns.ColumnStore`.
+
+    Use a `Columns` field in place of a `List` of `Object` fields when there
+    are many items and only some of their fields are used at a time.
+
+    """
 
     def __init__(self, cls, **kwargs):
+        """Sets the `DataObject` class of the list's items.
+
+        Parameter `cls` is the class or class name, as for an `Object`
+        field.
+
+        """
+        kwargs.setdefault('default', None)
+        super(Columns, self).__init__(Object(cls), **kwargs)
+
+    def decode(self, value):
+        if value is None:
+            return super(Columns, self).decode(value)
+        return remoteobjects.columns.ColumnStore.from_dicts(self.fld.cls, value)
+
+    def encode(self, value):
+        return value.to_dicts()
+
+    def project(self, value, projection):
+        for name in value.columns.keys():
+            if name not in projection:
+                del value.columns[name]
+
+
+class Object(Field):
+
+    """A field representing a nested `DataObject`.
+
+    An `Object` field can also be polymorphic: given a `discriminator`, each
+    value is decoded into the subclass of the field's class that declares a
+    matching `Constant` field. For example:
+
+    >>> class Asset(RemoteObject):
+    ...     name = fields.Field()
+    ...
+    >>> class Post(Asset):
+    ...     kind = fields.Constant('post')
+    ...
+    >>> class Photo(Asset):
+    ...     kind = fields.Constant('photo')
+    ...
+    >>> class Feed(RemoteObject):
+    ...     entries = fields.List(fields.Object(Asset, discriminator='kind'))
+
+    Here each of a ``Feed`` instance's ``entries`` will be a ``Post`` or a
+    ``Photo`` according to its ``kind`` value, or a plain ``Asset`` if its
+    ``kind`` matches no subclass.
+
+    `Object` fields also decode references to objects included elsewhere in
+    a normalized response, when the response's class sets an
+    `included_key`. A reference is a dictionary with a ``$ref`` key whose
+    value is the referenced object's ``id``, or, for fields declared with
+    ``by_id=True``, the id itself. All references to the same id decode
+    into the same instance. See `remoteobjects.dataobject.References`.
+
+    """
+
+    decodes_objects = True
+
+    def __init__(self, cls, discriminator=None, by_id=False, **kwargs):
         """Sets the the `DataObject` class the field represents.
 
         Parameter `cls` is the `DataObject` class representing the nested
@@ -338,9 +1003,22 @@ class Object(Field):
         another module will make all name-based `Object` fields reference the
         new subclass.
 
+        Optional parameter `discriminator` is the name of a `Constant` field
+        declared on subclasses of `cls`. If given, values are decoded into
+        the subclass whose `Constant` field matches the value's content, as
+        found through `DataObject.subclass_with_constant_field()`.
+
+        If optional parameter `by_id` is true, values are the ids of objects
+        included in the response, instead of the objects' dictionaries.
+        Decoding an id raises `ValueError` if the object isn't being decoded
+        from a response with an `included_key`, as there's nothing to look
+        the id up in.
+
         """
         super(Object, self).__init__(**kwargs)
         self.cls = cls
+        self.discriminator = discriminator
+        self.by_id = by_id
 
     def get_cls(self):
         cls = self.__dict__['cls']
@@ -355,29 +1033,182 @@ class Object(Field):
 
     def decode(self, value):
         """Decodes the dictionary value into an instance of the `DataObject`
-        class the field references."""
+        class the field references.
+
+        If the field has a `discriminator`, the instance will be of the
+        subclass indexed by the value's discriminator content instead, when
+        there is one.
+
+        If the value is a reference to an included object, the shared
+        instance of that object is returned instead.
+
+        """
         if value is None:
             if callable(self.default):
                 return self.default()
             return self.default
-        return self.cls.from_dict(value)
+
+        references = current_references()
+        if self.by_id and (references is None or not references.included):
+            raise ValueError('Cannot resolve id %r for field %r without the '
+                'included objects of a response; set the included_key of '
+                'the class decoding it' % (value, self.attrname))
+        if references is None:
+            return self.cls_for(value).from_dict(value)
+
+        if self.by_id:
+            return references.resolve(value, self)
+        ident = references.reference_id(value)
+        if ident is not None:
+            return references.resolve(ident, self)
+        cls = self.cls_for(value)
+        if cls.identity_key is not None and isinstance(value, dict):
+            return references.identify(cls, value)
+        return cls.from_dict(value)
+
+    def cls_for(self, value):
+        """Returns the `DataObject` class into which the dictionary value
+        `value` should be decoded.
+
+        This is the field's class or, for a field with a `discriminator`,
+        the subclass matching the value's discriminator content.
+
+        """
+        cls = self.cls
+        discriminator = self.discriminator
+        if discriminator is not None:
+            try:
+                field = cls.fields[discriminator]
+            except KeyError:
+                key = discriminator
+            else:
+                key = field.api_name
+            try:
+                cls = cls._constant_index[discriminator][
+                    remoteobjects.dataobject.constant_key(value[key])]
+            except (KeyError, TypeError):
+                # Decode anything unrecognized as the base class.
+                pass
+        return cls
 
     def encode(self, value):
         """Encodes an instance of the field's DataObject class into its
-        representative dictionary value."""
+        representative dictionary value.
+
+        Instances that were decoded from references are encoded as
+        references again, so shared and cyclic objects aren't copied.
+
+        """
+        reference = value._reference
+        if reference is not None:
+            reference_key, ident = reference
+            if self.by_id:
+                return ident
+            return {reference_key: ident}
         return value.to_dict()
 
+    def merge(self, value, data, partial=False):
+        if not isinstance(value, remoteobjects.dataobject.DataObject):
+            return False
+        if not isinstance(data, collections.Mapping):
+            return False
+        if value._reference is not None:
+            # Shared included objects are merged only through references.
+            return False
+        if value.identity_key is not None:
+            # Objects with an identity may be shared with other objects, so
+            # they're replaced rather than changed under them.
+            return False
+        if type(value) is not self.cls_for(data):
+            return False
+        value.merge_from_dict(data, partial)
+        return True
+
+    def project_data(self, value, projection):
+        if not isinstance(value, collections.Mapping):
+            return value
+        cls = self.cls_for(value)
+        if self.discriminator in cls.fields:
+            # Keep the data that selects the subclass to decode into.
+            projection = dict(projection)
+            projection.setdefault(self.discriminator, None)
+        return cls.project_data(value, projection)
+
+    def project(self, value, projection):
+        if isinstance(value, remoteobjects.dataobject.DataObject):
+            if self.discriminator in value.fields:
+                projection = dict(projection)
+                projection.setdefault(self.discriminator, None)
+            value._projection = projection
+            value._apply_projection()
+
+    def object_classes(self):
+        cls = self.cls
+        classes = [cls]
+        if self.discriminator is not None:
+            classes.extend(
+                cls._constant_index.get(self.discriminator, {}).values())
+        return classes
+
+    def nested_fields(self, projection=None, seen=()):
+        cls = self.cls
+        if cls in seen:
+            return None
+        if self.discriminator is not None and projection is None:
+            # Subclasses may have more fields, so ask for everything.
+            return None
+        return cls.field_tree(projection, seen) or None
+
+
+_iso_timestamp = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z\Z')
+_epoch = datetime(1970, 1, 1)
+
 
 class Datetime(Field):
 
-    """A field representing a timestamp."""
+    """A field representing a timestamp.
+
+    Decoded timestamps are remembered by their strings, so a timestamp that
+    recurs (as across the items of a list) is parsed only once. Up to
+    `cache_size` timestamps are remembered per field.
+
+    """
 
     dateformat = "%Y-%m-%dT%H:%M:%SZ"
+    cache_size = 4096
+
+    def __init__(self, dateformat=None, compact=False, **kwargs):
+        """Sets the field's parameters.
+
+        Optional parameter `dateformat` is the `time.strptime()` format of
+        the field's timestamp strings. If `compact` is true, decoded values
+        are stored on instances as seconds since the epoch, and turned back
+        into `datetime` instances each time they're used.
 
-    def __init__(self, dateformat=None, **kwargs):
+        """
         super(Datetime, self).__init__(**kwargs)
         if dateformat is not None:
             self.dateformat = dateformat
+        self.compact = compact
+        self._cache = {}
+
+    def __get__(self, obj, cls):
+        if obj is None or not self.compact:
+            return super(Datetime, self).__get__(obj, cls)
+
+        try:
+            value = self._stored(obj)
+        except KeyError:
+            value = super(Datetime, self).__get__(obj, cls)
+            if isinstance(value, datetime) and value.tzinfo is None:
+                self._store(obj, calendar.timegm(value.timetuple()))
+            return value
+        return self._from_stored(value)
+
+    def _from_stored(self, value):
+        if self.compact and isinstance(value, (int, long)):
+            return _epoch + timedelta(seconds=value)
+        return value
 
     def decode(self, value):
         """Decodes a timestamp string into a `DataObject` attribute (a Python
@@ -391,11 +1222,31 @@ class Datetime(Field):
             if callable(self.default):
                 return self.default()
             return self.default
+
+        cache = self._cache
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+        except TypeError:
+            raise TypeError('Value to decode %r is not a valid date time stamp' % (value,))
+
         try:
-            return datetime(*(time.strptime(value, self.dateformat))[0:6])
+            match = None
+            if self.dateformat == Datetime.dateformat:
+                match = _iso_timestamp.match(value)
+            if match is not None:
+                decoded = datetime(*[int(x) for x in match.groups()])
+            else:
+                decoded = datetime(*(time.strptime(value, self.dateformat))[0:6])
         except (TypeError, ValueError):
             raise TypeError('Value to decode %r is not a valid date time stamp' % (value,))
 
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[value] = decoded
+        return decoded
+
     def encode(self, value):
         """Encodes a `DataObject` attribute (a Python `datetime` instance)
         into a timestamp string.
@@ -411,6 +1262,144 @@ class Datetime(Field):
         return value.replace(microsecond=0).strftime(self.dateformat)
 
 
+class Blob(str):
+
+    """A byte string decoded from base64 text by a `Base64` field."""
+
+    pass
+
+
+class Base64(Field):
+
+    """A field representing binary data, such as an image or a signature,
+    encoded as a base64 string.
+
+    Values decode into `Blob` byte strings, which can be read without
+    copying through `buffer()` or `memoryview()`. As with other fields,
+    each value is decoded only the first time it's used. Once decoded, the
+    base64 text is removed from the instance's API data (as for the
+    `release_api_data` option), so the value isn't kept twice, and it's
+    encoded again by `to_dict()`.
+
+    Values of at least `spill_size` bytes are instead decoded into an
+    anonymous temporary file, and read through a read-only `mmap.mmap`,
+    so they take no room on the heap.
+
+    """
+
+    def __init__(self, urlsafe=False, spill_size=None, release=True, **kwargs):
+        """Sets the field's parameters.
+
+        If optional parameter `urlsafe` is true, values use the URL-safe
+        base64 alphabet, with ``-`` and ``_`` in place of ``+`` and ``/``.
+        Optional parameter `spill_size` is the size in bytes at which values
+        are decoded into memory-mapped temporary files. By default, values
+        are never spilled. If optional parameter `release` is false, the
+        base64 text is kept in the API data after the value is decoded.
+
+        """
+        super(Base64, self).__init__(**kwargs)
+        self.urlsafe = urlsafe
+        self.spill_size = spill_size
+        self.release_data = release
+
+    def decode(self, value):
+        """Decodes a base64 string into a `DataObject` attribute (a `Blob`
+        byte string, or an `mmap.mmap` of a large value)."""
+        if value is None:
+            if callable(self.default):
+                return self.default()
+            return self.default
+
+        try:
+            if self.urlsafe:
+                data = base64.urlsafe_b64decode(value)
+            else:
+                data = base64.b64decode(value)
+        except (TypeError, ValueError, binascii.Error), exc:
+            raise TypeError('Value to decode %r is not a valid base64 string: %s'
+                % (value, exc))
+
+        if self.spill_size is not None and data and len(data) >= self.spill_size:
+            return self.spill(data)
+
+        return Blob(data)
+
+    def spill(self, data):
+        """Writes the byte string `data` to a temporary file, and returns a
+        read-only `mmap.mmap` of the file."""
+        spillfile = tempfile.TemporaryFile()
+        try:
+            spillfile.write(data)
+            spillfile.flush()
+            return mmap.mmap(spillfile.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            # The map keeps the file's data even once the file is closed.
+            spillfile.close()
+
+    def encode(self, value):
+        """Encodes a `DataObject` attribute (a byte string, `mmap.mmap` or
+        other buffer) into a base64 string."""
+        if isinstance(value, mmap.mmap):
+            value = value[:]
+        elif not isinstance(value, str):
+            try:
+                value = str(buffer(value))
+            except TypeError:
+                raise TypeError('Value to encode %r is not a byte string or buffer'
+                    % (value,))
+        if self.urlsafe:
+            return base64.urlsafe_b64encode(value)
+        return base64.b64encode(value)
+
+
+class SlotStorage(object):
+
+    """A mixin for `Field` classes that stores decoded values in a slot of
+    the instance instead of in its ``__dict__``.
+
+    `DataObject` classes with the `compact_storage` option use copies of
+    their fields that include this mixin. The metaclass sets each field's
+    `slot` attribute to the slot's member descriptor.
+
+    """
+
+    slot = None
+
+    def _stored(self, obj):
+        try:
+            return self.slot.__get__(obj)
+        except AttributeError:
+            raise KeyError(self.attrname)
+
+    def _store(self, obj, value):
+        self.slot.__set__(obj, value)
+
+    def _unstore(self, obj):
+        try:
+            self.slot.__delete__(obj)
+        except AttributeError:
+            pass
+
+
+_slot_classes = {}
+
+
+def slot_storage_class(fieldcls):
+    """Returns the subclass of the `Field` class `fieldcls` that stores
+    decoded values in slots, as for `SlotStorage`."""
+    try:
+        return _slot_classes[fieldcls]
+    except KeyError:
+        pass
+    if issubclass(fieldcls, SlotStorage):
+        return fieldcls
+    slotcls = type(fieldcls.__name__, (SlotStorage, fieldcls),
+        {'__module__': fieldcls.__module__})
+    _slot_classes[fieldcls] = slotcls
+    return slotcls
+
+
 class Link(Property):
 
     """A `RemoteObject` property representing a link from one `RemoteObject`
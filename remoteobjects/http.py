@@ -27,14 +27,17 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import simplejson as json
-from remoteobjects.json import ForgivingDecoder
+from remoteobjects.json import loads_lazy
+from remoteobjects import codec
 
 import httplib2
 import httplib
 import logging
+import urllib
+import urlparse
 
 from remoteobjects.dataobject import DataObject, DataObjectMetaclass
+from remoteobjects.dataobject import parse_projection
 from remoteobjects import fields
 
 userAgent = httplib2.Http()
@@ -42,6 +45,23 @@ userAgent = httplib2.Http()
 log = logging.getLogger('remoteobjects.http')
 
 
+def update_query(url, args):
+    """Returns `url` with the query parameters in the dictionary `args`
+    added to its query string, replacing any parameters of the same names.
+
+    Parameters given more than once in `url`, such as ``fields=a&fields=b``,
+    are kept as they are unless replaced. Values in `args` that are lists
+    or tuples are added as repeated parameters.
+    """
+    parts = list(urlparse.urlparse(url))
+    queryargs = [(k, v) for k, v in
+        urlparse.parse_qsl(parts[4], keep_blank_values=True)
+        if k not in args]
+    queryargs.extend(sorted(args.iteritems()))
+    parts[4] = urllib.urlencode(queryargs, doseq=True)
+    return urlparse.urlunparse(parts)
+
+
 def omit_nulls(data):
     """Strips `None` values from a dictionary or `RemoteObject` instance."""
     if not isinstance(data, dict):
@@ -82,8 +102,15 @@ class HttpObject(DataObject):
         httplib.FOUND:             True,
     }
 
+    # The media types of the codecs in `remoteobjects.codec` with which
+    # responses can be decoded, in order of preference.
     content_types = ('application/json',)
 
+    lazy_documents = False
+
+    partial_response_param = None
+    partial_response_separator = '/'
+
     class NotFound(httplib.HTTPException):
         """An HTTPException thrown when the server reports that the requested
         resource was not found."""
@@ -148,6 +175,10 @@ class HttpObject(DataObject):
         self._location = None
         super(HttpObject, self).__init__(**kwargs)
 
+    _internal_slots = ('_location', '_etag')
+
+    merge_updates = False
+
     @classmethod
     def statefields(cls):
         return super(HttpObject, cls).statefields() + ['_location', '_etag']
@@ -161,6 +192,13 @@ class HttpObject(DataObject):
         headers. Other optional keyword parameters are also included as
         specified.
 
+        If the class's `partial_response_param` attribute is set, ``GET``
+        requests ask the server for only the fields the class declares (or
+        the instance's projection selects) by adding a query parameter of
+        that name, as built by `partial_response_value()`. The parameter is
+        left out of the instance's location once it's updated from the
+        response, so other requests aren't sent with it.
+
         """
         if url is None:
             url = self._location
@@ -168,12 +206,78 @@ class HttpObject(DataObject):
             headers = {}
         if 'accept' not in headers:
             headers['accept'] = ', '.join(self.content_types)
+        if (self.partial_response_param is not None
+            and kwargs.get('method', 'GET') == 'GET'):
+            value = self.partial_response_value(self._projection)
+            if value:
+                url = update_query(url, {self.partial_response_param: value})
 
         # Use 'uri' because httplib2.request does.
         request = dict(uri=url, headers=headers)
         request.update(kwargs)
         return request
 
+    @classmethod
+    def partial_response_value(cls, projection=None):
+        """Returns the value of the query parameter that asks the server for
+        a partial response of only the fields this class declares.
+
+        The value lists the API names of the fields separated by commas. The
+        fields of nested objects are included as paths joined by the class's
+        `partial_response_separator` (such as ``author/name``). If the
+        separator is `None`, nested fields are instead grouped in
+        parentheses after their parent field (as in ``author(id,name)``).
+
+        If optional parameter `projection` is given, only the fields it
+        selects are included. Override this method to build the parameter
+        for other syntaxes.
+
+        """
+        tree = cls.partial_response_tree(projection)
+        separator = cls.partial_response_separator
+
+        def paths(tree, prefix):
+            for name, sub in sorted(tree.iteritems()):
+                if sub:
+                    for path in paths(sub, prefix + name + separator):
+                        yield path
+                else:
+                    yield prefix + name
+
+        def groups(tree):
+            for name, sub in sorted(tree.iteritems()):
+                if sub:
+                    yield '%s(%s)' % (name, ','.join(groups(sub)))
+                else:
+                    yield name
+
+        if separator is None:
+            return ','.join(groups(tree))
+        return ','.join(paths(tree, ''))
+
+    @classmethod
+    def partial_response_tree(cls, projection=None):
+        """Returns the tree of the API names of the fields to ask for in a
+        partial response, as for `DataObject.field_tree()`.
+
+        This implementation returns the class's own field tree. Classes whose
+        responses aren't a dictionary of their fields override this method.
+
+        """
+        return cls.field_tree(projection)
+
+    def _resource_url(self, url):
+        """Returns the URL `url` of a request for this instance without any
+        query parameter asking for a partial response, so that requests to
+        change or delete the resource aren't sent to it."""
+        name = self.partial_response_param
+        if name is None or url is None:
+            return url
+        query = urlparse.urlparse(url)[4]
+        if name not in dict(urlparse.parse_qsl(query, keep_blank_values=True)):
+            return url
+        return update_query(url, {name: ()})
+
     @classmethod
     def raise_for_response(cls, url, response, content):
         """Raises exceptions corresponding to invalid HTTP responses that
@@ -235,12 +339,24 @@ class HttpObject(DataObject):
             # then there's no content-type either, so we're done
             return
 
-        # check that the response body was json
+        # check that the response body is of a type we accept
         content_type = response.get('content-type', '').split(';', 1)[0].strip()
         if content_type not in cls.content_types:
             raise cls.BadResponse(
                 'Bad response fetching %s %s: content-type %s is not an expected type'
                 % (classname, url, response.get('content-type')))
+        try:
+            codec.lookup(content_type)
+        except LookupError:
+            raise cls.BadResponse(
+                'Bad response fetching %s %s: content-type %s has no registered codec'
+                % (classname, url, response.get('content-type')))
+
+    def _merges_response(self):
+        """Returns whether the data of a response should be merged into the
+        instance, as for the `merge_updates` option, rather than replace its
+        content."""
+        return self.merge_updates
 
     def update_from_response(self, url, response, content):
         """Adds the content of this HTTP response and message body to this
@@ -259,37 +375,90 @@ class HttpObject(DataObject):
         (depending on the response status), the location of the `RemoteObject`
         instance is updated as well.
 
+        The response's message body is decoded by the instance's
+        `decode_response()` method. If the class's `merge_updates` attribute
+        is true, the data is merged into the instance as by
+        `DataObject.merge_from_dict()`, so decoded values of fields whose
+        data didn't change are kept.
+
         """
         self.raise_for_response(url, response, content)
 
-        try:
-            data = json.loads(content)
-        except UnicodeDecodeError:
-            data = json.loads(content, cls=ForgivingDecoder)
+        data = self.decode_response(response, content)
 
-        self.update_from_dict(data)
+        if self._projection is not None:
+            data = self.project_data(data, self._projection)
+        if self._merges_response():
+            self.merge_from_dict(data)
+        else:
+            self.update_from_dict(data)
 
         location_header = self.location_headers.get(response.status)
         if location_header is None:
-            self._location = url
+            location = url
         elif self.location_header_required.get(response.status):
-            self._location = response[location_header.lower()]
+            location = response[location_header.lower()]
         else:
-            self._location = response.get(location_header.lower(), url)
+            location = response.get(location_header.lower(), url)
+        self._location = self._resource_url(location)
 
         if 'etag' in response:
             self._etag = response['etag']
 
+    def decode_response(self, response, content):
+        """Returns the data decoded from the message body `content` of the
+        HTTP response `response`.
+
+        The content is decoded by the codec registered in `remoteobjects.codec`
+        for the response's media type. Content of media types with no
+        registered codec raises `BadResponse`.
+
+        If the class's `lazy_documents` attribute is true, a JSON response
+        that is an object is decoded into a `remoteobjects.json.LazyDocument`.
+
+        """
+        try:
+            decoder = codec.lookup(response.get('content-type', ''))
+        except LookupError:
+            raise self.BadResponse('Cannot decode %s response content of '
+                'content-type %s, which has no registered codec'
+                % (type(self).__name__, response.get('content-type')))
+        if decoder is codec.JSON and self.lazy_documents:
+            return loads_lazy(content)
+        return decoder.loads(content)
+
     @classmethod
-    def get(cls, url, http=None, **kwargs):
+    def request_codec(cls):
+        """Returns the media type and `remoteobjects.codec.Codec` with which
+        to encode request bodies for this class.
+
+        The media type is the first of the class's `content_types` with a
+        registered codec. If none of them has one, request bodies are
+        encoded as JSON labeled with the first of the `content_types`.
+
+        """
+        for media_type in cls.content_types:
+            try:
+                return media_type, codec.lookup(media_type)
+            except LookupError:
+                pass
+        return cls.content_types[0], codec.JSON
+
+    @classmethod
+    def get(cls, url, http=None, only=None, **kwargs):
         """Fetches a new `RemoteObject` instance from a URL.
 
         Parameter `url` is the URL from which the object should be requested.
         Optional parameter `http` is the user agent object to use for
         fetching. `http` should be compatible with `httplib2.Http` instances.
 
+        Optional parameter `only` is a sequence of the names of the fields
+        to keep from the response, as for `DataObject.project()`.
+
         """
         self = cls()
+        if only is not None:
+            self._projection = parse_projection(only)
         request = self.get_request(url=url, **kwargs)
 
         if http is None:
@@ -315,9 +484,10 @@ class HttpObject(DataObject):
             raise ValueError('Cannot add %r to %r with no URL to POST to'
                 % (obj, self))
 
-        body = json.dumps(obj.to_dict(), default=omit_nulls)
+        content_type, encoder = self.request_codec()
+        body = encoder.dumps(obj.to_dict(), default=omit_nulls)
 
-        headers = {'content-type': self.content_types[0]}
+        headers = {'content-type': content_type}
 
         request = obj.get_request(url=self._location, method='POST',
             body=body, headers=headers)
@@ -338,12 +508,13 @@ class HttpObject(DataObject):
         if getattr(self, '_location', None) is None:
             raise ValueError('Cannot save %r with no URL to PUT to' % self)
 
-        body = json.dumps(self.to_dict(), default=omit_nulls)
+        content_type, encoder = self.request_codec()
+        body = encoder.dumps(self.to_dict(), default=omit_nulls)
 
         headers = {}
         if hasattr(self, '_etag') and self._etag is not None:
             headers['if-match'] = self._etag
-        headers['content-type'] = self.content_types[0]
+        headers['content-type'] = content_type
 
         request = self.get_request(method='PUT', body=body, headers=headers)
         if http is None:
@@ -27,10 +27,17 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import collections
+from copy import deepcopy
+import hashlib
+from itertools import islice
+import re
+
+import simplejson
 from simplejson import JSONDecoder
 from simplejson.decoder import FLAGS, BACKSLASH, STRINGCHUNK, DEFAULT_ENCODING
+from simplejson.decoder import scanstring
 from simplejson.scanner import py_make_scanner
-import re
 
 
 # Truly heinous... we are going to the trouble of reproducing this
@@ -118,3 +125,506 @@ class ForgivingDecoder(JSONDecoder):
         super(ForgivingDecoder, self).__init__(*args, **kwargs)
         self.parse_string = forgiving_scanstring
         self.scan_once = py_make_scanner(self)
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+STRUCTURE = re.compile(r'["{}\[\]]')
+SCALAR = re.compile(r'[^,:{}\[\]"\s]+')
+
+
+class IncompleteJSONError(ValueError):
+    """A ValueError raised when JSON text ends before the value being read
+    from it does."""
+    pass
+
+
+def skip_value(s, pos):
+    """Finds the end of the JSON value in `s` starting at index `pos`,
+    without decoding it.
+
+    Returns the index of the character after the value. Raises
+    `IncompleteJSONError` if `s` ends before the value does. Only the
+    structure of the value is checked, so malformed content inside a
+    container is not reported until the value is actually decoded.
+
+    """
+    pos = WHITESPACE.match(s, pos).end()
+    try:
+        char = s[pos]
+    except IndexError:
+        raise IncompleteJSONError('Expecting value at %d' % pos)
+
+    if char == '"':
+        match = STRING.match(s, pos)
+        if match is None:
+            raise IncompleteJSONError('Unterminated string starting at %d' % pos)
+        return match.end()
+
+    if char == '{' or char == '[':
+        begin, depth = pos, 0
+        search, string = STRUCTURE.search, STRING.match
+        while True:
+            match = search(s, pos)
+            if match is None:
+                raise IncompleteJSONError('Unterminated value starting at %d' % begin)
+            char = match.group()
+            if char == '"':
+                match = string(s, match.start())
+                if match is None:
+                    raise IncompleteJSONError('Unterminated value starting at %d' % begin)
+            elif char == '{' or char == '[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+            pos = match.end()
+
+    match = SCALAR.match(s, pos)
+    if match is None:
+        raise ValueError('Expecting value at %d' % pos)
+    return match.end()
+
+
+def index_object(s, pos=0):
+    """Finds the member values of the JSON object in `s` starting at index
+    `pos`, without decoding them.
+
+    Returns a tuple of a dictionary of member names to the ``(start, end)``
+    indexes of their values in `s`, and the index of the first character
+    after the object that isn't whitespace.
+
+    """
+    ws = WHITESPACE.match
+    pos = ws(s, pos).end()
+    if s[pos:pos + 1] != '{':
+        raise ValueError('Expecting object at %d' % pos)
+    pos = ws(s, pos + 1).end()
+    index = {}
+    if s[pos:pos + 1] == '}':
+        return index, ws(s, pos + 1).end()
+
+    while True:
+        if s[pos:pos + 1] != '"':
+            raise ValueError('Expecting property name at %d' % pos)
+        try:
+            key, pos = scanstring(s, pos + 1)
+        except UnicodeDecodeError:
+            key, pos = forgiving_scanstring(s, pos + 1)
+        pos = ws(s, pos).end()
+        if s[pos:pos + 1] != ':':
+            raise ValueError('Expecting : delimiter at %d' % pos)
+        start = ws(s, pos + 1).end()
+        end = skip_value(s, start)
+        index[key] = (start, end)
+
+        pos = ws(s, end).end()
+        char = s[pos:pos + 1]
+        pos = ws(s, pos + 1).end()
+        if char == '}':
+            return index, pos
+        if char != ',':
+            raise ValueError('Expecting , delimiter at %d' % pos)
+
+
+_scan_once = JSONDecoder().scan_once
+_forgiving_scan_once = ForgivingDecoder().scan_once
+
+
+def decode_value(s, pos):
+    """Decodes the JSON value in `s` starting at index `pos`.
+
+    Text that isn't valid in its encoding is decoded as with
+    `ForgivingDecoder`.
+
+    """
+    return _decode_at(s, pos)[0]
+
+
+def _decode_at(s, pos):
+    """Decodes the JSON value in `s` starting at index `pos`, as for
+    `decode_value()`, returning a tuple of the value and the index of the
+    character after it."""
+    try:
+        try:
+            return _scan_once(s, pos)
+        except UnicodeDecodeError:
+            return _forgiving_scan_once(s, pos)
+    except StopIteration:
+        raise ValueError('No JSON object could be decoded at %d' % pos)
+
+
+class LazyDocument(collections.MutableMapping):
+
+    """A mapping of a JSON object's members that decodes each member value
+    only when it's used.
+
+    A `LazyDocument` keeps the original JSON text and the positions of its
+    member values in it. Each value is decoded the first time it's used;
+    once every value has been decoded, the original text is released.
+
+    """
+
+    def __init__(self, content, pos=0):
+        """Indexes the JSON object in the string `content`.
+
+        Optional parameter `pos` is the index in `content` at which the
+        object starts. Raises `ValueError` if `content` does not contain a
+        JSON object at that position, or contains anything but whitespace
+        after it.
+
+        """
+        self._offsets, end = index_object(content, pos)
+        if end != len(content):
+            raise ValueError('Extra data at %d' % end)
+        self._content = content if self._offsets else None
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values) + len(self._offsets)
+
+    def __contains__(self, key):
+        return key in self._values or key in self._offsets
+
+    def __iter__(self):
+        for key in self._values:
+            yield key
+        for key in self._offsets.keys():
+            yield key
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        start, end = self._offsets[key]
+        value = decode_value(self._content, start)
+        self._values[key] = value
+        del self._offsets[key]
+        if not self._offsets:
+            self._content = None
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+        if self._offsets.pop(key, None) is not None and not self._offsets:
+            self._content = None
+
+    def __delitem__(self, key):
+        try:
+            del self._values[key]
+        except KeyError:
+            del self._offsets[key]
+            if not self._offsets:
+                self._content = None
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def __deepcopy__(self, memo):
+        # Decode undecoded values straight into the copy, leaving them
+        # undecoded here.
+        data = deepcopy(self._values, memo)
+        for key, (start, end) in self._offsets.iteritems():
+            data[key] = decode_value(self._content, start)
+        return data
+
+    def __reduce__(self):
+        return (dict, (dict(self.iteritems()),))
+
+    def source(self, key):
+        """Returns the JSON source text of the member `key` as a `buffer`
+        sharing the original content, without copying or decoding it.
+
+        The text is the value as written in the JSON document, so strings
+        keep their quotes and escapes. Only values that have not been
+        decoded yet are available this way; for other keys, `source()`
+        raises `KeyError`.
+
+        """
+        start, end = self._offsets[key]
+        return buffer(self._content, start, end - start)
+
+    def undecoded(self):
+        """Returns a list of the keys of the members whose values have not
+        been decoded yet."""
+        return self._offsets.keys()
+
+
+def loads_lazy(content):
+    """Decodes JSON text, deferring the decoding of the member values of a
+    top-level object until they're used.
+
+    If `content` is a JSON object, returns a `LazyDocument`. Otherwise
+    `content` is decoded as usual.
+
+    """
+    pos = WHITESPACE.match(content).end()
+    if content[pos:pos + 1] == '{':
+        return LazyDocument(content, pos)
+    return decode_value(content, pos)
+
+
+class StreamDecoder(object):
+
+    """Decodes JSON text incrementally as it's read from a file-like object.
+
+    A `StreamDecoder` keeps only the text of the value it's currently
+    reading, so the elements of a large array or the members of a large
+    object can be decoded one at a time in bounded memory.
+
+    """
+
+    def __init__(self, fp, chunk_size=65536):
+        """Reads JSON text from `fp`, a file-like object with a `read()`
+        method, `chunk_size` bytes at a time."""
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Reads more text into the buffer, discarding the text already used.
+        Returns `False` if there was no more text to read.
+
+        At least a chunk is read, or as much as is already buffered, so the
+        buffer grows geometrically while a large value is read and copying
+        it stays linear in its size.
+
+        """
+        if self.eof:
+            return False
+        chunk = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _value_end(self):
+        """Returns the index in the buffer of the end of the value at the
+        current position, reading more text until the whole value is
+        buffered."""
+        if self.peek() in ('{', '['):
+            return self._container_end()
+        while True:
+            try:
+                end = skip_value(self.buf, self.pos)
+            except IncompleteJSONError:
+                if not self._fill():
+                    raise
+                continue
+            # A scalar at the end of the buffer may continue in the next
+            # chunk, so make sure there's something after it.
+            if end < len(self.buf) or not self._fill():
+                return end
+
+    def _container_end(self):
+        """Returns the index in the buffer of the end of the object or array
+        at the current position, as for `_value_end()`.
+
+        As more text is read, scanning resumes where it stopped instead of
+        from the start of the container, so reading a container split over
+        many chunks takes time linear in its size.
+
+        """
+        search, string = STRUCTURE.search, STRING.match
+        scan, depth = self.pos, 0
+        while True:
+            match = search(self.buf, scan)
+            if match is not None:
+                char = match.group()
+                if char == '"':
+                    end = string(self.buf, match.start())
+                    if end is not None:
+                        scan = end.end()
+                        continue
+                    # Scan the string again once more of it is read.
+                    scan = match.start()
+                else:
+                    scan = match.end()
+                    if char == '{' or char == '[':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return scan
+                    continue
+            else:
+                scan = len(self.buf)
+
+            offset = scan - self.pos
+            start = self.pos
+            if not self._fill():
+                raise IncompleteJSONError('Unterminated value starting at %d'
+                    % start)
+            scan = self.pos + offset
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expecting %r at %d' % (char, self.pos))
+        self.pos += 1
+
+    def _delimiter(self, close):
+        """Reads the delimiter after a member or element, returning `True`
+        if it closes the container."""
+        char = self.peek()
+        self.pos += 1
+        if char == close:
+            return True
+        if char != ',':
+            raise ValueError('Expecting , delimiter at %d' % (self.pos - 1))
+        return False
+
+    def peek(self):
+        """Returns the next character that isn't whitespace, without
+        consuming it, or the empty string at the end of the text."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def value(self):
+        """Decodes and returns the next value."""
+        end = self._value_end()
+        value = decode_value(self.buf, self.pos)
+        self.pos = end
+        return value
+
+    def skip(self):
+        """Skips the next value without decoding it."""
+        self.pos = self._value_end()
+
+    def iter_array(self):
+        """Yields the decoded elements of the array at the current position
+        one at a time."""
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._delimiter(']'):
+                return
+
+    def iter_members(self):
+        """Yields the names of the members of the object at the current
+        position one at a time.
+
+        After each name is yielded, the caller must read the member's value
+        with `value()`, `skip()` or `iter_array()` before asking for the
+        next name.
+
+        """
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError('Expecting property name at %d' % self.pos)
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._delimiter('}'):
+                return
+
+
+def iter_lines(fp, chunk_size=65536):
+    """Yields each line of the text read from the file-like object `fp`,
+    `chunk_size` bytes at a time, without its line ending."""
+    rest = ''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def decode_line(line):
+    """Decodes one line of newline-delimited JSON text.
+
+    Raises `ValueError` if the line contains anything but whitespace after
+    its value.
+
+    """
+    value, end = _decode_at(line, WHITESPACE.match(line).end())
+    end = WHITESPACE.match(line, end).end()
+    if end != len(line):
+        raise ValueError('Extra data at %d' % end)
+    return value
+
+
+def loads_lines(lines, pool=None, batch_size=1024):
+    """Decodes newline-delimited JSON text, yielding the value of each line
+    that isn't blank.
+
+    Parameter `lines` is an iterable of the lines of text, such as
+    ``content.splitlines()`` or the result of `iter_lines()`.
+
+    Lines are decoded one at a time in this process, unless optional
+    parameter `pool` is given. `pool` is an object with a `map()` method,
+    such as a `multiprocessing.Pool` or a ``concurrent.futures`` executor,
+    which is given batches of `batch_size` lines to decode. Process pools
+    are worthwhile only for very large texts, as each decoded value must be
+    pickled back to the calling process. The pool is not closed.
+
+    """
+    lines = (line for line in lines if line.strip())
+    if pool is None:
+        for line in lines:
+            yield decode_line(line)
+        return
+
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            break
+        for value in pool.map(decode_line, batch):
+            yield value
+
+
+def dumps_lines(values, **kwargs):
+    """Encodes each of `values` as a line of newline-delimited JSON text.
+
+    Keyword parameters are passed on to `simplejson.dumps()`.
+
+    """
+    return ''.join([simplejson.dumps(value, **kwargs) + '\n'
+        for value in values])
+
+
+def _canonical_default(value):
+    if isinstance(value, collections.Mapping):
+        return dict(value)
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def digest(value):
+    """Returns a hex digest of the JSON-compatible value `value`.
+
+    The value is encoded as canonical JSON, with sorted keys and no
+    whitespace, so equal values always have the same digest.
+
+    """
+    text = simplejson.dumps(value, sort_keys=True, separators=(',', ':'),
+        default=_canonical_default)
+    return hashlib.sha1(text).hexdigest()
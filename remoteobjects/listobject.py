@@ -29,15 +29,25 @@
 
 from urlparse import urljoin, urlparse, urlunparse
 import cgi
+from cStringIO import StringIO
 import inspect
 import sys
 import urllib
+import weakref
 
 import remoteobjects.fields as fields
-from remoteobjects.dataobject import find_by_name
+from remoteobjects.dataobject import DataObject, find_by_name
+from remoteobjects.json import StreamDecoder, digest
+from remoteobjects.json import iter_lines, loads_lines
+from remoteobjects import codec
+from remoteobjects.columns import ColumnStore
+import remoteobjects.http
 from remoteobjects.promise import PromiseObject, PromiseError
 
 
+NDJSON = 'application/x-ndjson'
+
+
 class SequenceProxy(object):
 
     """An abstract class implementing the sequence protocol by proxying it to
@@ -71,13 +81,33 @@ class SequenceProxy(object):
 class OfOf(type):
 
     class _Module(object):
-        pass
+
+        """A stand-in module for the classes a `PageOf` metaclass makes,
+        so they can be pickled.
+
+        The module holds its classes weakly, so classes that are no longer
+        used can be collected.
+
+        """
+
+        def __init__(self, name):
+            self.__name__ = name
+            self._classes = weakref.WeakValueDictionary()
+
+        def __getattr__(self, name):
+            try:
+                return self._classes[name]
+            except KeyError:
+                raise AttributeError('module %r has no class %r'
+                    % (self.__name__, name))
 
     def __new__(cls, name, bases, attr):
         modulename = attr['_modulename']
-        sys.modules[modulename] = cls._Module()
+        sys.modules[modulename] = cls._Module(modulename)
 
-        attr['_subclasses'] = {}
+        # Made classes are looked up by their entry classes, but not kept
+        # alive by them.
+        attr['_subclasses'] = weakref.WeakValueDictionary()
         attr['_basemodule'] = None
 
         return type.__new__(cls, name, bases, attr)
@@ -123,8 +153,10 @@ class PageOf(PromiseObject.__metaclass__):
         if direct:
             # Don't bother making a new subclass if we already made one for
             # this target.
-            if name in cls._subclasses:
+            try:
                 return cls._subclasses[name]
+            except KeyError:
+                pass
 
             entryclass = name
             if callable(entryclass):
@@ -144,13 +176,103 @@ class PageOf(PromiseObject.__metaclass__):
         if direct:
             cls._subclasses[entryclass] = newcls
             newcls.__module__ = cls._modulename
-            setattr(sys.modules[cls._modulename], name, newcls)
+            sys.modules[cls._modulename]._classes[name] = newcls
         elif cls._basemodule is None:
             cls._basemodule = newcls
 
         return newcls
 
 
+class PageStream(object):
+
+    """An iterator over the entries of a list resource that decodes each
+    entry as it's read from the HTTP response body.
+
+    Only the entry being decoded is held in memory; entries are not kept
+    once they've been yielded. The body is read from the file-like object
+    returned by the `PageObject` class's `open_stream()` method, which by
+    default holds the whole body in memory (see `PageObject.iter_stream()`). The other members of the resource (such as
+    a total count) are available as attributes of the `PageStream`
+    instance, through an instance of the `PageObject` class without any
+    entries. Members that precede the entries in the response can be used
+    right away, but members after them are available only once iteration
+    is finished.
+
+    """
+
+    def __init__(self, cls, url, http=None, chunk_size=65536):
+        self.page = cls()
+        self.page._location = url
+        self.page._delivered = True
+        self.page._http = http
+
+        request = self.page.get_request(url=url)
+        response, self.fp = cls.open_stream(request, http)
+        if not 200 <= response.status < 300:
+            # Read the whole body of error responses for their messages.
+            content = self.fp.read()
+            self.fp.close()
+            cls.raise_for_response(url, response, content)
+            raise cls.BadResponse('Unexpected response requesting %s %s: %d %s'
+                % (cls.__name__, url, response.status, response.reason))
+        try:
+            cls.raise_for_response(url, response, '')
+        except:
+            self.fp.close()
+            raise
+
+        field = cls.fields['entries']
+        self._entries_key = field.api_name
+        self._decode = getattr(field, 'fld', fields.Field()).decode
+
+        self._data = {}
+        self._lines = None
+        self.stream = StreamDecoder(self.fp, chunk_size)
+        content_type = response.get('content-type', '').split(';', 1)[0].strip()
+        if content_type == NDJSON:
+            self._members = None
+            self._lines = loads_lines(iter_lines(self.fp, chunk_size),
+                pool=getattr(cls, 'decode_pool', None))
+        elif self.stream.peek() == '[':
+            self._members = None
+        else:
+            self._members = self.stream.iter_members()
+            self._read_members()
+
+    def _read_members(self):
+        """Reads the members of the resource up to its entries."""
+        for key in self._members:
+            if key == self._entries_key:
+                return
+            self._data[key] = self.stream.value()
+            self.page.update_from_dict(dict(self._data))
+        self._members = None
+
+    def __iter__(self):
+        decode = self._decode
+        try:
+            if self._lines is not None:
+                for item in self._lines:
+                    yield decode(item)
+                return
+            if self._members is not None or self.stream.peek() == '[':
+                for item in self.stream.iter_array():
+                    yield decode(item)
+            if self._members is not None:
+                self._read_members()
+        finally:
+            self.close()
+
+    def __getattr__(self, name):
+        if name == 'page':
+            raise AttributeError(name)
+        return getattr(self.page, name)
+
+    def close(self):
+        """Closes the HTTP response."""
+        self.fp.close()
+
+
 class PageObject(SequenceProxy, PromiseObject):
 
     """A `RemoteObject` representing a set of other `RemoteObject` instances.
@@ -188,6 +310,166 @@ class PageObject(SequenceProxy, PromiseObject):
 
     entries = fields.List(fields.Field())
 
+    def to_columns(self, *names):
+        """Returns the entries of this `PageObject` as a
+        `remoteobjects.columns.ColumnStore`, decoded column by column.
+
+        The page's ``entries`` field must be a `List` of `Object` fields. If
+        any field names are given, only those fields are decoded.
+
+        """
+        field = self.fields['entries']
+        try:
+            entryclass = field.fld.cls
+        except AttributeError:
+            raise TypeError('%s entries are not a list of objects'
+                % (type(self).__name__,))
+        data = self.api_data.get(field.api_name)
+        if data is None:
+            # The raw data was released, so use the decoded entries.
+            data = field.encode(self.entries)
+        return ColumnStore.from_dicts(entryclass, data, names or None)
+
+    def dedup(self):
+        """Removes repeated entries from this `PageObject`, keeping the first
+        of each.
+
+        `DataObject` entries are the same if they're of the same class and
+        their content digests are, as returned by
+        `DataObject.content_digest()`, which is computed without decoding
+        their fields. Other entries are compared by value. If the entries
+        haven't been decoded yet, their dictionary values are compared
+        instead, and repeated ones are removed from the page's data without
+        decoding any entries.
+
+        Returns the number of entries removed.
+
+        """
+        field = self.fields['entries']
+        try:
+            entries = field._stored(self)
+        except KeyError:
+            entries = None
+        if entries is None and isinstance(field, fields.List):
+            data = self.api_data.get(field.api_name)
+            if isinstance(data, list):
+                return self._dedup_data(field, data)
+
+        unique = self._unique_entries(self.entries, self._entry_key)
+        removed = len(self.entries) - len(unique)
+        if removed:
+            self.entries = unique
+        return removed
+
+    def _dedup_data(self, field, data):
+        """Removes repeated dictionary values from the list `data` of the
+        page's undecoded entries, for `dedup()`."""
+        fld = field.fld
+        if isinstance(fld, fields.Object):
+            def key(value):
+                if isinstance(value, dict):
+                    # As the digest of the entry decoded from the value.
+                    return (fld.cls_for(value), digest(value))
+                return self._entry_key(value)
+        else:
+            key = self._entry_key
+
+        unique = self._unique_entries(data, key)
+        removed = len(data) - len(unique)
+        if removed:
+            if self._journal is not None:
+                self._record_change([field], self.api_data)
+            api_data = dict(self.api_data)
+            api_data[field.api_name] = unique
+            self.api_data = api_data
+            if self.content_hashing:
+                self._digest = None
+        return removed
+
+    @staticmethod
+    def _unique_entries(entries, key):
+        """Returns a list of the first of each of the entries `entries`
+        with the same key, as returned by the function `key`."""
+        seen = set()
+        unique = []
+        for entry in entries:
+            k = key(entry)
+            if k not in seen:
+                seen.add(k)
+                unique.append(entry)
+        return unique
+
+    @staticmethod
+    def _entry_key(entry):
+        """Returns the key by which `dedup()` tells the entry `entry` from
+        others."""
+        if isinstance(entry, DataObject):
+            return (type(entry), entry.content_digest())
+        try:
+            hash(entry)
+            return entry
+        except TypeError:
+            return (None, digest(entry))
+
+    def to_numpy(self, fields=None):
+        """Returns the entries of this `PageObject` as a NumPy structured
+        array, decoded column by column from the page's data.
+
+        If optional parameter `fields` is a list of field names, the array
+        contains only those fields. NumPy must be installed.
+
+        """
+        return self.to_columns(*(fields or ())).to_numpy()
+
+    def to_records(self, fields=None):
+        """Returns the entries of this `PageObject` as records, as for
+        `remoteobjects.columns.ColumnStore.to_records()`.
+
+        If optional parameter `fields` is a list of field names, the records
+        contain only those fields.
+
+        """
+        return self.to_columns(*(fields or ())).to_records()
+
+    @classmethod
+    def iter_stream(cls, url, http=None, chunk_size=65536):
+        """Returns a `PageStream` iterator over the entries of the list
+        resource at `url`.
+
+        Unlike with `get()`, the response is decoded incrementally, so only
+        one decoded entry is held in memory at a time. The response body
+        itself is read through `open_stream()`, which by default reads it
+        whole with `httplib2`, so the undecoded body is still held in memory
+        while iterating. To bound memory for very large responses, override
+        `open_stream()` to read the body from the network as it arrives.
+
+        Optional parameter `http` is the user agent object to use for
+        fetching, as for `get()`. Optional parameter `chunk_size` is how many
+        bytes of the response to decode from at a time.
+
+        """
+        return PageStream(cls, url, http, chunk_size)
+
+    @classmethod
+    def open_stream(cls, request, http=None):
+        """Makes the HTTP request described by the dictionary `request` (as
+        returned by `get_request()`) and returns a tuple of the
+        `httplib2.Response` and a file-like object from which to read the
+        response body.
+
+        The request is made with the user agent `http`, or with
+        `remoteobjects.http.userAgent` if `http` is not given, so its
+        credentials, redirect handling and caching apply as for any other
+        request. As `httplib2.Http` reads whole responses, this
+        implementation reads the body from memory; override this method to
+        read it from the network as it arrives instead.
+
+        """
+        if http is None:
+            http = remoteobjects.http.userAgent
+        response, content = http.request(**request)
+        return response, StringIO(content)
+
     def __getitem__(self, key):
         """Translates slice notation on a `ListObject` instance into ``limit``
         and ``offset`` filter parameters."""
@@ -219,8 +501,70 @@ class ListObject(PageObject):
 
     __metaclass__ = ListOf
 
+    content_types = ('application/json', NDJSON)
+
+    decode_pool = None
+
+    def decode_response(self, response, content):
+        """Returns the data decoded from the message body `content` of the
+        HTTP response `response`.
+
+        Responses of newline-delimited JSON (``application/x-ndjson``) are
+        decoded line by line into a list. If the class's `decode_pool`
+        attribute is set to a pool of worker processes (or any object with a
+        `map()` method, as for `remoteobjects.json.loads_lines()`), the lines
+        are decoded by that pool.
+
+        """
+        content_type = response.get('content-type', '').split(';', 1)[0].strip()
+        if content_type == NDJSON and self.decode_pool is not None:
+            return list(loads_lines(content.splitlines(),
+                pool=self.decode_pool))
+        return super(ListObject, self).decode_response(response, content)
+
+    def bulk_post(self, objs, http=None):
+        """Adds the `RemoteObject` instances in the sequence `objs` to the
+        remote resource represented by this `ListObject` through one HTTP
+        ``POST`` request of newline-delimited JSON.
+
+        Returns the data decoded from the response, or `None` if the response
+        has no content.
+
+        Optional parameter `http` is the user agent object to use for
+        posting. `http` objects should be compatible with `httplib2.Http`
+        objects.
+
+        """
+        if getattr(self, '_location', None) is None:
+            raise ValueError('Cannot add to %r with no URL to POST to' % (self,))
+
+        body = codec.lookup(NDJSON).dumps([obj.to_dict() for obj in objs],
+            default=remoteobjects.http.omit_nulls)
+
+        headers = {'content-type': NDJSON}
+
+        request = self.get_request(method='POST', body=body, headers=headers)
+        if http is None:
+            http = remoteobjects.http.userAgent
+        response, content = http.request(**request)
+
+        self.raise_for_response(self._location, response, content)
+        if not self.response_has_content.get(response.status):
+            return None
+        return self.decode_response(response, content)
+
+    @classmethod
+    def partial_response_tree(cls, projection=None):
+        # The response is the list of entries itself, so ask for the fields
+        # of the entries without the entries key, which isn't in it.
+        tree = super(ListObject, cls).partial_response_tree(projection)
+        return tree.get(cls.fields['entries'].api_name) or {}
+
     def update_from_dict(self, data):
         super(ListObject, self).update_from_dict({ 'entries': data })
 
+    def merge_from_dict(self, data, partial=False):
+        super(ListObject, self).merge_from_dict({ 'entries': data }, partial)
+
     def to_dict(self):
         return super(ListObject, self).to_dict()['entries']
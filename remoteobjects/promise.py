@@ -27,13 +27,10 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import urlparse
-import urllib
-import cgi
-
 import httplib
 import httplib2
 
+from remoteobjects.dataobject import parse_projection
 import remoteobjects.http
 from remoteobjects.fields import Property
 
@@ -131,35 +128,65 @@ class PromiseObject(remoteobjects.http.HttpObject):
         self._http = None
         super(PromiseObject, self).__init__(**kwargs)
 
+    _internal_slots = ('_api_data', '_delivered', '_http')
+
     def _get_api_data(self):
         if not self._delivered:
-            self.deliver()
-        return self.__dict__['api_data']
+            self._deliver_once()
+        return self._api_data
 
     def _set_api_data(self, value):
-        self.__dict__['api_data'] = value
+        self._api_data = value
 
     def _del_api_data(self):
-        del self.__dict__['api_data']
+        del self._api_data
 
     api_data = property(_get_api_data, _set_api_data, _del_api_data)
 
     @classmethod
     def statefields(cls):
-        return super(PromiseObject, cls).statefields() + ['_delivered']
+        # Keep the undelivered data instead of delivering it.
+        fields = super(PromiseObject, cls).statefields()
+        fields[fields.index('api_data')] = '_api_data'
+        return fields + ['_delivered']
+
+    def __setstate__(self, state):
+        if 'api_data' in state:
+            # Instances pickled before the data moved to _api_data.
+            state = dict(state)
+            state['_api_data'] = state.pop('api_data')
+        super(PromiseObject, self).__setstate__(state)
+
+    def _merges_response(self):
+        # Nothing has been decoded before delivery, so there's nothing to
+        # keep, and the current data mustn't be delivered to compare.
+        return self._delivered and super(PromiseObject, self)._merges_response()
 
     @classmethod
-    def get(cls, url, http=None, **kwargs):
+    def get(cls, url, http=None, only=None, **kwargs):
         """Creates a new undelivered `PromiseObject` instance that, when
-        delivered, will contain the data at the given URL."""
+        delivered, will contain the data at the given URL.
+
+        Optional parameter `only` is a sequence of the names of the fields
+        to keep when the instance is delivered, as for
+        `DataObject.project()`.
+
+        """
         # Make a fake empty instance of this class.
         self = cls()
         self._location = url
         self._http = http
         self._delivered = False
+        if only is not None:
+            self._projection = parse_projection(only)
 
         return self
 
+    def _apply_projection(self):
+        # Undelivered instances are projected as they're delivered.
+        if self._delivered:
+            super(PromiseObject, self)._apply_projection()
+
     def head(self, http=None, **kwargs):
         """Creates a new undelivered `PromisedResponse` instance that, when
         delivered, will contain the HTTP Response for the given object."""
@@ -184,14 +211,28 @@ class PromiseObject(remoteobjects.http.HttpObject):
 
     def __setattr__(self, name, value):
         if name is not '_delivered' and not self._delivered and name in self.fields:
-            self.deliver()
+            self._deliver_once()
         return super(PromiseObject, self).__setattr__(name, value)
 
     def __delattr__(self, name):
         if name is not '_delivered' and not self._delivered and name in self.fields:
-            self.deliver()
+            self._deliver_once()
         return super(PromiseObject, self).__delattr__(name)
 
+    def _deliver_once(self):
+        """Delivers the undelivered instance as its data is needed.
+
+        For classes with the `thread_safe` option, the instance is delivered
+        under its lock, so threads that need it at once make only one
+        request and the others wait for it to finish.
+
+        """
+        if not self.thread_safe:
+            return self.deliver()
+        with self._instance_lock():
+            if not self._delivered:
+                self.deliver()
+
     def deliver(self):
         """Attempts to fill the instance with the data it represents.
 
@@ -214,17 +255,6 @@ class PromiseObject(remoteobjects.http.HttpObject):
         response, content = http.request(**request)
         self.update_from_response(request['uri'], response, content)
 
-    def update_from_dict(self, data):
-        if not isinstance(data, dict):
-            raise TypeError("Cannot update %r from non-dictionary data source %r"
-                % (self, data))
-        # Clear any local instance field data
-        for k in self.fields.iterkeys():
-            if k in self.__dict__:
-                del self.__dict__[k]
-        # Update directly to avoid triggering delivery.
-        self.__dict__['api_data'] = data
-
     def update_from_response(self, url, response, content):
         """Fills the `PromiseObject` instance with the data from the given
         HTTP response and if successful marks the instance delivered."""
@@ -246,11 +276,6 @@ class PromiseObject(remoteobjects.http.HttpObject):
         you require.
 
         """
-        parts = list(urlparse.urlparse(self._location))
-        queryargs = cgi.parse_qs(parts[4], keep_blank_values=True)
-        queryargs = dict([(k, v[0]) for k, v in queryargs.iteritems()])
-        queryargs.update(kwargs)
-        parts[4] = urllib.urlencode(queryargs)
-        newurl = urlparse.urlunparse(parts)
-
-        return self.get(newurl, http=self._http)
+        newurl = remoteobjects.http.update_query(self._location, kwargs)
+
+        return self.get(newurl, http=self._http, only=self._projection)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+
+"""
+This will benchmark how fast remoteobjects classes can be made at run time. It
+makes batches of tenant schemas, each a `RemoteObject` subclass with some
+fields and its `PageOf` and `ListOf` classes, and drops each batch before
+making the next. For each batch it prints the seconds taken and how many of
+the made classes are still registered afterward, which should stay flat as
+batches go by.
+"""
+
+import gc
+import optparse
+import time
+
+from remoteobjects import fields, RemoteObject
+from remoteobjects.listobject import PageOf, ListOf
+from remoteobjects import dataobject
+
+
+def make_schema(tenant):
+    attrs = {
+        'kind': fields.Constant(u'tag:api.example.com,2009:%s' % tenant),
+        'id': fields.Field(),
+        'name': fields.Field(),
+        'updated': fields.Datetime(),
+        'parent': fields.Object(tenant),
+    }
+    cls = type(RemoteObject)(tenant, (RemoteObject,), attrs)
+    return cls, PageOf(cls), ListOf(cls)
+
+
+def test_class_creation(batches, size):
+    made = 0
+    for batch in xrange(batches):
+        t = time.time()
+        schemas = [make_schema('Tenant%d' % (made + i)) for i in xrange(size)]
+        elapsed = time.time() - t
+        made += size
+
+        del schemas
+        # Page classes are collected before the entry classes they hold.
+        while gc.collect():
+            pass
+        registered = sum(1 for name in dataobject.classes_by_name.keys()
+            if name.startswith(('Tenant', 'PageOfTenant', 'ListOfTenant')))
+        yield elapsed, registered
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description=("Test the speed of making remoteobjects classes at run "
+                     "time, and whether they're collected once unused."))
+    parser.add_option("-b", action="store", type="int", default=10,
+                      dest="batches", help="Number of batches of classes.")
+    parser.add_option("-n", action="store", type="int", default=1000,
+                      dest="size", help="Number of schemas per batch.")
+    options, args = parser.parse_args()
+
+    for elapsed, registered in test_class_creation(options.batches, options.size):
+        print "%8.3f s %8d classes still registered" % (elapsed, registered)
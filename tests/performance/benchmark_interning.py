@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This will benchmark the memory saved by interning strings when decoding. It
+decodes a list of records, each fetched as its own JSON document, into
+objects that do and don't intern their keys and low-cardinality values, and
+prints the bytes held by the distinct strings in each set of objects.
+"""
+
+import optparse
+import random
+import sys
+
+import simplejson as json
+
+from remoteobjects import fields, RemoteObject
+
+
+STATUSES = ('active', 'pending', 'suspended', 'closed')
+COUNTRIES = ('US', 'GB', 'DE', 'FR', 'JP', 'BR', 'IN', 'NZ', 'CA', 'MX')
+
+
+class Account(RemoteObject):
+    kind    = fields.Constant(u'tag:api.example.com,2009:Account')
+    id      = fields.Field()
+    name    = fields.Field()
+    status  = fields.Field()
+    country = fields.Field()
+    plan    = fields.Field()
+
+
+class InternedAccount(Account):
+    intern_keys = True
+    status  = fields.Field(intern=True)
+    country = fields.Field(intern=True)
+    plan    = fields.Field(intern=True)
+
+
+def make_documents(count):
+    rand = random.Random(7)
+    for i in xrange(count):
+        yield json.dumps({
+            'kind': u'tag:api.example.com,2009:Account',
+            'id': i,
+            'name': u'Account %d' % i,
+            'status': rand.choice(STATUSES),
+            'country': rand.choice(COUNTRIES),
+            'plan': u'plan-%d' % rand.randint(1, 5),
+        })
+
+
+def string_bytes(objs):
+    """Returns the number of distinct strings in the API data of `objs`, and
+    the bytes they take."""
+    seen = {}
+    for obj in objs:
+        for key, value in obj.api_data.iteritems():
+            for s in (key, value):
+                if isinstance(s, basestring):
+                    seen[id(s)] = sys.getsizeof(s)
+    return len(seen), sum(seen.itervalues())
+
+
+def test_interning(count):
+    documents = list(make_documents(count))
+    for cls in (Account, InternedAccount):
+        objs = [cls.from_dict(json.loads(doc)) for doc in documents]
+        strings, size = string_bytes(objs)
+        yield cls.__name__, strings, size
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description=("Test the memory saved by interning strings when "
+                     "decoding JSON into remoteobjects."))
+    parser.add_option("-n", action="store", type="int", default=100000,
+                      dest="count", help="Number of records to decode.")
+    options, args = parser.parse_args()
+
+    for name, strings, size in test_interning(options.count):
+        print "%-16s %8d strings %12d bytes" % (name, strings, size)
@@ -0,0 +1,129 @@
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+
+import mox
+
+from remoteobjects import codec, fields, http
+from tests import utils
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_lookup(self):
+        self.assert_(codec.lookup('application/json; charset=utf-8') is codec.JSON)
+        self.assert_(isinstance(codec.lookup('application/x-msgpack'), codec.MessagePackCodec))
+        self.assertRaises(LookupError, lambda: codec.lookup('text/xml'))
+
+    def test_msgpack(self):
+        self.assertEquals(codec.packb(None), '\xc0')
+        self.assertEquals(codec.packb([True, False]), '\x92\xc3\xc2')
+        self.assertEquals(codec.packb(-1), '\xff')
+        self.assertEquals(codec.packb(200), '\xcc\xc8')
+        self.assertEquals(codec.packb(-200), '\xd1\xff\x38')
+        self.assertEquals(codec.packb(u'h\xe9'), '\xa3h\xc3\xa9')
+        self.assertEquals(codec.packb({'a': 1}), '\x81\xa1a\x01')
+        self.assertRaises(TypeError, lambda: codec.packb(object()))
+        self.assertEquals(codec.packb(object(), default=lambda o: 'x'), '\xa1x')
+
+        data = {
+            u'name': u'Fred \u2603',
+            u'ints': [0, 127, 128, 65536, 2 ** 40, -33, -129, -2 ** 40],
+            u'float': 1.5,
+            u'long': u'x' * 70000,
+            u'nested': [{u'a': None}, [], {}],
+        }
+        self.assertEquals(codec.unpackb(codec.packb(data)), data)
+        self.assertEquals(codec.unpackb(codec.packb(bytearray('\x00\x01'))), '\x00\x01')
+        self.assertRaises(ValueError, lambda: codec.unpackb('\x92\xc3'))
+        self.assertRaises(ValueError, lambda: codec.unpackb('\xc0\xc0'))
+        self.assertRaises(ValueError, lambda: codec.unpackb('\xc1'))
+
+        # Byte strings are packed as strings with or without msgpack.
+        self.assertEquals(codec.MessagePackCodec().dumps({'a': 'b'}),
+            codec.packb({'a': 'b'}))
+
+    def test_http(self):
+
+        class BasicMost(http.HttpObject):
+            content_types = ('application/msgpack', 'application/json')
+            name  = fields.Field()
+            value = fields.Field()
+
+        content = codec.packb({'name': 'Fred', 'value': 7})
+        request = {
+            'uri': 'http://example.com/ohhai',
+            'headers': {'accept': 'application/msgpack, application/json'},
+        }
+        h = utils.mock_http(request, {'content-type': 'application/msgpack',
+            'content': content})
+        b = BasicMost.get('http://example.com/ohhai', http=h)
+        self.assertEquals(b.name, 'Fred')
+        self.assertEquals(b.value, 7)
+        mox.Verify(h)
+
+        h = utils.mock_http(request, '{"name": "Wilma", "value": 3}')
+        b = BasicMost.get('http://example.com/ohhai', http=h)
+        self.assertEquals(b.name, 'Wilma')
+        mox.Verify(h)
+
+        b.value = 8
+        request = {
+            'uri': 'http://example.com/ohhai',
+            'method': 'PUT',
+            'body': codec.packb({'name': 'Wilma', 'value': 8}),
+            'headers': {
+                'accept': 'application/msgpack, application/json',
+                'content-type': 'application/msgpack',
+                'if-match': '7',
+            },
+        }
+        h = utils.mock_http(request, {'content-type': 'application/msgpack',
+            'content': request['body']})
+        b.put(http=h)
+        mox.Verify(h)
+
+        class XMLMost(BasicMost):
+            content_types = ('text/xml', 'application/json')
+
+        request = {
+            'uri': 'http://example.com/ohhai',
+            'headers': {'accept': 'text/xml, application/json'},
+        }
+        h = utils.mock_http(request, {'content-type': 'text/xml',
+            'content': '<name>Fred</name>'})
+        self.assertRaises(http.HttpObject.BadResponse,
+            lambda: XMLMost.get('http://example.com/ohhai', http=h).name)
+        mox.Verify(h)
+
+
+if __name__ == '__main__':
+    utils.log()
+    unittest.main()
@@ -0,0 +1,157 @@
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from array import array
+from datetime import datetime
+import unittest
+
+import nose
+
+from remoteobjects import fields, dataobject, listobject, columns
+from remoteobjects.columns import ColumnStore, RowView
+from tests import utils
+
+
+class Entry(dataobject.DataObject):
+    name  = fields.Field()
+    size  = fields.Field()
+    score = fields.Field()
+    when  = fields.Datetime()
+
+
+DATA = [
+    {'name': u'ball', 'size': 1, 'score': 0.5, 'when': '2008-12-31T04:00:01Z'},
+    {'name': u'car', 'size': 3, 'score': 2.0},
+    {'name': u'ball', 'size': 2, 'score': 1.5, 'extra': True},
+]
+
+
+class TestColumnStores(unittest.TestCase):
+
+    def test_columns(self):
+        store = ColumnStore.from_dicts(Entry, DATA)
+        self.assertEquals(len(store), 3)
+        self.assertEquals(store.column('size'), array('l', [1, 3, 2]))
+        self.assertEquals(store.column('score'), array('d', [0.5, 2.0, 1.5]))
+        names = store.column('name')
+        self.assertEquals(names, [u'ball', u'car', u'ball'])
+        self.assert_(names[0] is names[2], 'strings were interned')
+        self.assertEquals(store.column('when'), [datetime(2008, 12, 31, 4, 0, 1), None, None])
+
+        row = store[-1]
+        self.assert_(isinstance(row, RowView))
+        self.assertEquals(row.name, u'ball')
+        self.assertEquals(row.size, 2)
+        self.assertRaises(AttributeError, lambda: row.extra)
+        self.assertRaises(IndexError, lambda: store[3])
+        self.assertEquals([r.size for r in store], [1, 3, 2])
+
+        obj = store[0].to_object()
+        self.assert_(isinstance(obj, Entry))
+        self.assertEquals(obj.when, datetime(2008, 12, 31, 4, 0, 1))
+        self.assertEquals(store.to_dicts(), [dict((k, v) for k, v in d.iteritems()
+            if k != 'extra') for d in DATA])
+
+    def test_defaults(self):
+
+        class Bag(dataobject.DataObject):
+            toys  = fields.List(fields.Field())
+            count = fields.Field(default=lambda obj: 0)
+
+        store = ColumnStore.from_dicts(Bag, [{}, {}, {'toys': ['car']}])
+        toys = store.column('toys')
+        toys[0].append('ball')
+        self.assertEquals(toys, [['ball'], [], ['car']])
+        self.assertEquals(list(store.column('count')), [0, 0, 0])
+
+    def test_filter_select(self):
+        store = ColumnStore.from_dicts(Entry, DATA)
+
+        balls = store.filter(name=u'ball')
+        self.assertEquals(len(balls), 2)
+        self.assertEquals(balls.column('size'), array('l', [1, 2]))
+        big = store.filter(name=u'ball', size=lambda v: v > 1)
+        self.assertEquals([r.score for r in big], [1.5])
+        self.assertEquals(len(store.filter(size=7)), 0)
+
+        sizes = store.select('size')
+        self.assertEquals(sizes.columns.keys(), ['size'])
+        self.assert_(sizes.column('size') is store.column('size'))
+        self.assertEquals(store[1:].column('name'), [u'car', u'ball'])
+
+    def test_page(self):
+
+        class Page(listobject.PageObject):
+            entries = fields.Columns(Entry)
+
+        page = Page.from_dict({'entries': DATA})
+        self.assert_(isinstance(page.entries, ColumnStore))
+        self.assertEquals(len(page), 3)
+        self.assertEquals(page[1].name, u'car')
+        self.assertEquals(page.to_dict()['entries'][1], DATA[1])
+
+        page = listobject.PageOf(Entry).from_dict({'entries': DATA})
+        store = page.to_columns('name', 'size')
+        self.assertEquals(sorted(store.columns.keys()), ['name', 'size'])
+        self.assertEquals(store[2].size, 2)
+
+    def test_records(self):
+        page = listobject.PageOf(Entry).from_dict({'entries': DATA})
+
+        numpy, columns.numpy = columns.numpy, None
+        try:
+            records = page.to_records(['size', 'name'])
+            self.assertRaises(ImportError, page.to_numpy)
+        finally:
+            columns.numpy = numpy
+        self.assertEquals(records, [(u'ball', 1), (u'car', 3), (u'ball', 2)])
+
+    def test_numpy(self):
+        if columns.numpy is None:
+            raise nose.SkipTest('NumPy is not installed')
+        numpy = columns.numpy
+
+        page = listobject.PageOf(Entry).from_dict({'entries': DATA})
+        values = page.to_numpy()
+        self.assertEquals(values.dtype.names, ('name', 'score', 'size', 'when'))
+        self.assertEquals(values['size'].dtype, numpy.dtype('l'))
+        self.assertEquals(values['score'].dtype, numpy.dtype('d'))
+        self.assertEquals(values['name'].dtype.kind, 'U')
+        self.assertEquals(list(values['size']), [1, 3, 2])
+        self.assertEquals(values['when'][0],
+            numpy.datetime64('2008-12-31T04:00:01'))
+        self.assert_(numpy.isnat(values['when'][1]))
+
+        records = page.to_records(['score'])
+        self.assertEquals(list(records.score), [0.5, 2.0, 1.5])
+
+
+if __name__ == '__main__':
+    utils.log()
+    unittest.main()
@@ -27,6 +27,8 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+from array import array
+from copy import deepcopy
 from datetime import datetime
 import logging
 import pickle
@@ -251,6 +253,167 @@ class TestDataObjects(unittest.TestCase):
             ],
         }, 'Parentish dict has proper contents')
 
+    def test_lazy_list(self):
+
+        decoded = []
+
+        class Childer(self.cls):
+            name = fields.Field()
+
+            @classmethod
+            def from_dict(cls, data):
+                decoded.append(data['name'])
+                return super(Childer, cls).from_dict(data)
+
+        class Parentish(self.cls):
+            children = fields.List(fields.Object(Childer), lazy=True)
+
+        data = {
+            'children': [
+                { 'name': 'fredina' },
+                { 'name': 'billzebub' },
+                { 'name': 'wurfledurf' },
+            ],
+        }
+        p = Parentish.from_dict(data)
+
+        self.assertEquals(len(p.children), 3)
+        self.assertEquals(decoded, [], 'taking the length decoded nothing')
+        self.assertEquals(p.children[1].name, 'billzebub')
+        self.assertEquals(decoded, ['billzebub'], 'indexing decoded only one child')
+        self.assert_(p.children[1] is p.children[1], 'decoded child was cached')
+
+        tail = p.children[1:]
+        self.assertEquals(len(tail), 2)
+        self.assertEquals(decoded, ['billzebub'], 'slicing decoded nothing')
+        self.assertEquals([c.name for c in tail], ['billzebub', 'wurfledurf'])
+        self.assertEquals(decoded, ['billzebub', 'wurfledurf'])
+        self.assert_(tail[0] is p.children[1], 'slice shares decoded children')
+        self.assert_(p.children[2] is tail[1], 'list shares children decoded by its slice')
+        self.assert_(tail[1:][0] is tail[1], 'slice of a slice shares them too')
+        self.assertEquals(decoded, ['billzebub', 'wurfledurf'],
+            'each child was decoded only once')
+
+        p.children[1].name = 'bill'
+        self.assertEquals(p.to_dict(), {
+            'children': [
+                { 'name': 'fredina' },
+                { 'name': 'bill' },
+                { 'name': 'wurfledurf' },
+            ],
+        })
+        self.assertEquals(decoded, ['billzebub', 'wurfledurf'],
+            'encoding did not decode the untouched child')
+
+        p.children.insert(0, Childer(name='jeff'))
+        del p.children[-1]
+        self.assertEquals([c.name for c in p.children], ['jeff', 'fredina', 'bill'])
+        self.assertEquals(len(data['children']), 3, 'changing the list left the API data alone')
+
+        cloned = deepcopy(p.children)
+        self.assert_(isinstance(cloned, list), 'lazy list copies as a plain list')
+        self.assertEquals([c.name for c in cloned], ['jeff', 'fredina', 'bill'])
+
+    def test_lazy_dict(self):
+
+        decoded = []
+
+        class Childer(self.cls):
+            name = fields.Field()
+
+            @classmethod
+            def from_dict(cls, data):
+                decoded.append(data['name'])
+                return super(Childer, cls).from_dict(data)
+
+        class Parentish(self.cls):
+            children = fields.Dict(fields.Object(Childer), lazy=True)
+            plain    = fields.Dict(fields.Datetime())
+
+        data = {
+            'children': {
+                'a': { 'name': 'fredina' },
+                'b': { 'name': 'billzebub' },
+            },
+            'plain': { 'then': '2008-12-31T04:00:01Z' },
+        }
+        p = Parentish.from_dict(data)
+
+        self.assertEquals(p.plain, { 'then': datetime(2008, 12, 31, 4, 0, 1) })
+        self.assertEquals(len(p.children), 2)
+        self.assertEquals(sorted(p.children), ['a', 'b'])
+        self.assertEquals(p.children['b'].name, 'billzebub')
+        self.assert_(p.children['b'] is p.children['b'])
+        self.assertEquals(decoded, ['billzebub'], 'untouched value was not decoded')
+
+        p.children['c'] = Childer(name='jeff')
+        del p.children['a']
+        self.assertEquals(sorted(data['children']), ['a', 'b'],
+            'changing the dict left the API data alone')
+        self.assertEquals(p.to_dict(), {
+            'children': {
+                'b': { 'name': 'billzebub' },
+                'c': { 'name': 'jeff' },
+            },
+            'plain': { 'then': '2008-12-31T04:00:01Z' },
+        })
+
+    def test_project(self):
+
+        class Childer(self.cls):
+            name = fields.Field()
+            age  = fields.Field()
+
+        class Parentish(self.cls):
+            name     = fields.Field()
+            age      = fields.Field(default=40)
+            eldest   = fields.Object(Childer)
+            children = fields.List(fields.Object(Childer))
+
+        data = {
+            'name': 'the parent',
+            'age': 42,
+            'eldest': { 'name': 'fredina', 'age': 12 },
+            'children': [
+                { 'name': 'fredina', 'age': 12 },
+                { 'name': 'billzebub', 'age': 9 },
+            ],
+            'secret': 'codes',
+        }
+        original = deepcopy(data)
+        p = Parentish.from_dict(data)
+        other = Parentish.from_dict(data)
+        self.assertEquals(p.age, 42)
+        self.assert_(p.project(['name', 'eldest', 'children.name']) is p)
+        self.assertEquals(data, original, 'projecting left the given data alone')
+        self.assertEquals(other.to_dict(), original)
+
+        self.assertEquals(p.to_dict(), {
+            'name': 'the parent',
+            'eldest': { 'name': 'fredina', 'age': 12 },
+            'children': [
+                { 'name': 'fredina' },
+                { 'name': 'billzebub' },
+            ],
+        })
+        self.assertEquals(p.eldest.age, 12)
+        self.assertEquals(p.children[1].name, 'billzebub')
+        self.assertRaises(dataobject.ProjectionError, lambda: p.age)
+        self.assertRaises(AttributeError, lambda: p.children[0].age)
+
+        # Only the projected fields are compared.
+        q = Parentish.from_dict(deepcopy(original))
+        q.project(['name', 'eldest', 'children.name'])
+        self.assertEquals(p, q)
+        q.name = 'another parent'
+        self.assertNotEquals(p, q)
+        self.assertNotEquals(p, other)
+        self.assertRaises(ValueError, lambda: Parentish.from_dict({}).project(['nope']))
+        self.assertRaises(TypeError, lambda: Parentish.from_dict({}).project('name'))
+
+        self.assertEquals(dataobject.parse_projection(['a.b', 'a', 'c.d', 'c.e.f']),
+            { 'a': None, 'c': { 'd': None, 'e': { 'f': None } } })
+
     def test_self_reference(self):
 
         class Reflexive(self.cls):
@@ -328,6 +491,137 @@ class TestDataObjects(unittest.TestCase):
         self.assertEquals(cloned_obj.api_data, obj.api_data,
             "unpickled instance kept original's api_data")
 
+    def test_pickle_nested(self):
+
+        def page(item_cls):
+            class Page(self.cls):
+                items = fields.List(fields.Object(item_cls))
+            return Page.from_dict({'items': [
+                {'name': 'fred', 'value': 1},
+                {'name': 'ted', 'value': 2},
+            ]})
+
+        BasicMost = self.set_up_pickling_class()
+        fred = page(BasicMost).items[0]
+        self.assertEquals(fred._references, None,
+            "objects that share nothing have no index")
+        payload = pickle.dumps(fred, 2)
+        self.assert_('ted' not in payload, "pickling left out the siblings")
+        self.assertEquals(pickle.loads(payload), fred)
+
+        BasicMost = self.set_up_pickling_class()
+        BasicMost.identity_key = 'name'
+        fred = page(BasicMost).items[0]
+        payload = pickle.dumps(fred, 2)
+        self.assert_('ted' not in payload, "pickling left out the siblings")
+        self.assertEquals(pickle.loads(payload), fred)
+
+    def test_compact_pickle(self):
+
+        BasicMost = self.set_up_pickling_class()
+        BasicMost.compact_pickle = True
+        statefields = BasicMost.statefields()
+
+        obj = BasicMost.from_dict({'name': 'fred', 'value': 7, 'extra': [1]})
+        self.assertEquals(obj.name, 'fred')
+        obj.value = 8
+        if '_location' in statefields:
+            obj._location = 'http://example.com/fred'
+
+        restore, (cls, data, state) = obj.__reduce_ex__(2)
+        self.assert_(cls is BasicMost)
+        self.assertEquals(data, {'name': 'fred', 'value': 8, 'extra': [1]})
+        self.assert_('api_data' not in state and 'name' not in state)
+
+        cloned_obj = pickle.loads(pickle.dumps(obj, 2))
+        self.assertEquals(cloned_obj.__dict__.get('name'), None,
+            "unpickled instance decodes its fields again")
+        self.assertEquals(cloned_obj, obj)
+        self.assertEquals(cloned_obj.api_data, data)
+        if '_location' in statefields:
+            self.assertEquals(cloned_obj._location, 'http://example.com/fred')
+
+        frozen = obj.freeze()
+        cloned_obj = pickle.loads(pickle.dumps(frozen, 2))
+        self.assert_(cloned_obj._frozen, "unpickled instance is still frozen")
+        self.assertEquals(cloned_obj, frozen)
+        self.assertEquals(hash(cloned_obj), hash(frozen))
+
+        if '_delivered' in statefields:
+            promised = BasicMost.get('http://example.com/ted')
+            cloned_obj = pickle.loads(pickle.dumps(promised, 2))
+            self.assert_(not cloned_obj._delivered, "pickling didn't deliver")
+            self.assertEquals(cloned_obj._location, 'http://example.com/ted')
+
+    def test_compact_pickle_decoded_values(self):
+
+        class Event(self.cls):
+            compact_pickle = True
+            name = fields.Field()
+            when = fields.Datetime(compact=True)
+
+        event = Event.from_dict({'name': 'launch',
+                                 'when': '2010-05-17T20:00:00Z'})
+        self.assertEquals(event.when, datetime(2010, 5, 17, 20, 0, 0))
+        event.when = datetime(2010, 5, 18, 9, 30, 0)
+        restore, args = event.__reduce_ex__(2)
+        self.assertEquals(args[1]['when'], '2010-05-18T09:30:00Z')
+        self.assertEquals(restore(*args).when, datetime(2010, 5, 18, 9, 30, 0))
+
+        class Person(self.cls):
+            compact_pickle = True
+            name   = fields.Field()
+            friend = fields.Object('Person', by_id=True)
+
+        class Post(self.cls):
+            compact_pickle = True
+            title  = fields.Field()
+            author = fields.Object(Person)
+
+        class Feed(self.cls):
+            compact_pickle = True
+            included_key = 'included'
+            posts = fields.List(fields.Object(Post))
+
+        feed = Feed.from_dict({
+            'posts': [{'title': 'one', 'author': {'$ref': 7}}],
+            'included': [
+                {'id': 7, 'name': 'Alice', 'friend': 9},
+                {'id': 9, 'name': 'Bob', 'friend': 7},
+            ],
+        })
+        post = feed.posts[0]
+
+        # The post's data has references that only the feed can resolve.
+        restore = post.__reduce_ex__(2)[0]
+        self.assert_(restore is not dataobject._restore_compact)
+        clone = deepcopy(post)
+        self.assertEquals(clone.author.name, 'Alice')
+        self.assert_(clone.author.friend.friend is clone.author)
+        self.assertRaises(ValueError, post.freeze().thaw)
+
+        restore = feed.__reduce_ex__(2)[0]
+        self.assert_(restore is dataobject._restore_compact)
+        clone = deepcopy(feed)
+        self.assertEquals(clone.posts[0].author.friend.name, 'Bob')
+        self.assertEquals(feed.freeze().thaw().posts[0].author.name, 'Alice')
+
+        # Changes to included objects are encoded with the feed.
+        feed.posts[0].author.name = 'Alicia'
+        self.assertEquals(feed.to_dict()['included'], [
+            {'id': 7, 'name': 'Alicia', 'friend': 9},
+            {'id': 9, 'name': 'Bob', 'friend': 7},
+        ])
+        self.assertEquals(restore(*feed.__reduce_ex__(2)[1]).posts[0]
+            .author.name, 'Alicia')
+        self.assertEquals(feed.freeze().thaw().posts[0].author.name, 'Alicia')
+        feed.compact_pickle = False
+        clone = deepcopy(feed)
+        self.assertEquals(clone.posts[0].author.name, 'Alicia')
+        clone.posts[0].author.friend.name = 'Robert'
+        self.assertEquals(clone.to_dict()['included'][1]['name'], 'Robert')
+        self.assertEquals(feed.posts[0].author.friend.name, 'Bob')
+
     def test_field_override(self):
 
         class Parent(dataobject.DataObject):
@@ -432,6 +726,82 @@ class TestDataObjects(unittest.TestCase):
         # Just to make sure
         self.assertEquals(x.alwaysTheSame, noninconstant)
 
+    def test_subclass_with_constant_field(self):
+
+        class Asset(self.cls):
+            name = fields.Field()
+
+        class Post(Asset):
+            kind = fields.Constant('post')
+
+        class Photo(Asset):
+            kind = fields.Constant('photo')
+
+        self.assert_(Asset.subclass_with_constant_field('kind', 'post') is Post)
+        self.assert_(Asset.subclass_with_constant_field('kind', 'photo') is Photo)
+        self.assert_(Post.subclass_with_constant_field('kind', 'post') is Post)
+        self.assertRaises(ValueError, lambda: Asset.subclass_with_constant_field('kind', 'video'))
+        self.assertRaises(ValueError, lambda: Post.subclass_with_constant_field('kind', 'photo'))
+        self.assertRaises(ValueError, lambda: Asset.subclass_with_constant_field('kind', ['post']))
+
+        # The most recently declared matching subclass wins.
+        class Article(Asset):
+            kind = fields.Constant('post')
+
+        self.assert_(Asset.subclass_with_constant_field('kind', 'post') is Article)
+        self.assert_(Post.subclass_with_constant_field('kind', 'post') is Post)
+
+        # Fields can be found by API name, from bases that don't declare them.
+        class Video(Asset):
+            format = fields.Constant('video', api_name='type')
+
+        self.assert_(Asset.subclass_with_constant_field('type', 'video') is Video)
+        self.assert_(Asset.subclass_with_constant_field('format', 'video') is Video)
+
+        # Sequence values are found by equal sequences.
+        class Album(Asset):
+            tags = fields.Constant(('photo', 'album'))
+
+        self.assert_(Asset.subclass_with_constant_field('tags', ['photo', 'album']) is Album)
+        self.assert_(Asset.subclass_with_constant_field('tags', ('photo', 'album')) is Album)
+
+    def test_field_object_discriminator(self):
+
+        class Asset(self.cls):
+            name = fields.Field()
+
+        class Post(Asset):
+            kind = fields.Constant('post')
+            body = fields.Field()
+
+        class Photo(Asset):
+            kind = fields.Constant('photo', api_name='objectType')
+
+        class Feed(self.cls):
+            entries = fields.List(fields.Object(Asset, discriminator='kind'))
+            photo   = fields.Object(Photo, discriminator='kind')
+
+        f = Feed.from_dict({
+            'entries': [
+                {'kind': 'post', 'name': 'hi', 'body': 'hello'},
+                {'kind': 'photo', 'name': 'cat'},
+                {'kind': 'video', 'name': 'dog'},
+                {'name': 'nothing'},
+            ],
+            'photo': {'objectType': 'photo', 'name': 'cat'},
+        })
+
+        post, photo, video, nothing = f.entries
+        self.assert_(isinstance(post, Post))
+        self.assertEquals(post.body, 'hello')
+        self.assert_(type(photo) is Photo)
+        self.assert_(type(video) is Asset, 'unknown kind decoded as the base class')
+        self.assert_(type(nothing) is Asset, 'missing kind decoded as the base class')
+        self.assert_(isinstance(f.photo, Photo), 'discriminator used the api_name')
+
+        self.assertEquals(f.to_dict()['entries'][0],
+            {'kind': 'post', 'name': 'hi', 'body': 'hello'})
+
     def test_field_link(self):
 
         class Frob(dataobject.DataObject):
@@ -475,6 +845,624 @@ class TestDataObjects(unittest.TestCase):
         self.assert_(isinstance(t, Timely), 'Datetime with missing data decoded properly')
         self.assert_(t.when is None, 'Datetime with missing data decoded to None timestamp')
 
+    def test_intern(self):
+
+        class Place(self.cls):
+            intern_keys = True
+            kind    = fields.Constant('place')
+            country = fields.Field(intern=True)
+            name    = fields.Field()
+
+        kind, country = 'pla' + 'ce', u'n' + u'z'
+        key = ''.join(['coun', 'try'])
+        data = {'kind': kind, key: country, 'name': u'Wellington'}
+        one = Place.from_dict(data)
+        two = Place.from_dict({'kind': 'place', 'country': u''.join([u'n', u'z']), 'name': u'Auckland'})
+
+        self.assert_(one.api_data['kind'] is Place.fields['kind'].value)
+        self.assert_(one.api_data['country'] is two.api_data['country'])
+        self.assertEquals(two.country, u'nz')
+        api_key = [k for k in one.api_data if k == 'country'][0]
+        self.assert_(api_key is Place.fields['country'].api_name)
+        self.assert_(api_key is not key)
+        self.assert_([k for k in data if k == 'country'][0] is key,
+            'the given data kept its own key')
+        self.assert_(data['kind'] is kind, 'the given data kept its own value')
+
+        limit = fields.INTERN_LIMIT
+        fields.INTERN_LIMIT = 2
+        try:
+            first = fields.intern_string(u''.join([u'a', u'b']))
+            self.assert_(fields.intern_string(u''.join([u'a', u'b'])) is first)
+            fields.intern_string(u'c')
+            fields.intern_string(u'd')
+            self.assert_(fields.intern_string(u''.join([u'a', u'b'])) is not first,
+                'the interned strings were let go at the limit')
+        finally:
+            fields.INTERN_LIMIT = limit
+
+    def test_compact_storage(self):
+
+        class Parent(self.cls):
+            name = fields.Field()
+
+        class Compact(Parent):
+            compact_storage = True
+            when = fields.Datetime(compact=True)
+            kids = fields.List(fields.Object(Parent))
+
+        class Subcompact(Compact):
+            extra = fields.Field()
+
+        self.assert_(Compact.fields['name'] is not Parent.fields['name'])
+        self.assert_(isinstance(Compact.fields['name'], fields.Field))
+        self.assert_(Subcompact.fields['when'] is Compact.fields['when'])
+        self.assertEquals(Subcompact.__slots__, ('_slot_extra',))
+        self.assert_(dataobject.find_by_name('Compact') is Compact)
+        self.assert_(dataobject.find_by_name('Subcompact') is Subcompact)
+
+        class Tree(self.cls):
+            compact_storage = True
+            name = fields.Field()
+            kids = fields.List(fields.Object('Tree'))
+
+        tree = Tree.from_dict({'name': 'oak', 'kids': [{'name': 'acorn'}]})
+        self.assertEquals(tree.kids[0].name, 'acorn')
+
+        o = Subcompact.from_dict({'name': 'Fred', 'when': '2008-12-31T04:00:01Z',
+            'kids': [{'name': 'Wilma'}], 'extra': 7})
+        self.assertEquals(o.name, 'Fred')
+        self.assertEquals(o.when, datetime(2008, 12, 31, 4, 0, 1))
+        self.assertEquals(o.kids[0].name, 'Wilma')
+        self.assertEquals(o.extra, 7)
+        self.assert_(o._projection is None)
+        self.assertEquals(o.__dict__, {}, 'compact instance stored nothing in a dict')
+
+        o.name = 'Barney'
+        self.assertEquals(o.name, 'Barney')
+        del o.extra
+        self.assert_(o.extra is None)
+        self.assertEquals(o.to_dict()['name'], 'Barney')
+
+        p = Parent.from_dict({'name': 'Dino'})
+        self.assertEquals(p.name, 'Dino')
+        self.assertEquals(p.__dict__['name'], 'Dino')
+
+        cloned = deepcopy(o)
+        self.assertEquals(cloned.name, 'Barney')
+        self.assertEquals(cloned.when, o.when)
+        self.assertEquals(cloned.api_data, o.api_data)
+        self.assertEquals(cloned.__dict__, {})
+
+        o = Compact(name='Pebbles')
+        self.assertEquals(o.name, 'Pebbles')
+        o.update_from_dict({'name': 'Bamm-Bamm'})
+        self.assertEquals(o.name, 'Bamm-Bamm')
+
+    def test_content_hashing(self):
+
+        class Tag(self.cls):
+            content_hashing = True
+            name = fields.Field()
+            when = fields.Datetime()
+
+        a = Tag.from_dict({'name': 'ball', 'when': '2008-12-31T04:00:01Z'})
+        b = Tag.from_dict({'when': '2008-12-31T04:00:01Z', 'name': 'ball'})
+        c = Tag.from_dict({'name': 'car'})
+        self.assertEquals(a.content_digest(), b.content_digest())
+        self.assertEquals(a, b)
+        self.assertNotEquals(a, c)
+        self.assertEquals(len(set([a, b, c])), 2)
+        self.assert_('when' not in a.__dict__, 'comparing decoded no fields')
+
+        digest = a.content_digest()
+        self.assert_(a._digest is digest)
+        a.when = datetime(2009, 1, 1)
+        self.assertNotEquals(a.content_digest(), digest)
+        self.assertNotEquals(a, b)
+        a.when = datetime(2008, 12, 31, 4, 0, 1)
+        self.assertEquals(a.content_digest(), digest)
+
+        a.update_from_dict({'name': 'car'})
+        self.assertEquals(a, c)
+
+        class CompactTag(Tag):
+            when = fields.Datetime(compact=True)
+
+        a = CompactTag.from_dict({'name': 'ball', 'when': '2008-12-31T04:00:01Z'})
+        b = CompactTag.from_dict({'name': 'ball', 'when': '2008-12-31T04:00:01Z'})
+        self.assertEquals(a.when, datetime(2008, 12, 31, 4, 0, 1))
+        b.when = datetime(2008, 12, 31, 4, 0, 1)
+        self.assertEquals(a.content_digest(), b.content_digest())
+        self.assertEquals(a, b)
+        self.assertEquals(len(set([a, b])), 1)
+
+    def test_content_hashing_defaults(self):
+
+        class Tagged(self.cls):
+            content_hashing = True
+            name  = fields.Field()
+            count = fields.Field(default=lambda obj: 0)
+            tags  = fields.List(fields.Field())
+
+        a = Tagged.from_dict({'name': 'n'})
+        b = Tagged.from_dict({'name': 'n'})
+        self.assertEquals(a.tags, [])
+        self.assertEquals(a.count, 0)
+        self.assertEquals(a.content_digest(), b.content_digest())
+        self.assertEquals(a, b)
+        self.assertEquals(hash(a), hash(b))
+
+        a.tags = ['x']
+        self.assertNotEquals(a, b)
+
+    def test_merge_from_dict(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+            toys = fields.List(fields.Field())
+
+        class Parent(self.cls):
+            name  = fields.Field()
+            when  = fields.Datetime()
+            kid   = fields.Object(Kid)
+            kids  = fields.List(fields.Object(Kid))
+            other = fields.Field()
+
+        data = {
+            'name': 'Fred', 'when': '2008-12-31T04:00:01Z', 'other': 1,
+            'kid': {'name': 'Ted', 'toys': ['ball']},
+            'kids': [{'name': 'Ed', 'toys': []}, {'name': 'Ned', 'toys': []}],
+        }
+        obj = Parent.from_dict(deepcopy(data))
+        when, kid, kids, ned = obj.when, obj.kid, obj.kids, obj.kids[1]
+        toys, other = kid.toys, obj.other
+
+        data['name'] = 'Frederick'
+        data['kid']['name'] = 'Theodore'
+        data['kids'][1]['toys'] = ['kite']
+        del data['other']
+        obj.merge_from_dict(deepcopy(data))
+        self.assertEquals(obj.name, 'Frederick')
+        self.assert_(obj.when is when, 'unchanged value was kept')
+        self.assert_(obj.kid is kid, 'changed nested object was merged')
+        self.assertEquals(kid.name, 'Theodore')
+        self.assert_(kid.toys is toys)
+        self.assert_(obj.kids is kids and obj.kids[1] is ned)
+        self.assertEquals(ned.toys, ['kite'])
+        self.assertEquals(obj.other, None)
+        self.assertEquals(obj.to_dict(), data)
+
+        # Values set since they were decoded give way to the new data.
+        obj.name = 'Fritz'
+        kid.name = 'Teddy'
+        obj.merge_from_dict(deepcopy(data))
+        self.assertEquals(obj.name, 'Frederick')
+        self.assert_(obj.kid is kid)
+        self.assertEquals(kid.name, 'Theodore')
+
+        obj.merge_from_dict({'kids': [{'name': 'Ed'}], 'other': 2}, partial=True)
+        self.assertEquals(obj.name, 'Frederick')
+        self.assert_(obj.kid is kid)
+        self.assert_(obj.kids is not kids, 'list of another length was replaced')
+        self.assertEquals([k.name for k in obj.kids], ['Ed'])
+        self.assertEquals(obj.other, 2)
+        self.assertEquals(obj.api_data['when'], '2008-12-31T04:00:01Z')
+
+        self.assertRaises(TypeError, obj.merge_from_dict, ['name'])
+
+        class Member(self.cls):
+            identity_key = 'id'
+            id   = fields.Field()
+            name = fields.Field()
+
+        class Team(self.cls):
+            lead   = fields.Object(Member)
+            deputy = fields.Object(Member)
+
+        team = Team.from_dict({'lead': {'id': 1, 'name': 'Al'},
+                               'deputy': {'id': 1, 'name': 'Al'}})
+        lead = team.lead
+        self.assert_(team.deputy is lead)
+        team.merge_from_dict({'lead': {'id': 1, 'name': 'Alan'},
+                              'deputy': {'id': 1, 'name': 'Al'}})
+        self.assertEquals(team.lead.name, 'Alan')
+        self.assert_(team.lead is not lead, 'shared object was replaced')
+        self.assertEquals(lead.name, 'Al')
+        self.assert_(team.deputy is lead)
+
+    def test_freeze(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+
+        class Parent(self.cls):
+            name  = fields.Field()
+            when  = fields.Datetime()
+            kid   = fields.Object(Kid)
+            kids  = fields.List(fields.Object(Kid))
+            lazy  = fields.List(fields.Field(), lazy=True)
+            pets  = fields.Dict(fields.Field())
+
+        data = {
+            'name': 'Fred', 'when': '2008-12-31T04:00:01Z', 'extra': [1],
+            'kid': {'name': 'Ted'}, 'kids': [{'name': 'Ed'}],
+            'lazy': [1, 2], 'pets': {'dog': 'Rex'},
+        }
+        obj = Parent.from_dict(deepcopy(data))
+        frozen = obj.freeze()
+        self.assert_(frozen is not obj)
+        self.assert_(frozen.freeze() is frozen)
+        self.assertEquals(frozen.api_data, {'extra': [1]})
+        self.assertEquals(frozen.__dict__['when'], datetime(2008, 12, 31, 4, 0, 1))
+        self.assertEquals(frozen.kids[0].name, 'Ed')
+        self.assert_(isinstance(frozen.kids, tuple))
+        self.assertEquals(frozen.lazy, (1, 2))
+        self.assert_(frozen.kid._frozen)
+        self.assertEquals(frozen.to_dict(), data)
+        self.assertEquals(hash(frozen), hash(obj.freeze()))
+        self.assertEquals(frozen, obj.freeze())
+        self.assertEquals(frozen, obj)
+        self.assertEquals(obj, frozen)
+        obj.lazy.append(3)
+        self.assertNotEquals(frozen, obj)
+
+        def set_name():
+            frozen.name = 'Ted'
+        def del_name():
+            del frozen.kid.name
+        def set_pet():
+            frozen.pets['cat'] = 'Tom'
+        self.assertRaises(dataobject.FrozenError, set_name)
+        self.assertRaises(dataobject.FrozenError, del_name)
+        self.assertRaises(TypeError, set_pet)
+        self.assertRaises(TypeError, frozen.api_data.__setitem__, 'extra', [])
+        self.assertRaises(TypeError, frozen.api_data['extra'].append, 2)
+        self.assertRaises(dataobject.FrozenError, frozen.update_from_dict, {})
+        self.assertRaises(dataobject.FrozenError, frozen.merge_from_dict, {})
+
+        copied = deepcopy(frozen)
+        self.assert_(copied._frozen, "copies of frozen instances are frozen")
+        self.assertEquals(copied, frozen)
+        self.assertEquals(hash(copied), hash(frozen))
+        self.assertRaises(dataobject.FrozenError, copied.update_from_dict, {})
+
+        thawed = frozen.thaw()
+        self.assert_(not thawed._frozen)
+        thawed.name = 'Ted'
+        thawed.kids.append(Kid(name='Ned'))
+        self.assertEquals([k.name for k in thawed.kids], ['Ed', 'Ned'])
+        self.assertEquals(frozen.name, 'Fred')
+        self.assertEquals(thawed.api_data['extra'], [1])
+        thawed.api_data['extra'].append(2)
+        self.assertEquals(frozen.api_data['extra'], [1])
+
+    def test_snapshot(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+
+        class Parent(self.cls):
+            name  = fields.Field()
+            age   = fields.Field(default=7)
+            when  = fields.Datetime()
+            kid   = fields.Object(Kid)
+            kids  = fields.List(fields.Object(Kid))
+
+        data = {
+            'name': 'Fred', 'when': '2008-12-31T04:00:01Z',
+            'kid': {'name': 'Ted'}, 'kids': [{'name': 'Ed'}],
+        }
+        obj = Parent.from_dict(deepcopy(data))
+        obj.kid
+        api_data = obj.api_data
+        snap = obj.snapshot()
+        self.assertEquals(obj.diff(snap), [])
+        self.assert_(obj.api_data is api_data)
+
+        obj.name = 'Ned'
+        obj.age = 8
+        del obj.when
+        obj.kid = Kid(name='Ted')
+        self.assertEquals(obj.diff(snap), ['age', 'name', 'when'])
+        self.assertEquals(api_data, data)
+
+        later = obj.snapshot()
+        obj.update_from_dict({'name': 'Ned', 'kids': []})
+        self.assertEquals(obj.diff(later), ['age', 'kid', 'kids'])
+        self.assertEquals(obj.diff(snap), ['kid', 'kids', 'name', 'when'])
+
+        obj.restore(later)
+        self.assertEquals(obj.name, 'Ned')
+        self.assertEquals(obj.kids[0].name, 'Ed')
+        self.assertRaises(ValueError, obj.diff, later.__class__(later.journal, 9))
+
+        obj.restore(snap)
+        self.assertEquals(obj.diff(snap), [])
+        self.assertEquals(obj.name, 'Fred')
+        self.assertEquals(obj.age, 7)
+        self.assertEquals(obj.when, datetime(2008, 12, 31, 4, 0, 1))
+        self.assertEquals(obj.to_dict(), dict(data, age=7))
+        self.assertRaises(ValueError, obj.restore, later)
+
+        # Merging doesn't change nested objects the snapshot holds.
+        kid = obj.kid
+        snap = obj.snapshot()
+        obj.merge_from_dict(dict(data, kid={'name': 'Ed'}))
+        self.assertEquals(kid.name, 'Ted')
+        self.assertEquals(obj.diff(snap), ['kid'])
+
+        obj.release_snapshots()
+        self.assertRaises(ValueError, obj.restore, snap)
+
+        # Decoding after a snapshot doesn't release the data it refers to.
+        class Person(self.cls):
+            release_api_data = True
+            name = fields.Field()
+            age  = fields.Field()
+
+        obj = Person.from_dict({'name': 'Fred', 'age': 7})
+        snap = obj.snapshot()
+        self.assertEquals(obj.name, 'Fred')
+        self.assert_('name' not in obj.api_data)
+        obj.update_from_dict({'name': 'Ted', 'age': 8})
+        self.assertEquals(obj.diff(snap), ['age', 'name'])
+        obj.restore(snap)
+        self.assertEquals(obj.name, 'Fred')
+        self.assertEquals(obj.age, 7)
+
+        # Compact Datetime values compare as decoded.
+        class Event(self.cls):
+            name = fields.Field()
+            when = fields.Datetime(compact=True)
+
+        data = {'name': 'launch', 'when': '2010-05-17T20:00:00Z'}
+        obj = Event.from_dict(dict(data))
+        self.assertEquals(obj.when, datetime(2010, 5, 17, 20, 0, 0))
+        snap = obj.snapshot()
+        obj.update_from_dict(dict(data))
+        self.assertEquals(obj.diff(snap), [])
+        obj.when
+        obj.update_from_dict(dict(data, when='2010-05-18T09:30:00Z'))
+        self.assertEquals(obj.diff(snap), ['when'])
+        obj.restore(snap)
+        self.assertEquals(obj.when, datetime(2010, 5, 17, 20, 0, 0))
+
+    def test_release_api_data(self):
+
+        class Node(self.cls):
+            release_api_data = True
+            name = fields.Field()
+            when = fields.Datetime()
+            kids = fields.List(fields.Object('Node'))
+
+        data = {
+            'name': 'Fred',
+            'when': '2008-12-31T04:00:01Z',
+            'kids': [{'name': 'Pebbles', 'kids': [], 'mood': 'happy'}],
+            'unknown': {'x': 1},
+        }
+        n = Node.from_dict(deepcopy(data))
+        self.assertEquals(n.name, 'Fred')
+        self.assert_('name' not in n.api_data, 'decoded data was released')
+        self.assert_('kids' in n.api_data)
+
+        self.assert_(n.decode_fields(deep=True) is n)
+        self.assertEquals(n.api_data, {'unknown': {'x': 1}})
+        self.assertEquals(n.kids[0].api_data, {'mood': 'happy'})
+        self.assertEquals(n.kids[0].name, 'Pebbles')
+        self.assertEquals(n.to_dict(), data)
+
+        n = Node.from_dict({'name': None})
+        self.assert_(n.name is None)
+        self.assertEquals(n.to_dict(), {'name': None, 'kids': []})
+
+        # The given data is left intact for other objects.
+        given = deepcopy(data)
+        Node.from_dict(given).decode_fields(deep=True)
+        self.assertEquals(given, data)
+        self.assertEquals(Node.from_dict(given).to_dict(), data)
+
+        # Released values survive merging and restoring snapshots.
+        n = Node.from_dict(deepcopy(data))
+        n.decode_fields(deep=True)
+        n.merge_from_dict(deepcopy(data))
+        self.assertEquals(n.to_dict(), data)
+        n.merge_from_dict({'name': 'Wilma'}, partial=True)
+        self.assertEquals(n.name, 'Wilma')
+        self.assertEquals(n.kids[0].name, 'Pebbles')
+
+        n = Node.from_dict(deepcopy(data))
+        snap = n.snapshot()
+        self.assertEquals(n.name, 'Fred')
+        n.name = 'Barney'
+        n.update_from_dict({'name': 'Wilma'})
+        self.assertEquals(n.diff(snap), ['kids', 'name', 'when'])
+        n.restore(snap)
+        self.assertEquals(n.to_dict(), data)
+
+    def test_field_datetime_cached(self):
+
+        class Timely(dataobject.DataObject):
+            when    = fields.Datetime()
+            compact = fields.Datetime(compact=True)
+            other   = fields.Datetime(dateformat='%d %b %Y %H:%M')
+
+        class Timeline(dataobject.DataObject):
+            entries = fields.List(fields.Object(Timely))
+
+        stamp = '2008-12-31T04:00:01Z'
+        when = datetime(2008, 12, 31, 4, 0, 1)
+        line = Timeline.from_dict({'entries': [
+            {'when': stamp, 'compact': stamp, 'other': '31 Dec 2008 04:00'},
+            {'when': stamp, 'compact': '1969-12-31T23:59:59Z'},
+        ]})
+        first, second = line.entries
+        self.assertEquals(first.when, when)
+        self.assert_(first.when is second.when, 'repeated timestamps were decoded once')
+        self.assertEquals(first.other, datetime(2008, 12, 31, 4, 0))
+
+        self.assertEquals(first.compact, when)
+        self.assertEquals(first.__dict__['compact'], 1230696001)
+        self.assertEquals(first.compact, when)
+        self.assertEquals(second.compact, datetime(1969, 12, 31, 23, 59, 59))
+        self.assertEquals(first.to_dict()['compact'], stamp)
+
+        self.assertRaises(TypeError, lambda: Timely.from_dict({'when': '2008-13-01T00:00:00Z'}).when)
+        self.assertRaises(TypeError, lambda: Timely.from_dict({'when': ['x']}).when)
+        self.assertRaises(TypeError, lambda: Timely.from_dict({'when': 7}).when)
+
+    def test_field_array_list(self):
+
+        class Series(dataobject.DataObject):
+            counts  = fields.IntList()
+            scores  = fields.FloatList()
+            singles = fields.FloatList(typecode='f')
+
+        s = Series.from_dict({'counts': [1, 2, 3], 'scores': [0.5, 1, 2.25],
+            'singles': [0.5]})
+        self.assertEquals(s.counts, array('l', [1, 2, 3]))
+        self.assertEquals(s.scores, array('d', [0.5, 1.0, 2.25]))
+        self.assertEquals(s.singles.typecode, 'f')
+        self.assertEquals(s.to_dict(), {'counts': [1, 2, 3],
+            'scores': [0.5, 1.0, 2.25], 'singles': [0.5]})
+
+        s.counts = [4, 5]
+        self.assertEquals(s.to_dict()['counts'], [4, 5])
+
+        self.assertRaises(TypeError, lambda: Series.from_dict({'counts': [1.5]}).counts)
+        self.assertRaises(TypeError, lambda: Series.from_dict({'counts': [2 ** 70]}).counts)
+        self.assertRaises(TypeError, lambda: Series.from_dict({'scores': ['x']}).scores)
+
+    def test_field_base64(self):
+
+        class Attachment(dataobject.DataObject):
+            data  = fields.Base64()
+            thumb = fields.Base64(urlsafe=True)
+            big   = fields.Base64(spill_size=4)
+
+        data = {'data': u'aGVsbG8=', 'thumb': '-_8=', 'big': 'c3BpbGxlZA=='}
+        a = Attachment.from_dict(data)
+        self.assertEquals(a.data, 'hello')
+        self.assert_('data' not in a.api_data, 'decoded text was released')
+        self.assertEquals(len(data), 3, 'the given data was left intact')
+        self.assert_(isinstance(a.data, fields.Blob))
+        self.assert_(a.data is a.data, 'value was decoded once')
+        self.assertEquals(memoryview(a.data).tobytes(), 'hello')
+        self.assertEquals(a.thumb, '\xfb\xff')
+        self.assertEquals(a.big[:], 'spilled')
+        self.assertEquals(len(a.big), 7)
+
+        self.assertEquals(a.to_dict(), {'data': u'aGVsbG8=', 'thumb': '-_8=',
+            'big': 'c3BpbGxlZA=='})
+
+        a.data = 'bye'
+        a.thumb = bytearray('\xfb\xef')
+        self.assertEquals(a.to_dict()['data'], 'Ynll')
+        self.assertEquals(a.to_dict()['thumb'], '--8=')
+
+        self.assertRaises(TypeError, lambda: Attachment.from_dict({'data': 'aGVsbG8'}).data)
+        self.assertRaises(TypeError, lambda: Attachment.from_dict({'data': 7}).data)
+
+    def test_references(self):
+
+        class Person(self.cls):
+            name   = fields.Field()
+            friend = fields.Object('Person', by_id=True)
+
+        class Post(self.cls):
+            title  = fields.Field()
+            author = fields.Object(Person)
+
+        class Feed(self.cls):
+            included_key = 'included'
+            posts = fields.List(fields.Object(Post))
+            lazy  = fields.List(fields.Object(Post), lazy=True)
+
+        data = {
+            'posts': [
+                {'title': 'one', 'author': {'$ref': 7}},
+                {'title': 'two', 'author': {'$ref': 7}},
+                {'title': 'three', 'author': {'$ref': 8}},
+                {'title': 'four', 'author': {'name': 'Embedded'}},
+            ],
+            'lazy': [{'title': 'five', 'author': {'$ref': 7}}],
+            'included': [
+                {'id': 7, 'name': 'Alice', 'friend': 9},
+                {'id': 9, 'name': 'Bob', 'friend': 7},
+            ],
+        }
+        feed = Feed.from_dict(data)
+        one, two, three, four = feed.posts
+        self.assertEquals(one.author.name, 'Alice')
+        self.assert_(one.author is two.author, 'references share an instance')
+        self.assert_(feed.lazy[0].author is one.author)
+        self.assertEquals(one.author.friend.name, 'Bob')
+        self.assert_(one.author.friend.friend is one.author)
+        self.assertEquals(three.author, None)
+        self.assertEquals(four.author.name, 'Embedded')
+
+        self.assertEquals(feed.to_dict()['posts'][0]['author'], {'$ref': 7})
+
+        # Without an included section, there's nothing to resolve.
+        post = Post.from_dict({'title': 'six', 'author': {'name': 'Carol'}})
+        self.assertEquals(post.author.name, 'Carol')
+        self.assertRaises(ValueError,
+            lambda: Person.from_dict({'friend': 7}).friend)
+
+        clone = deepcopy(feed)
+        self.assert_(clone.posts[0].author is clone.posts[1].author)
+        self.assert_(clone.posts[0].author is not one.author)
+        self.assertEquals(clone.to_dict()['posts'][1]['author'], {'$ref': 7})
+
+        # The index isn't copied, so references are resolved beforehand.
+        post = Feed.from_dict(data).posts[1]
+        self.assert_('_references' not in post.__getstate__())
+        self.assertEquals(deepcopy(post).author.friend.name, 'Bob')
+        self.assertEquals(deepcopy(post).to_dict()['author'], {'$ref': 7})
+
+    def test_identity_key(self):
+
+        class User(self.cls):
+            identity_key = 'id'
+            id   = fields.Field()
+            name = fields.Field()
+
+        class Status(self.cls):
+            text = fields.Field()
+            user = fields.Object(User)
+
+        class Timeline(self.cls):
+            statuses = fields.List(fields.Object(Status))
+            pinned   = fields.Object(Status)
+
+        def timeline():
+            return Timeline.from_dict({
+                'statuses': [
+                    {'text': 'a', 'user': {'id': 1, 'name': 'Alice'}},
+                    {'text': 'b', 'user': {'id': 2, 'name': 'Bob'}},
+                    {'text': 'c', 'user': {'id': 1, 'name': 'Alice'}},
+                    {'text': 'd', 'user': {'name': 'Anonymous'}},
+                ],
+                'pinned': {'text': 'e', 'user': {'id': 1, 'name': 'Alice'}},
+            })
+
+        line = timeline()
+        a, b, c, d = line.statuses
+        self.assert_(a.user is c.user, 'same user is shared')
+        self.assert_(a.user is line.pinned.user)
+        self.assert_(a.user is not b.user)
+        self.assertEquals(d.user.name, 'Anonymous')
+        self.assertEquals(line.to_dict()['statuses'][2]['user'],
+            {'id': 1, 'name': 'Alice'})
+
+        # Separate responses have separate instances, unless in a session.
+        self.assert_(timeline().pinned.user is not line.pinned.user)
+        with dataobject.References():
+            first, second = timeline(), timeline()
+            self.assert_(first.pinned.user is second.statuses[0].user)
+        self.assertEquals(fields.current_references(), None)
+
 
 if __name__ == '__main__':
     utils.log()
@@ -34,7 +34,7 @@ import unittest
 
 import mox
 
-from remoteobjects import fields, http
+from remoteobjects import dataobject, fields, http
 from tests import test_dataobject
 from tests import utils
 
@@ -86,6 +86,110 @@ class TestHttpObjects(unittest.TestCase):
         self.assertEquals(b.value, u"image by \ufffdrew Example")
         mox.Verify(h)
 
+    def test_get_lazy_document(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+
+        class BasicMost(self.cls):
+            lazy_documents = True
+            name  = fields.Field()
+            kids  = fields.List(fields.Object(Kid))
+
+        request = {
+            'uri': 'http://example.com/ohhai',
+            'headers': {'accept': 'application/json'},
+        }
+        content = """{"name": "Fred", "kids": [{"name": "Wilma"}], "secret": {"code": 7}}"""
+
+        h = utils.mock_http(request, content)
+        b = BasicMost.get('http://example.com/ohhai', http=h)
+        self.assertEquals(b.name, 'Fred')
+        mox.Verify(h)
+
+        self.assertEquals(sorted(b.api_data.undecoded()), ['kids', 'secret'],
+            'only the used value was decoded')
+        self.assertEquals(b.kids[0].name, 'Wilma')
+        self.assertEquals(b.to_dict(), {
+            'name': 'Fred',
+            'kids': [{'name': 'Wilma'}],
+            'secret': {'code': 7},
+        })
+        self.assertEquals(b.api_data.undecoded(), ['secret'],
+            'to_dict() left the unused value undecoded')
+
+    def test_update_query(self):
+        url = 'http://example.com/foo?fields=a&fields=b&limit=5'
+        self.assertEquals(http.update_query(url, {'offset': 7}),
+            'http://example.com/foo?fields=a&fields=b&limit=5&offset=7')
+        self.assertEquals(http.update_query(url, {'limit': 10}),
+            'http://example.com/foo?fields=a&fields=b&limit=10')
+        self.assertEquals(http.update_query(url, {'fields': ['c', 'd']}),
+            'http://example.com/foo?limit=5&fields=c&fields=d')
+
+    def test_get_only(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+            age  = fields.Field()
+
+        class BasicMost(self.cls):
+            name  = fields.Field()
+            value = fields.Field()
+            kids  = fields.List(fields.Object(Kid))
+
+        request = {
+            'uri': 'http://example.com/ohhai',
+            'headers': {'accept': 'application/json'},
+        }
+        content = """{"name": "Fred", "value": 7, "kids": [{"name": "Wilma", "age": 3}], "x": 1}"""
+
+        h = utils.mock_http(request, content)
+        b = BasicMost.get('http://example.com/ohhai', http=h, only=['name', 'kids.name'])
+        self.assertEquals(b.name, 'Fred')
+        mox.Verify(h)
+
+        self.assertEquals(sorted(b.api_data.keys()), ['kids', 'name'])
+        self.assertRaises(dataobject.ProjectionError, lambda: b.value)
+        self.assertEquals(b.kids[0].name, 'Wilma')
+        self.assertRaises(dataobject.ProjectionError, lambda: b.kids[0].age)
+
+    def test_get_partial_response(self):
+
+        class Kid(self.cls):
+            name = fields.Field()
+            age  = fields.Field()
+            kid  = fields.Object('Kid')
+
+        class BasicMost(self.cls):
+            partial_response_param = 'fields'
+            name  = fields.Field()
+            value = fields.Field(api_name='val')
+            kids  = fields.List(fields.Object(Kid))
+
+        self.assertEquals(BasicMost.partial_response_value(),
+            'kids/age,kids/kid,kids/name,name,val')
+        BasicMost.partial_response_separator = None
+        self.assertEquals(BasicMost.partial_response_value(),
+            'kids(age,kid,name),name,val')
+        self.assertEquals(BasicMost.partial_response_value(
+            dataobject.parse_projection(['name', 'kids.name'])),
+            'kids(name),name')
+
+        request = {
+            'uri': 'http://example.com/ohhai?fields=kids%28age%2Ckid%2Cname%29%2Cname%2Cval',
+            'headers': {'accept': 'application/json'},
+        }
+        content = """{"name": "Fred", "val": 7}"""
+        h = utils.mock_http(request, content)
+        b = BasicMost.get('http://example.com/ohhai', http=h)
+        self.assertEquals(b.value, 7)
+        mox.Verify(h)
+        self.assertEquals(b._location, 'http://example.com/ohhai',
+            'the partial response parameter was left out of the location')
+        self.assertEquals(b.get_request(method='PUT')['uri'],
+            'http://example.com/ohhai')
+
     def test_post(self):
 
         class BasicMost(self.cls):
@@ -155,6 +259,43 @@ class TestHttpObjects(unittest.TestCase):
 
         self.assertEquals(b._etag, 'xyz')
 
+    def test_put_merge_updates(self):
+
+        class Owner(self.cls):
+            name = fields.Field()
+
+        class BasicMost(self.cls):
+            merge_updates = True
+            name  = fields.Field()
+            owner = fields.Object(Owner)
+
+        request = {
+            'uri': 'http://example.com/bwuh',
+            'headers': {'accept': 'application/json'},
+        }
+        content = """{"name": "Molly", "owner": {"name": "Fred"}}"""
+        h = utils.mock_http(request, content)
+        b = BasicMost.get('http://example.com/bwuh', http=h)
+        owner = b.owner
+        self.assertEquals(owner.name, 'Fred')
+        mox.Verify(h)
+
+        b.name = 'Polly'
+        headers = {
+            'accept':       'application/json',
+            'content-type': 'application/json',
+            'if-match':     '7',  # default etag
+        }
+        body = """{"owner": {"name": "Fred"}, "name": "Polly"}"""
+        request  = dict(uri='http://example.com/bwuh', method='PUT', headers=headers, body=body)
+        response = dict(content=body, etag='xyz')
+        h = utils.mock_http(request, response)
+        b.put(http=h)
+        mox.Verify(h)
+
+        self.assert_(b.owner is owner, 'unchanged object was kept')
+        self.assertEquals(b.name, 'Polly')
+
     def test_put_failure(self):
 
         class BasicMost(self.cls):
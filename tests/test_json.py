@@ -0,0 +1,105 @@
+# Copyright (c) 2009-2010 Six Apart Ltd.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of Six Apart Ltd. nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from copy import deepcopy
+import unittest
+
+from remoteobjects import json
+from tests import utils
+
+
+class TestLazyDocuments(unittest.TestCase):
+
+    def test_skip_value(self):
+        s = '''{"a": "x\\"}y", "b": [1, {"c": "]"}], "d": 1.5e3, "e": null}'''
+        self.assertEquals(json.skip_value(s, 0), len(s))
+        self.assertEquals(json.skip_value(s, 6), 13)
+        self.assertEquals(json.skip_value('  true, ', 0), 6)
+        self.assertRaises(json.IncompleteJSONError, lambda: json.skip_value('[1, {"a": 2}', 0))
+        self.assertRaises(json.IncompleteJSONError, lambda: json.skip_value('"abc', 0))
+        self.assertRaises(ValueError, lambda: json.skip_value(',', 0))
+
+    def test_index_object(self):
+        s = '''{"a": "x", "b\\u00e9": [1, 2], "c": {"d": {}} }'''
+        index, end = json.index_object(s)
+        self.assertEquals(end, len(s))
+        self.assertEquals(sorted(index.keys()), [u'a', u'b\xe9', u'c'])
+        start, end = index[u'c']
+        self.assertEquals(s[start:end], '{"d": {}}')
+
+        self.assertEquals(json.index_object(' {} '), ({}, 4))
+        self.assertRaises(ValueError, lambda: json.index_object('[]'))
+        self.assertRaises(ValueError, lambda: json.index_object('{"a" 1}'))
+        self.assertRaises(ValueError, lambda: json.index_object('{"a": 1 "b": 2}'))
+
+    def test_lazy_document(self):
+        content = '''{"name": "Fred", "kids": [{"name": "Wilma"}], "blob": "aGk="}'''
+        doc = json.loads_lazy(content)
+        self.assert_(isinstance(doc, json.LazyDocument))
+        self.assertEquals(len(doc), 3)
+        self.assertEquals(sorted(doc), ['blob', 'kids', 'name'])
+        self.assert_('kids' in doc)
+        self.assert_('nope' not in doc)
+        self.assertRaises(KeyError, lambda: doc['nope'])
+
+        self.assertEquals(str(doc.source('blob')), '"aGk="')
+        self.assertEquals(doc['kids'], [{'name': 'Wilma'}])
+        self.assert_(doc['kids'] is doc['kids'], 'decoded value was kept')
+        self.assertRaises(KeyError, lambda: doc.source('kids'))
+        self.assertEquals(sorted(doc.undecoded()), ['blob', 'name'])
+
+        copied = deepcopy(doc)
+        self.assert_(isinstance(copied, dict))
+        self.assertEquals(copied, {'name': 'Fred', 'kids': [{'name': 'Wilma'}], 'blob': 'aGk='})
+        self.assert_(copied['kids'] is not doc['kids'])
+        self.assertEquals(doc, copied)
+
+        doc['name'] = 'Barney'
+        del doc['blob']
+        doc['new'] = 1
+        self.assertEquals(dict(doc.iteritems()), {'name': 'Barney', 'kids': [{'name': 'Wilma'}], 'new': 1})
+        self.assertEquals(doc.undecoded(), [], 'everything was decoded')
+
+        self.assertEquals(json.loads_lazy(' [1, 2]'), [1, 2])
+        self.assertRaises(ValueError, lambda: json.loads_lazy('{"a": 1} x'))
+
+
+    def test_loads_lines(self):
+        content = ' {"a": 1} \n\n[2]\n"three"'
+        self.assertEquals(list(json.loads_lines(content.splitlines())),
+            [{'a': 1}, [2], 'three'])
+        self.assertEquals(json.decode_line('{"a": 1}  '), {'a': 1})
+        self.assertRaises(ValueError, json.decode_line, '{"a": 1} x')
+        self.assertRaises(ValueError, json.decode_line, '1 2')
+        self.assertRaises(ValueError,
+            lambda: list(json.loads_lines(['{"a": 1}', '[2]]'])))
+
+if __name__ == '__main__':
+    utils.log()
+    unittest.main()
@@ -27,12 +27,16 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+from StringIO import StringIO
+import gc
+import sys
 import unittest
+import weakref
 
 import httplib2
 import mox
 
-from remoteobjects import fields, http, promise, listobject
+from remoteobjects import fields, http, promise, listobject, dataobject
 from tests import test_dataobject, test_http
 from tests import utils
 
@@ -86,4 +90,194 @@ class TestPageObjects(unittest.TestCase):
         b = Toybox.get('http://example.com/whahay', http=h)
         self.assertEqual(b[7], 7)
 
-        mox.Verify(h)        
+        mox.Verify(h)
+
+    def test_iter_stream(self):
+
+        class Toy(http.HttpObject):
+            name = fields.Field()
+
+        requests = []
+
+        class Toybox(self.cls):
+            total = fields.Field()
+            after = fields.Field()
+            entries = fields.List(fields.Object(Toy), api_name='rows')
+
+            @classmethod
+            def open_stream(cls, request, http=None):
+                requests.append(request)
+                response = httplib2.Response({'status': 200,
+                    'content-type': 'application/json'})
+                return response, StringIO(content)
+
+        content = """{"total": 12345, "rows": [{"name": "ball"},
+            {"name": "\\"]}"}, {"name": "car"}], "after": [1, 2]}"""
+        stream = Toybox.iter_stream('http://example.com/toys', chunk_size=5)
+        self.assertEquals(requests[0]['uri'], 'http://example.com/toys')
+        self.assertEquals(stream.total, 12345)
+
+        toys = list(stream)
+        self.assertEquals([t.name for t in toys], ['ball', '"]}', 'car'])
+        toys = list(Toybox.iter_stream('http://example.com/toys', chunk_size=1))
+        self.assertEquals([t.name for t in toys], ['ball', '"]}', 'car'])
+        self.assert_(isinstance(toys[0], Toy))
+        self.assertEquals(stream.after, [1, 2])
+        self.assertEquals(stream.total, 12345)
+
+        class Toylist(listobject.ListObject):
+            entries = fields.List(fields.Object(Toy))
+
+            @classmethod
+            def open_stream(cls, request, http=None):
+                response = httplib2.Response({'status': 200,
+                    'content-type': 'application/json'})
+                return response, StringIO(content)
+
+        content = """[{"name": "ball"}, {"name": "car"}]"""
+        toys = list(Toylist.iter_stream('http://example.com/toys', chunk_size=3))
+        self.assertEquals([t.name for t in toys], ['ball', 'car'])
+
+        content = """{"total": 1, "rows": [{"name": "ball"}"""
+        stream = Toybox.iter_stream('http://example.com/toys', chunk_size=5)
+        self.assertRaises(ValueError, lambda: list(stream))
+
+        # Without an override, the request goes through the user agent.
+        class Toypage(self.cls):
+            entries = fields.List(fields.Object(Toy))
+
+        url = 'http://example.com/toys'
+        h = utils.mock_http(dict(uri=url, headers={'accept': 'application/json'}),
+            """{"entries": [{"name": "ball"}, {"name": "car"}]}""")
+        stream = Toypage.iter_stream(url, http=h, chunk_size=4)
+        self.assertEquals([t.name for t in stream], ['ball', 'car'])
+        mox.Verify(h)
+
+    def test_ndjson(self):
+
+        class Toy(http.HttpObject):
+            name = fields.Field()
+
+        class Toylist(listobject.ListObject):
+            entries = fields.List(fields.Object(Toy))
+
+        url = 'http://example.com/toys'
+        headers = {'accept': 'application/json, application/x-ndjson'}
+        content = """{"name": "ball"}\n\n{"name": "car"}\n"""
+        h = utils.mock_http(dict(uri=url, headers=headers),
+            {'content-type': 'application/x-ndjson', 'content': content})
+        toys = Toylist.get(url, http=h)
+        self.assertEquals([t.name for t in toys], ['ball', 'car'])
+        mox.Verify(h)
+
+        request = dict(uri=url, method='POST', body=content.replace('\n\n', '\n'),
+            headers={'accept': 'application/json, application/x-ndjson',
+                     'content-type': 'application/x-ndjson'})
+        h = utils.mock_http(request, {'status': 202})
+        self.assertEquals(toys.bulk_post(toys, http=h), None)
+        mox.Verify(h)
+
+        batches = []
+
+        class Pool(object):
+            def map(self, func, items):
+                batches.append(list(items))
+                return map(func, items)
+
+        Toylist.decode_pool = Pool()
+        h = utils.mock_http(dict(uri=url, headers=headers),
+            {'content-type': 'application/x-ndjson', 'content': content})
+        toys = Toylist.get(url, http=h)
+        self.assertEquals([t.name for t in toys], ['ball', 'car'])
+        self.assertEquals(batches, [['{"name": "ball"}', '{"name": "car"}']])
+        mox.Verify(h)
+
+    def test_partial_response(self):
+
+        class Toy(http.HttpObject):
+            name  = fields.Field()
+            price = fields.Field()
+
+        class Toylist(listobject.ListObject):
+            partial_response_param = 'fields'
+            entries = fields.List(fields.Object(Toy))
+
+        self.assertEquals(Toylist.partial_response_value(), 'name,price')
+
+        class Names(listobject.ListObject):
+            partial_response_param = 'fields'
+
+        url = 'http://example.com/names'
+        self.assertEquals(Names.get(url).get_request()['uri'], url)
+
+    def test_merge_updates(self):
+
+        class Toy(http.HttpObject):
+            name = fields.Field()
+
+        class Toylist(listobject.ListObject):
+            merge_updates = True
+            entries = fields.List(fields.Object(Toy))
+
+        url = 'http://example.com/toys'
+        headers = {'accept': 'application/json, application/x-ndjson'}
+        h = utils.mock_http(dict(uri=url, headers=headers),
+            '[{"name": "ball"}, {"name": "car"}]')
+        toys = Toylist.get(url, http=h)
+        self.assertEquals([t.name for t in toys], ['ball', 'car'])
+        mox.Verify(h)
+
+        ball = toys[0]
+        toys.merge_from_dict([{'name': 'ball'}, {'name': 'kite'}])
+        self.assert_(toys[0] is ball)
+        self.assertEquals([t.name for t in toys], ['ball', 'kite'])
+
+    def test_dedup(self):
+
+        class Toy(http.HttpObject):
+            name = fields.Field()
+
+        page = listobject.PageOf(Toy).from_dict({'entries': [
+            {'name': 'ball'}, {'name': 'car'}, {'name': 'ball'}, {'name': 'car'},
+            {'name': 'kite'},
+        ]})
+        self.assertEquals(page.dedup(), 2)
+        self.assertRaises(KeyError, page.fields['entries']._stored, page)
+        self.assertEquals(len(page.api_data['entries']), 3)
+        self.assertEquals([t.name for t in page], ['ball', 'car', 'kite'])
+        self.assertEquals(page.dedup(), 0)
+        page.entries.append(Toy(name='ball'))
+        self.assertEquals(page.dedup(), 1)
+
+        page = listobject.PageObject.from_dict({'entries': [
+            'ball', {'name': 'car'}, 'ball', {'name': 'car'}]})
+        self.assertEquals(page.dedup(), 2)
+        self.assertEquals(page.entries, ['ball', {'name': 'car'}])
+
+    def test_weak_registries(self):
+        module = sys.modules['remoteobjects.listobject._pages']
+
+        def make_classes():
+
+            class Tenant(dataobject.DataObject):
+                kind = fields.Constant('tenant-only')
+                name = fields.Field()
+
+            page = listobject.PageOf(Tenant)
+            self.assert_(listobject.PageOf(Tenant) is page)
+            self.assert_(getattr(module, page.__name__) is page)
+            self.assert_(dataobject.find_by_name('Tenant') is Tenant)
+            self.assert_(dataobject.DataObject.subclass_with_constant_field(
+                'kind', 'tenant-only') is Tenant)
+            return weakref.ref(Tenant), weakref.ref(page), page.__name__
+
+        tenant, page, pagename = make_classes()
+        # The page class goes first, then the entry class it was made for.
+        gc.collect()
+        gc.collect()
+        self.assertEquals(tenant(), None)
+        self.assertEquals(page(), None)
+        self.assertRaises(KeyError, dataobject.find_by_name, 'Tenant')
+        self.assertRaises(AttributeError, getattr, module, pagename)
+        self.assertRaises(ValueError, dataobject.DataObject.subclass_with_constant_field,
+            'kind', 'tenant-only')
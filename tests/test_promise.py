@@ -27,12 +27,14 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import threading
+import time
 import unittest
 
 import httplib2
 import mox
 
-from remoteobjects import fields, http, promise
+from remoteobjects import dataobject, fields, http, promise
 from tests import test_dataobject, test_http
 from tests import utils
 
@@ -89,6 +91,9 @@ class TestPromiseObjects(unittest.TestCase):
         self.assertEquals(b._location, 'http://example.com/foo')
         self.assertEquals(x._location, 'http://example.com/foo?limit=10&offset=7')
 
+        p = Toy.get('http://example.com/foo', http=h, only=['name'])
+        self.assertEquals(p.filter(limit=10)._projection, {'name': None})
+
         y = b.filter(awesome='yes')
         self.assertEquals(y._location, 'http://example.com/foo?awesome=yes')
         y = y.filter(awesome='no')
@@ -110,6 +115,27 @@ class TestPromiseObjects(unittest.TestCase):
         self.assert_(isinstance(b, Toy))
         self.assertEquals(b._location, 'http://example.com/bwuh/toybox')
 
+    def test_freeze(self):
+
+        class Toy(self.cls):
+            names = fields.List(fields.Field())
+
+        url = 'http://example.com/whahay'
+        headers = {"accept": "application/json"}
+        request = dict(uri=url, headers=headers)
+        content = """{"names": ["Mollifred"]}"""
+        h = utils.mock_http(request, content)
+
+        t = Toy.get(url, http=h)
+        frozen = t.freeze()
+        self.assert_(frozen._delivered, "frozen copy needs no delivery")
+        self.assertEquals(frozen.names, ('Mollifred',))
+        self.assertEquals(frozen.to_dict(), {'names': ['Mollifred']})
+        self.assertEquals(frozen, t.freeze())
+        self.assertEquals(hash(frozen), hash(frozen.thaw().freeze()))
+        # The promise was delivered only once.
+        mox.Verify(h)
+
     def test_set_before_delivery(self):
 
         class Toy(self.cls):
@@ -138,3 +164,95 @@ class TestPromiseObjects(unittest.TestCase):
         t.update_from_dict({"names": ["local update"]})
 
         self.assertEquals(t.foo, None)
+
+    def test_thread_safe(self):
+
+        decoded = []
+
+        class SlowField(fields.Field):
+            def decode(self, value):
+                decoded.append(value)
+                time.sleep(0.01)
+                return [value]
+
+        class Toy(self.cls):
+            thread_safe = True
+            name = SlowField()
+
+        url = 'http://example.com/whahay'
+        headers = {"accept": "application/json"}
+        request = dict(uri=url, headers=headers)
+        h = utils.mock_http(request, """{"name": "Mollifred"}""")
+
+        class SlowHttp(object):
+            def request(self, **kwargs):
+                time.sleep(0.01)
+                return h.request(**kwargs)
+
+        t = Toy.get(url, http=SlowHttp())
+        names = []
+        def read():
+            names.append(t.name)
+        threads = [threading.Thread(target=read) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Only one request was made, and all threads got the same name.
+        mox.Verify(h)
+        self.assertEquals(len(names), 20)
+        self.assert_(decoded)
+        self.assertEquals(set(decoded), set(['Mollifred']))
+        for name in names:
+            self.assert_(name is names[0])
+
+    def test_thread_safe_shared(self):
+
+        parents = []
+
+        class SlowField(fields.Field):
+            def decode(self, value):
+                time.sleep(0.05)
+                return value
+
+        class Kid(self.cls):
+            thread_safe = True
+            identity_key = 'id'
+            id    = fields.Field()
+            name  = SlowField()
+            # Reads a field of the kid's first parent.
+            label = fields.Field(default=lambda kid:
+                '%s of %s' % (kid.name, parents[0].title))
+
+        class Parent(self.cls):
+            thread_safe = True
+            title   = SlowField()
+            kid     = fields.Object(Kid)
+            summary = fields.Field(default=lambda parent:
+                '%s, %s' % (parent.kid.label, parent.title))
+
+        with dataobject.References():
+            for title in ('Fred', 'Ted'):
+                parents.append(Parent.from_dict({'title': title,
+                    'kid': {'id': 1, 'name': 'Ed'}}))
+        first, second = parents
+
+        # The second parent decodes the shared kid's label, which reads the
+        # first parent, while the first parent decodes the same label.
+        summaries = {}
+        def summarize(parent):
+            summaries[parent.title] = parent.summary
+        threads = [threading.Thread(target=summarize, args=(parent,))
+            for parent in (second, first)]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join(5)
+            self.assert_(not thread.isAlive(), 'threads deadlocked')
+
+        self.assert_(first.kid is second.kid)
+        self.assertEquals(summaries, {'Fred': 'Ed of Fred, Fred',
+                                      'Ted': 'Ed of Fred, Ted'})